@@ -0,0 +1,140 @@
+import argparse
+import sys
+from c2d import benchmark
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run micro-benchmarks of the agent.")
+    parser.add_argument(
+        "--steps",
+        dest="steps",
+        type=int,
+        default=100,
+        help="Number of timed train steps. Default is 100.",
+    )
+    parser.add_argument(
+        "--device",
+        dest="device",
+        default="/CPU:0",
+        help="Device to benchmark on. Default is /CPU:0.",
+    )
+    parser.add_argument(
+        "--batches-per-call",
+        dest="batches_per_call",
+        type=int,
+        default=4,
+        help="Stacked batches per train_many call. Default is 4.",
+    )
+    parser.add_argument(
+        "--precision",
+        dest="precision",
+        action="store_true",
+        help="Also compare reduced precision networks with float32.",
+    )
+    parser.add_argument(
+        "--handoff",
+        dest="handoff",
+        action="store_true",
+        help="Also compare copied and DLPack batch hand-off into TensorFlow.",
+    )
+    parser.add_argument(
+        "--preprocess",
+        dest="preprocess",
+        action="store_true",
+        help="Also compare fused preprocessing with cv::resize.",
+    )
+    parser.add_argument(
+        "--allocations",
+        dest="allocations",
+        action="store_true",
+        help="Also count heap allocations per environment step.",
+    )
+    parser.add_argument(
+        "--determinism",
+        dest="determinism",
+        action="store_true",
+        help="Also check that replay memories of the same seed sample identical batches.",
+    )
+    parser.add_argument(
+        "--codecs",
+        dest="codecs",
+        action="store_true",
+        help="Also compare replay frame codecs by compression ratio and add and sample latency.",
+    )
+    parser.add_argument(
+        "--corpus",
+        dest="corpus",
+        default=None,
+        help="Frames [N x 84 x 84] in a .npy file for --codecs. Default is frames recorded from breakout.",
+    )
+    parser.add_argument(
+        "--acting",
+        dest="acting",
+        action="store_true",
+        help="Also time batched action selection and count retracing over batch sizes.",
+    )
+    parser.add_argument(
+        "--stats",
+        dest="stats",
+        action="store_true",
+        help="Also measure the overhead of profiling native and Python sections.",
+    )
+    parser.add_argument(
+        "--suite",
+        dest="suite",
+        action="store_true",
+        help="Also run the replay and learner benchmarks on the synthetic game and write them to --output.",
+    )
+    parser.add_argument(
+        "--quantized",
+        dest="quantized",
+        action="store_true",
+        help="Also check greedy agreement and CPU latency of the int8 acting model against float32.",
+    )
+    parser.add_argument(
+        "--analysis",
+        dest="analysis",
+        action="store_true",
+        help="Also time loading the runs in data/ and the bootstrap of their aggregate scores.",
+    )
+    parser.add_argument(
+        "--output",
+        dest="output",
+        default="benchmarks.json",
+        help="JSON file of --suite results. Default is benchmarks.json.",
+    )
+    args = parser.parse_args()
+    # Checks of which failures set the exit status
+    failures = []
+    benchmark.bench_train(steps=args.steps, device=args.device)
+    benchmark.bench_train_many(steps=args.steps,
+                               batches_per_call=args.batches_per_call,
+                               device=args.device)
+    if args.precision:
+        benchmark.bench_precision(steps=args.steps, device=args.device)
+    if args.handoff:
+        benchmark.bench_handoff(batches=args.steps)
+    if args.preprocess:
+        benchmark.bench_preprocess()
+    if args.allocations:
+        if benchmark.bench_allocations(steps=args.steps):
+            failures.append("allocations")
+    if args.determinism:
+        if not all(benchmark.bench_determinism(batches=args.steps).values()):
+            failures.append("determinism")
+    if args.codecs:
+        benchmark.bench_codecs(corpus=args.corpus)
+    if args.acting:
+        _, traces = benchmark.bench_acting(steps=args.steps, device=args.device)
+        if traces != 1:
+            failures.append("acting traces")
+    if args.stats:
+        benchmark.bench_stats(steps=args.steps)
+    if args.suite:
+        benchmark.bench_suite(output=args.output, steps=args.steps, device=args.device)
+    if args.quantized:
+        benchmark.bench_quantized(steps=args.steps)
+    if args.analysis:
+        benchmark.bench_analysis()
+    if failures:
+        sys.exit(f"Failed checks: {', '.join(failures)}")
@@ -1,14 +1,38 @@
 import tensorflow as tf
 
 from c2d.models import DiscreteNet
+from c2d.configured.atarienv import obs_stack, obs_width
+
+# States of any batch size, such that acting graphs are traced once
+states_spec = tf.TensorSpec([None, obs_stack, obs_width, obs_width], tf.uint8)
+
+
+def make_agent(action_len, params):
+    """ Creates an agent by the hyperparameters of paramdict_single """
+    return Agent(
+        action_len,
+        gamma=params["gamma"],
+        learning_rate=[params["learning rate"], params["learning rate"]],
+        adameps=params["adam epsilon"],
+        evaleps=params["evaluation epsilon"],
+        heps=params["scaling epsilon"],
+        atoms=params["atoms"],
+        precision=params["precision"])
 
 
 class Agent(tf.Module):
     """ C2D agent class to handle action selection and learning algorithms """
-    def __init__(self, action_len, starteps, gamma, learning_rate, adameps, evaleps, heps, atoms):
+    def __init__(self,
+                 action_len,
+                 gamma,
+                 learning_rate,
+                 adameps,
+                 evaleps,
+                 heps,
+                 atoms,
+                 precision="float32"):
         super(Agent, self).__init__(name="Agent")
 
-        self.eps = tf.Variable(starteps, trainable=False, name="epsilon")
         self.h_eps = tf.constant(heps, dtype=tf.float32)
         self.evaleps = tf.constant(evaleps, dtype=tf.float32)
         self.gamma = tf.constant(gamma, dtype=tf.float32)
@@ -16,17 +40,33 @@ class Agent(tf.Module):
         self.suppsize = atoms
 
         self.opt = tf.optimizers.Adam(learning_rate=learning_rate[0], epsilon=adameps)
-        self.net = DiscreteNet(num_actions=action_len, num_atoms=self.suppsize, name="AgentNet")
+        # Gradients of float16 underflow without a (dynamic) loss scale, bfloat16 has the range of float32
+        self.loss_scaling = precision == "float16"
+        if self.loss_scaling:
+            self.opt = tf.keras.mixed_precision.LossScaleOptimizer(self.opt)
+        self.net = DiscreteNet(num_actions=action_len,
+                               num_atoms=self.suppsize,
+                               name="AgentNet",
+                               precision=precision)
 
         # Clone network for distributional DQN
-        self.tnet = DiscreteNet(num_actions=action_len, num_atoms=self.suppsize, name="TargetNet")
+        self.tnet = DiscreteNet(num_actions=action_len,
+                                num_atoms=self.suppsize,
+                                name="TargetNet",
+                                precision=precision)
 
-    @tf.function
-    def eps_greedy_action(self, states, epsval):
-        """ Selects epsilon greedy actions given current estimations and epsilon value """
-        self.eps.assign(epsval)
+        # Copy of the network evaluated while training continues
+        self.enet = DiscreteNet(num_actions=action_len,
+                                num_atoms=self.suppsize,
+                                name="EvalNet",
+                                precision=precision)
+
+    @tf.function(input_signature=[states_spec, tf.TensorSpec([None], tf.float32)])
+    def eps_greedy_action(self, states, epsilons):
+        """ Selects epsilon greedy actions given current estimations and an epsilon for every state,
+            e.g., of every environment as in Ape-X """
         dice = (tf.random.uniform([tf.shape(states)[0]], minval=0, maxval=1, dtype=tf.float32) <
-                self.eps)
+                epsilons)
         raction = tf.random.uniform(
             [tf.shape(states)[0]],
             minval=0,
@@ -36,12 +76,35 @@ class Agent(tf.Module):
         qaction = tf.argmax(self.qvalues(states), axis=-1)
         return tf.cast(tf.where(dice, raction, qaction), tf.uint8)
 
-    @tf.function
+    @tf.function(input_signature=[states_spec])
+    def eval_action(self, states):
+        """ Selects evaluation epsilon greedy actions by the evaluation network """
+        dice = (tf.random.uniform([tf.shape(states)[0]], minval=0, maxval=1, dtype=tf.float32) <
+                self.evaleps)
+        raction = tf.random.uniform(
+            [tf.shape(states)[0]],
+            minval=0,
+            maxval=self.action_len,
+            dtype=tf.int64,
+        )
+        probs, supps = self.enet(states)
+        qaction = tf.argmax(tf.einsum("ajk, ajk-> aj", probs, self.phiinv(supps)), axis=-1)
+        return tf.cast(tf.where(dice, raction, qaction), tf.uint8)
+
+    @tf.function(input_signature=[states_spec])
     def qvalues(self, states):
         """ Computes Q-values for the given states in a way that respects transformations by phi """
         probs, supps = self.net(states)
         return tf.einsum("ajk, ajk-> aj", probs, self.phiinv(supps))
 
+    def tracing_counts(self):
+        """ Number of times the acting graphs were traced, which stays 1 for any batch sizes """
+        return {
+            "eps_greedy_action": self.eps_greedy_action.experimental_get_tracing_count(),
+            "eval_action": self.eval_action.experimental_get_tracing_count(),
+            "qvalues": self.qvalues.experimental_get_tracing_count(),
+        }
+
     @tf.function
     def target_estimates(self, states):
         probs, supps = self.tnet(states, training=True)
@@ -56,8 +119,53 @@ class Agent(tf.Module):
             w2.assign(w1)
 
     @tf.function
-    def train(self, states, actions, rewards, end_states, dones):
-        """ Handles all learning, i.e., updates weights by distributional DQN with a proper Cramér loss """
+    def update_eval(self):
+        """ Copies the current network, including normalization statistics, to the evaluation network """
+        for w1, w2 in zip(self.net.variables, self.enet.variables):
+            w2.assign(w1)
+
+    @tf.function
+    def train(self, states, actions, rewards, end_states, dones, weights):
+        """ Handles all learning, i.e., updates weights by distributional DQN with a proper Cramér loss.
+            Per-sample losses are weighted by importance weights and returned as replay priorities. """
+        return self._train_step(states, actions, rewards, end_states, dones, weights)
+
+    @tf.function(jit_compile=True)
+    def train_fused(self, states, actions, rewards, end_states, dones, weights):
+        """ Same as train but XLA compiled, such that target estimation, the pushforward, the Cramér loss
+            and the Adam update are fused into one compiled computation """
+        return self._train_step(states, actions, rewards, end_states, dones, weights)
+
+    @tf.function
+    def train_many(self, states, actions, rewards, end_states, dones, weights):
+        """ Trains on K stacked batches [K x B x ...] by K consecutive updates within one graph call.
+            Returns the loss sum, atom range and maximal norm over all updates and the per-sample losses [K x B].
+            Optimizer slots must exist before the first call, see build_optimizer. """
+        return self._train_many(states, actions, rewards, end_states, dones, weights)
+
+    @tf.function(jit_compile=True)
+    def train_many_fused(self, states, actions, rewards, end_states, dones, weights):
+        """ Same as train_many but XLA compiled """
+        return self._train_many(states, actions, rewards, end_states, dones, weights)
+
+    def _train_many(self, states, actions, rewards, end_states, dones, weights):
+        num_batches = tf.shape(states)[0]
+        loss_sum = tf.constant(0.0)
+        min_atom = tf.constant(float("inf"))
+        max_atom = tf.constant(float("-inf"))
+        max_norm = tf.constant(0.0)
+        all_losses = tf.TensorArray(tf.float32, size=num_batches)
+        for k in tf.range(num_batches):
+            loss, amin, amax, norm, losses = self._train_step(states[k], actions[k], rewards[k],
+                                                              end_states[k], dones[k], weights[k])
+            loss_sum += loss
+            min_atom = tf.minimum(min_atom, amin)
+            max_atom = tf.maximum(max_atom, amax)
+            max_norm = tf.maximum(max_norm, norm)
+            all_losses = all_losses.write(k, losses)
+        return loss_sum, min_atom, max_atom, max_norm, all_losses.stack()
+
+    def _train_step(self, states, actions, rewards, end_states, dones, weights):
         # Watch trainable variables during loss computation
         with tf.GradientTape(persistent=False, watch_accessed_variables=False) as tape:
             tape.watch(self.net.trainable_variables)
@@ -91,10 +199,14 @@ class Agent(tf.Module):
             # Our loss is the Cramér distance
             losses = self.cramer_distance(target_probs, target_supps, estimated_probs,
                                           estimated_supps)
-            loss = tf.reduce_mean(losses)
+            loss = tf.reduce_mean(weights * losses)
+            scaled_loss = self.opt.get_scaled_loss(loss) if self.loss_scaling else loss
 
         # Adjust weights by gradient so as to minimize the Cramér distance
-        grads = tape.gradient(loss, self.net.trainable_variables)
+        grads = tape.gradient(scaled_loss, self.net.trainable_variables)
+        if self.loss_scaling:
+            # Steps with non-finite gradients are skipped by the optimizer, which lowers the scale
+            grads = self.opt.get_unscaled_gradients(grads)
 
         # Since the Cramér distance is sensitive to the underlying geometry,
         # we clip gradients by the global norm for stability in environments with very large returns.
@@ -106,7 +218,7 @@ class Agent(tf.Module):
         min_atom = tf.reduce_min(estimated_supps)
         max_atom = tf.reduce_max(estimated_supps)
         norm = global_norm
-        return loss, min_atom, max_atom, norm
+        return loss, min_atom, max_atom, norm, losses
 
     def phi(self, x, scale=1.99):
         """ Homeomorphism """
@@ -121,28 +233,43 @@ class Agent(tf.Module):
     @tf.function
     def cramer_distance(self, target_probs, target_supps, estimated_probs, estimated_supps):
         """ Computes the Cramér distance between two distributions mu, nu by computing the L2-norm squared of the CDF for the signed measure mu - nu """
-        batchsize = target_probs.shape[0]
-
-        # Concatenate and sort the extended support for the signed measure of each batch item
+        # Concatenate and sort the extended support for the signed measure of each batch item,
+        # gathering along the last axis per batch item, i.e., batch indices are broadcast
         z_extended = tf.concat([target_supps, estimated_supps], axis=-1)
-        suppsize_e = z_extended.shape[-1]
         idx = tf.argsort(z_extended, axis=-1)
-        batch_indices = tf.constant([[b for _ in range(suppsize_e)] for b in range(batchsize)])
-        batch_indices = tf.stack([batch_indices, idx], axis=-1)
-        z_extended = tf.gather_nd(z_extended, batch_indices)
+        z_extended = tf.gather(z_extended, idx, batch_dims=1)
 
         # Compute the relevant deltas for the integrals
         z_deltas = z_extended[:, 1:] - z_extended[:, :-1]
 
         # Compute signed probabilities given the extended support for each batch item
         signed_measure_mass = tf.concat([target_probs, -estimated_probs], axis=-1)
-        signed_measure_mass = tf.gather_nd(signed_measure_mass, batch_indices)
+        signed_measure_mass = tf.gather(signed_measure_mass, idx, batch_dims=1)
 
         # Our loss is then the L2-norm squared of the CDF
         integrands = tf.cumsum(signed_measure_mass, axis=-1)**2
         losses = tf.reduce_sum(integrands[:, :-1] * z_deltas, axis=-1)
         return losses
 
+    def build_optimizer(self):
+        """ Creates the optimizer slots by a zero update, such that a checkpoint can be restored into them """
+        zeros = [tf.zeros_like(v) for v in self.net.trainable_variables]
+        self.opt.apply_gradients(zip(zeros, self.net.trainable_variables))
+
+    def checkpoint_variables(self):
+        """ All variables of the training state, i.e., both networks and optimizer slots """
+        return self.net.variables + self.tnet.variables + self.opt.variables()
+
+    def get_state(self):
+        return [v.numpy() for v in self.checkpoint_variables()]
+
+    def set_state(self, values):
+        variables = self.checkpoint_variables()
+        if len(values) != len(variables):
+            raise ValueError(f"Checkpoint has {len(values)} variables, expected {len(variables)}.")
+        for v, value in zip(variables, values):
+            v.assign(value)
+
     def save_model(self, prefix):
         net_str = prefix + "_dnet.h5"
         self.net.save_weights(net_str)
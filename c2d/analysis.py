@@ -0,0 +1,192 @@
+import glob
+import json
+import os
+import numpy as np
+
+# Scores of random and human play, by which scores of a game are normalized
+# (Mnih et al. 2015, Badia et al. 2020)
+atari_scores = {
+    "alien": (227.8, 7127.7),
+    "amidar": (5.8, 1719.5),
+    "assault": (222.4, 742.0),
+    "asterix": (210.0, 8503.3),
+    "asteroids": (719.1, 47388.7),
+    "atlantis": (12850.0, 29028.1),
+    "bankheist": (14.2, 753.1),
+    "battlezone": (2360.0, 37187.5),
+    "beamrider": (363.9, 16926.5),
+    "berzerk": (123.7, 2630.4),
+    "bowling": (23.1, 160.7),
+    "boxing": (0.1, 12.1),
+    "breakout": (1.7, 30.5),
+    "centipede": (2090.9, 12017.0),
+    "choppercommand": (811.0, 7387.8),
+    "crazyclimber": (10780.5, 35829.4),
+    "defender": (2874.5, 18688.9),
+    "demonattack": (152.1, 1971.0),
+    "doubledunk": (-18.6, -16.4),
+    "enduro": (0.0, 860.5),
+    "fishingderby": (-91.7, -38.7),
+    "freeway": (0.0, 29.6),
+    "frostbite": (65.2, 4334.7),
+    "gopher": (257.6, 2412.5),
+    "gravitar": (173.0, 3351.4),
+    "hero": (1027.0, 30826.4),
+    "icehockey": (-11.2, 0.9),
+    "jamesbond": (29.0, 302.8),
+    "kangaroo": (52.0, 3035.0),
+    "krull": (1598.0, 2665.5),
+    "kungfumaster": (258.5, 22736.3),
+    "montezumarevenge": (0.0, 4753.3),
+    "mspacman": (307.3, 6951.6),
+    "namethisgame": (2292.3, 8049.0),
+    "phoenix": (761.4, 7242.6),
+    "pitfall": (-229.4, 6463.7),
+    "pong": (-20.7, 14.6),
+    "privateeye": (24.9, 69571.3),
+    "qbert": (163.9, 13455.0),
+    "riverraid": (1338.5, 17118.0),
+    "roadrunner": (11.5, 7845.0),
+    "robotank": (2.2, 11.9),
+    "seaquest": (68.4, 42054.7),
+    "skiing": (-17098.1, -4336.9),
+    "solaris": (1236.3, 12326.7),
+    "spaceinvaders": (148.0, 1668.7),
+    "stargunner": (664.0, 10250.0),
+    "surround": (-10.0, 6.5),
+    "tennis": (-23.8, -8.3),
+    "timepilot": (3568.0, 5229.2),
+    "tutankham": (11.4, 167.6),
+    "upndown": (533.4, 11693.2),
+    "venture": (0.0, 1187.5),
+    "videopinball": (0.0, 17667.9),
+    "wizardofwor": (563.5, 4756.5),
+    "yarsrevenge": (3092.9, 54576.9),
+    "zaxxon": (32.5, 9173.3),
+}
+
+
+def _json_runs(path):
+    # Runs of the seeds follow each other, every run starts at iteration 0. Iterations without finished
+    # episodes are missing and become NaN.
+    with open(path) as f:
+        records = json.load(f)
+    iterations = np.array([r["Iteration"] for r in records])
+    values = np.array([r["Value"] for r in records], dtype=np.float64)
+    starts = np.flatnonzero(iterations == 0)[1:]
+    runs = []
+    for its, vals in zip(np.split(iterations, starts), np.split(values, starts)):
+        run = np.full(its.max() + 1, np.nan)
+        run[its] = vals
+        runs.append(run)
+    return runs
+
+
+def _csv_run(path):
+    with open(path) as f:
+        column = f.readline().rstrip("\n").split(",").index("avg_return")
+    return np.loadtxt(path, delimiter=",", skiprows=1, usecols=column, ndmin=1)
+
+
+def _source_files(folder, source):
+    if source == "json":
+        return sorted(glob.glob(f"{folder}/*.json"))
+    if source == "supplementary":
+        return sorted(glob.glob(f"{folder}/supplementary/*_T[0-9]*.csv"))
+    raise ValueError(f"Unknown source {source}, expected 'json' or 'supplementary'.")
+
+
+def load_runs(folder="data", source="supplementary", cache=True):
+    """ Average training returns of all runs in folder as an array [games x seeds x iterations], from the
+        per-game json files or the per-seed supplementary csv files (<game>_T<seed>.csv), and the game
+        names. Runs shorter than the longest are padded by NaN, which aggregates do not skip. Loaded runs
+        are cached in a binary file of the folder, which is used while no source file changed. """
+    files = _source_files(folder, source)
+    signature = np.array([len(files), max((os.path.getmtime(f) for f in files), default=0.0)])
+    cache_path = f"{folder}/.runs_{source}.npz"
+    if cache and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if np.array_equal(cached["signature"], signature):
+                return cached["scores"], [str(game) for game in cached["games"]]
+    runs = {}
+    for path in files:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if source == "json":
+            runs[name] = _json_runs(path)
+        else:
+            game, seed = name.rsplit("_T", 1)
+            runs.setdefault(game, []).append((int(seed), _csv_run(path)))
+    games = sorted(runs)
+    if source == "supplementary":
+        runs = {game: [run for _, run in sorted(runs[game], key=lambda r: r[0])] for game in games}
+    seeds = max(len(r) for r in runs.values())
+    iterations = max(len(run) for r in runs.values() for run in r)
+    scores = np.full((len(games), seeds, iterations), np.nan)
+    for g, game in enumerate(games):
+        for s, run in enumerate(runs[game]):
+            scores[g, s, :len(run)] = run
+    if cache:
+        np.savez(cache_path, scores=scores, games=np.array(games), signature=signature)
+    return scores, games
+
+
+def human_normalized(scores, games):
+    """ Scores [games x ...] normalized such that random play scores 0 and humans score 1 """
+    random, human = np.array([atari_scores[game] for game in games]).T
+    shape = (len(games),) + (1,) * (scores.ndim - 1)
+    return (scores - random.reshape(shape)) / (human - random).reshape(shape)
+
+
+def iqm(scores, axis=0):
+    """ Interquartile mean, i.e., the mean of the middle 50% of scores along axis (as scipy's trim_mean).
+        Slices with a NaN score are NaN, like the other aggregates. """
+    missing = np.isnan(scores).any(axis=axis)
+    scores = np.sort(scores, axis=axis)
+    n = scores.shape[axis]
+    cut = int(0.25 * n)
+    # Sorting moves NaN to the end, where the trim would drop it
+    return np.where(missing, np.nan, np.take(scores, np.arange(cut, n - cut), axis=axis).mean(axis=axis))
+
+
+def aggregates(scores, gamma=1.0):
+    """ IQM, median, mean and optimality gap over the runs [games x seeds x ...] of normalized scores. The
+        median and mean are taken over per-game means, IQM and the optimality gap to gamma over all runs
+        (Agarwal et al. 2021). """
+    runs = scores.reshape((-1,) + scores.shape[2:])
+    game_means = scores.mean(axis=1)
+    return {
+        "iqm": iqm(runs, axis=0),
+        "median": np.median(game_means, axis=0),
+        "mean": game_means.mean(axis=0),
+        "optimality gap": gamma - np.mean(np.minimum(runs, gamma), axis=0),
+    }
+
+
+def stratified_bootstrap(scores, reps=2000, confidence=0.95, chunk=100, seed=0):
+    """ Confidence intervals of the aggregates of normalized scores [games x seeds x ...] by bootstrap
+        samples that draw the seeds of every game with replacement. Samples are aggregated in chunks of
+        reps, such that memory stays bounded. Returns the point estimates and (lower, upper) bounds. """
+    rng = np.random.default_rng(seed)
+    num_games, num_seeds = scores.shape[:2]
+    games = np.arange(num_games)[:, None]
+    samples = {}
+    for start in range(0, reps, chunk):
+        n = min(chunk, reps - start)
+        draws = rng.integers(0, num_seeds, size=(n, num_games, num_seeds))
+        # Resampled runs [games x seeds x n x ...], aggregated over games and seeds of every sample
+        resampled = np.moveaxis(scores[games, draws], 0, 2)
+        for name, values in aggregates(resampled).items():
+            samples.setdefault(name, []).append(values)
+    tail = 100 * (1 - confidence) / 2
+    intervals = {}
+    for name, values in samples.items():
+        values = np.concatenate(values, axis=0)
+        intervals[name] = tuple(np.percentile(values, [tail, 100 - tail], axis=0))
+    return aggregates(scores), intervals
+
+
+def performance_profile(scores, taus):
+    """ Fraction of runs [games x seeds x ...] of normalized scores above every threshold tau, as an array
+        [taus x ...] """
+    runs = scores.reshape((-1,) + scores.shape[2:])
+    return (runs[None] > np.reshape(taus, (-1,) + (1,) * runs.ndim)).mean(axis=1)
@@ -0,0 +1,477 @@
+import json
+import os
+import subprocess
+import time
+import numpy as np
+import tensorflow as tf
+from c2d import analysis
+from c2d.agent import make_agent
+from c2d.configured.hyperparameters import paramdict_single
+from c2d.configured.atarienv import ReplayMemory, VecAtariEnv, codecs, libc2d
+from c2d.profiler import Profiler, histogram_percentile
+from c2d.quantized import QuantizedActor
+
+
+def random_batch(batch_size, action_len, seed=0):
+    """ Batch (s, a, r, es, d, weights) of random content in the layout of sampled batches """
+    rng = np.random.default_rng(seed)
+    states = rng.integers(0, 256, size=(batch_size, 4, 84, 84), dtype=np.uint8)
+    end_states = rng.integers(0, 256, size=(batch_size, 4, 84, 84), dtype=np.uint8)
+    actions = rng.integers(0, action_len, size=batch_size, dtype=np.uint8)
+    rewards = rng.integers(-1, 2, size=batch_size).astype(np.float32)
+    dones = (rng.random(batch_size) < 0.05).astype(np.float32)
+    weights = np.ones(batch_size, dtype=np.float32)
+    return states, actions, rewards, end_states, dones, weights
+
+
+def time_train(train_fn, batch, steps):
+    """ Train steps per second, after one untimed call for tracing/compilation """
+    batch = [tf.constant(x) for x in batch]
+    train_fn(*batch)[0].numpy()
+    start = time.perf_counter()
+    for _ in range(steps):
+        loss = train_fn(*batch)[0]
+    loss.numpy()
+    return steps / (time.perf_counter() - start)
+
+
+def bench_train(steps=100, action_len=6, device="/CPU:0"):
+    """ Compares train steps per second of the graph train step and the XLA compiled one """
+    params = paramdict_single()
+    batch = random_batch(params["batch size"], action_len)
+    results = {}
+    with tf.device(device):
+        for name in ["train", "train_fused"]:
+            agent = make_agent(action_len, params)
+            agent.qvalues(batch[0])
+            agent.target_estimates(batch[0])
+            results[name] = time_train(getattr(agent, name), batch, steps)
+    for name, rate in results.items():
+        print(f"{name}: {rate:.1f} train steps/s ({1000 / rate:.2f} ms/step)")
+    print(f"Speedup: {results['train_fused'] / results['train']:.2f}x")
+    return results
+
+
+def bench_train_many(steps=100, batches_per_call=4, action_len=6, device="/CPU:0"):
+    """ Compares train updates per second of single batch calls and calls over K stacked batches """
+    params = paramdict_single()
+    batch = random_batch(params["batch size"], action_len)
+    stacked = [np.stack([x] * batches_per_call) for x in batch]
+    results = {}
+    with tf.device(device):
+        agent = make_agent(action_len, params)
+        agent.qvalues(batch[0])
+        agent.target_estimates(batch[0])
+        agent.build_optimizer()
+        results["train"] = time_train(agent.train, batch, steps)
+        calls = max(steps // batches_per_call, 1)
+        results["train_many"] = batches_per_call * time_train(agent.train_many, stacked, calls)
+    for name, rate in results.items():
+        print(f"{name}: {rate:.1f} train updates/s")
+    print(f"Speedup (K = {batches_per_call}): {results['train_many'] / results['train']:.2f}x")
+    return results
+
+
+def cpu_bf16_flags():
+    """ CPU flags of native bfloat16 support (AVX-512 BF16, AMX), used by oneDNN kernels of TensorFlow """
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = set(f.read().split())
+    except OSError:
+        return []
+    return sorted(flags & {"avx512_bf16", "amx_bf16", "amx_tile"})
+
+
+def peak_memory(device):
+    """ Peak allocated bytes on device, None where TensorFlow does not track it (e.g. CPU) """
+    try:
+        return tf.config.experimental.get_memory_info(device.strip("/"))["peak"]
+    except (ValueError, AttributeError):
+        return None
+
+
+def reset_peak_memory(device):
+    try:
+        tf.config.experimental.reset_memory_stats(device.strip("/"))
+    except (ValueError, AttributeError):
+        pass
+
+
+def bench_precision(steps=100, action_len=6, device="/CPU:0", precisions=("bfloat16", "float16")):
+    """ Compares reduced precision networks with float32 on the same weights by greedy action agreement and
+        Q-value error, and their train steps per second and peak device memory """
+    params = paramdict_single()
+    batch = random_batch(params["batch size"], action_len)
+    results = {}
+    print(f"CPU bfloat16 support: {', '.join(cpu_bf16_flags()) or 'none'}")
+    with tf.device(device):
+        reference = None
+        for precision in ("float32",) + tuple(precisions):
+            agent = make_agent(action_len, dict(params, precision=precision))
+            agent.qvalues(batch[0])
+            agent.target_estimates(batch[0])
+            if reference is None:
+                reference = agent
+            else:
+                agent.net.set_weights(reference.net.get_weights())
+            qvalues = agent.qvalues(batch[0]).numpy()
+            expected = reference.qvalues(batch[0]).numpy()
+            reset_peak_memory(device)
+            rate = time_train(agent.train, batch, steps)
+            results[precision] = {
+                "train steps/s": rate,
+                "peak bytes": peak_memory(device),
+                "max q error": float(np.max(np.abs(qvalues - expected)) / np.max(np.abs(expected))),
+                "greedy agreement": float(np.mean(qvalues.argmax(-1) == expected.argmax(-1))),
+            }
+    for precision, result in results.items():
+        peak = result["peak bytes"]
+        memory = "n/a" if peak is None else f"{peak / 2**20:.1f} MB"
+        print(f"{precision}: {result['train steps/s']:.1f} train steps/s, peak memory {memory}, " +
+              f"relative max Q error {result['max q error']:.2e}, " +
+              f"greedy agreement {100 * result['greedy agreement']:.1f}%")
+    return results
+
+
+def fill_memory(memory, steps, action_len=6, seed=0):
+    """ Adds steps experiences to lane 0 of a ReplayMemory, frames are random 4x4 blocks like screens """
+    rng = np.random.default_rng(seed)
+    frames = rng.integers(0, 256, size=(steps, 21, 21), dtype=np.uint8).repeat(4, axis=1).repeat(4, axis=2)
+    memory.addFrames(np.zeros(steps), rng.integers(0, action_len, size=steps),
+                     rng.integers(-1, 2, size=steps), np.zeros(steps, dtype=np.bool_), np.ones(steps),
+                     np.minimum(np.arange(1, steps + 1), 4), frames)
+
+
+def buffer_address(x):
+    """ Address of the host buffer of an array or a CPU tensor """
+    return np.asarray(x).__array_interface__["data"][0]
+
+
+def bench_handoff(batches=200, mem_size=10000, depth=4):
+    """ Compares the hand-off of sampled batches into TensorFlow by copied sampler views and by DLPack
+        tensors on the sampler buffers. Host bytes copied per train step are counted by comparing the
+        buffers of tensors with their sources. """
+    memory = ReplayMemory(mem_size, 1)
+    fill_memory(memory, mem_size)
+    sampler = memory.sampler(depth=depth)
+    native = {buffer_address(view) for views in sampler.views for view in views}
+    stacked = [np.zeros((1,) + view.shape, dtype=view.dtype) for view in sampler.views[0]]
+    results = {}
+    sampler.start()
+    with tf.device("/CPU:0"):
+        copied, elapsed = 0, 0.0
+        for _ in range(batches):
+            start = time.perf_counter()
+            for buffer, view in zip(stacked, sampler.nextBatch()):
+                buffer[0] = view
+            tensors = [tf.constant(buffer) for buffer in stacked]
+            elapsed += time.perf_counter() - start
+            copied += sum(buffer.nbytes for buffer in stacked)
+            copied += sum(t.numpy().nbytes for t, buffer in zip(tensors, stacked)
+                          if buffer_address(t) != buffer_address(buffer))
+        results["copy"] = (elapsed / batches, copied / batches)
+        copied, elapsed = 0, 0.0
+        for _ in range(batches):
+            start = time.perf_counter()
+            tensors = [
+                tf.expand_dims(tf.experimental.dlpack.from_dlpack(c), 0) for c in sampler.nextCapsules()
+            ]
+            elapsed += time.perf_counter() - start
+            copied += sum(t.numpy().nbytes for t in tensors if buffer_address(t) not in native)
+        results["dlpack"] = (elapsed / batches, copied / batches)
+        del tensors
+    sampler.stop()
+    for name, (seconds, nbytes) in results.items():
+        print(f"{name}: {1e6 * seconds:.1f} us/batch, {nbytes / 2**10:.1f} KB host copies/train step")
+    return results
+
+
+def bench_preprocess(frames=10000, height=210, width=160):
+    """ Compares preprocessing ns/frame of the fused max-pool and area downsampling kernel with std::max
+        and cv::resize, and checks that both produce identical frames """
+    identical = libc2d.checkPreprocess(height, width)
+    results = {
+        "fused": libc2d.benchPreprocess(height, width, frames, True),
+        "cv::resize": libc2d.benchPreprocess(height, width, frames, False),
+    }
+    for name, ns in results.items():
+        print(f"{name}: {ns:.0f} ns/frame")
+    print(f"Speedup: {results['cv::resize'] / results['fused']:.2f}x, identical frames: {identical}")
+    return results
+
+
+def bench_allocations(game="breakout", steps=1000, warmup=5000, num_envs=4, mem_size=2000, action_len=4):
+    """ Counts heap allocations of the library per step of a vectorized environment with a replay memory,
+        after warm-up steps that fill the memory. Needs a library built with -DC2D_COUNT_ALLOCATIONS=ON. """
+    if libc2d.allocationCount() < 0:
+        print("Allocation counting needs a library built with -DC2D_COUNT_ALLOCATIONS=ON")
+        return None
+    env = VecAtariEnv(game, num_envs, mem_size)
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, action_len, size=(warmup + steps, num_envs), dtype=np.uint8)
+    for t in range(warmup):
+        env.stepBatch(actions[t])
+    before = libc2d.allocationCount()
+    for t in range(warmup, warmup + steps):
+        env.stepBatch(actions[t])
+    allocations = libc2d.allocationCount() - before
+    print(f"Allocations: {allocations} in {steps} steps of {num_envs} environments, "
+          f"{allocations / steps:.3f}/step")
+    return allocations
+
+
+def sampled_batches(seed, batches, mem_size, priority_exponent):
+    """ Copies of batches sampled from a ReplayMemory of the seed filled by fill_memory """
+    memory = ReplayMemory(mem_size, 1, priority_exponent=priority_exponent, seed=seed)
+    fill_memory(memory, mem_size)
+    return [[np.copy(x) for x in memory.sampleBatch()] for _ in range(batches)]
+
+
+def bench_determinism(batches=20, mem_size=10000, seed=0):
+    """ Checks that replay memories of the same seed sample identical batches and memories of different
+        seeds do not, uniformly and by priority """
+    results = {}
+    for name, exponent in (("uniform", 0.0), ("prioritized", 0.6)):
+        first, second, other = (sampled_batches(s, batches, mem_size, exponent) for s in (seed, seed, seed + 1))
+        same = all(np.array_equal(x, y) for a, b in zip(first, second) for x, y in zip(a, b))
+        differs = any(not np.array_equal(a[1], c[1]) for a, c in zip(first, other))
+        results[name] = same and differs
+        print(f"{name}: identical batches for seed {seed}: {same}, different batches for seed {seed + 1}: {differs}")
+    return results
+
+
+def record_frames(game="breakout", frames=10000, num_envs=8, seed=0):
+    """ Newest frames [frames x 84 x 84] of environments stepped by random actions """
+    env = VecAtariEnv(game, num_envs, mem_size=0, seed=seed)
+    rng = np.random.default_rng(seed)
+    recorded = []
+    for _ in range(-(-frames // num_envs)):
+        states, _, _ = env.stepBatch(rng.integers(0, env.actionLength(), size=num_envs, dtype=np.uint8))
+        recorded.append(np.copy(states[:, -1]))
+    return np.concatenate(recorded)[:frames]
+
+
+def bench_codecs(corpus=None, game="breakout", frames=10000, samples=100000,
+                 configs=(("raw", 0), ("lz4", 1), ("lz4", 8), ("lz4hc", 9), ("zlib", 1), ("zlib", 6))):
+    """ Compares the compression ratio and us/frame of adds and samples of replay frame codecs at levels on
+        a frame corpus, a .npy file of frames [N x 84 x 84] or frames recorded from the game """
+    corpus = np.load(corpus) if corpus is not None else record_frames(game, frames)
+    corpus = np.ascontiguousarray(corpus, dtype=np.uint8)
+    results = {}
+    for codec, level in configs:
+        stats = np.zeros(3, dtype=np.float64)
+        libc2d.benchCodec(codecs[codec], level, corpus, len(corpus), samples, stats)
+        results[(codec, level)] = stats
+        print(f"{codec} (level {level}): ratio {stats[0]:.1f}, add {stats[1] / 1000:.2f} us/frame, " +
+              f"sample {stats[2] / 1000:.2f} us/frame")
+    return results
+
+
+def bench_acting(steps=100, action_len=6, batch_sizes=(1, 7, 32, 128), device="/CPU:0"):
+    """ Times epsilon greedy action selection with per-state epsilons for several batch sizes and checks
+        that the acting graph is traced only once """
+    results = {}
+    with tf.device(device):
+        agent = make_agent(action_len, paramdict_single())
+        for batch_size in batch_sizes:
+            states = random_batch(batch_size, action_len)[0]
+            epsilons = np.linspace(0.0, 1.0, batch_size, dtype=np.float32)
+            agent.eps_greedy_action(states, epsilons)
+            start = time.perf_counter()
+            for _ in range(steps):
+                agent.eps_greedy_action(states, epsilons).numpy()
+            results[batch_size] = (time.perf_counter() - start) / steps
+    traces = agent.tracing_counts()["eps_greedy_action"]
+    for batch_size, seconds in results.items():
+        print(f"Batch size {batch_size}: {1000 * seconds:.2f} ms/call, {1e6 * seconds / batch_size:.1f} us/state")
+    print(f"Acting graph traced {traces} time(s) for {len(batch_sizes)} batch sizes")
+    return results, traces
+
+
+def bench_stats(game="breakout", steps=1000, num_envs=4, mem_size=2000, action_len=4, iterations=1000000):
+    """ Overhead of profiling: ns per timed scope of native and Python sections, disabled and enabled, and
+        environment steps per second with native timing disabled and enabled """
+    native = {enabled: libc2d.benchStats(iterations, enabled) for enabled in (False, True)}
+    python = {}
+    for enabled in (False, True):
+        profiler = Profiler(enabled)
+        start = time.perf_counter_ns()
+        for _ in range(iterations // 10):
+            with profiler.section("bench"):
+                pass
+        python[enabled] = (time.perf_counter_ns() - start) / (iterations // 10)
+    libc2d.setStatsEnabled(False, False)
+    env = VecAtariEnv(game, num_envs, mem_size)
+    actions = np.random.default_rng(0).integers(0, action_len, size=(steps, num_envs), dtype=np.uint8)
+    rates = {}
+    for enabled in (False, True, False):
+        libc2d.setStatsEnabled(enabled, False)
+        start = time.perf_counter()
+        for t in range(steps):
+            env.stepBatch(actions[t])
+        # The last of repeated configurations is kept, the first one warms up
+        rates[enabled] = steps * num_envs / (time.perf_counter() - start)
+    libc2d.setStatsEnabled(False, False)
+    print(f"Native section: {native[False]:.1f} ns disabled, {native[True]:.1f} ns enabled")
+    print(f"Python section: {python[False]:.1f} ns disabled, {python[True]:.1f} ns enabled")
+    print(f"Environment steps: {rates[False]:.0f}/s untimed, {rates[True]:.0f}/s timed " +
+          f"({100 * (rates[False] / rates[True] - 1):.1f}% overhead)")
+    return native, python, rates
+
+
+def native_sections(reset=True):
+    """ Runs, ns/run and p50/p99 ns of the native sections since the last reset """
+    names = [libc2d.statName(i).decode() for i in range(libc2d.statsCount())]
+    counts = np.zeros(len(names), dtype=np.int64)
+    nanos = np.zeros_like(counts)
+    histograms = np.zeros((len(names), libc2d.statsBuckets()), dtype=np.int64)
+    libc2d.readStats(counts, nanos, histograms, reset)
+    return {
+        name: {"runs": int(count), "ns/run": float(ns / max(count, 1)),
+               "p50 ns": histogram_percentile(histogram, 0.5), "p99 ns": histogram_percentile(histogram, 0.99)}
+        for name, count, ns, histogram in zip(names, counts, nanos, histograms)
+    }
+
+
+def latency_percentiles(seconds):
+    return {f"p{q} us": float(1e6 * np.percentile(seconds, q)) for q in (50, 90, 99)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_replay(game="synthetic", mem_size=100000, num_envs=8, batches=1000, depth=4, seed=0):
+    """ Fills a replay memory by environments of the game and measures adds, memory per transition and
+        the latency of sampled batches, directly and by the background sampler """
+    env = VecAtariEnv(game, num_envs, mem_size, seed=seed)
+    actions = np.random.default_rng(seed).integers(0, env.actionLength(), size=(mem_size // num_envs, num_envs),
+                                                   dtype=np.uint8)
+    libc2d.setStatsEnabled(True, False)
+    native_sections()
+    start = time.perf_counter()
+    for step_actions in actions:
+        env.stepBatch(step_actions)
+    fill_time = time.perf_counter() - start
+    fill = native_sections()
+    latencies = []
+    for _ in range(batches):
+        start = time.perf_counter()
+        env.sampleBatch()
+        latencies.append(time.perf_counter() - start)
+    sample = native_sections()
+    sampler = env.sampler(depth)
+    sampler.start()
+    sampler_latencies = []
+    for _ in range(batches):
+        start = time.perf_counter()
+        sampler.nextBatch()
+        sampler_latencies.append(time.perf_counter() - start)
+    sampler.stop()
+    libc2d.setStatsEnabled(False, False)
+    results = {
+        "env steps/s": actions.size / fill_time,
+        "add transitions/s": 1e9 / fill["compression"]["ns/run"],
+        "add p99 us": fill["compression"]["p99 ns"] / 1e3,
+        "bytes/transition": env.residentBytes() / actions.size,
+        "sample batches/s": 1 / np.mean(latencies),
+        "sample": latency_percentiles(latencies),
+        "sampler": latency_percentiles(sampler_latencies),
+        "native": {"fill": fill, "sample": sample},
+    }
+    print(f"Replay ({game}): {results['env steps/s']:.0f} env steps/s, {results['add transitions/s']:.0f} adds/s, " +
+          f"{results['bytes/transition']:.0f} bytes/transition, {results['sample batches/s']:.0f} batches/s " +
+          f"(p99 {results['sample']['p99 us']:.0f} us, sampler p99 {results['sampler']['p99 us']:.0f} us)")
+    return results
+
+
+def bench_train_grid(steps=100, action_len=4, batch_sizes=(32, 64, 128), atom_counts=(32, 51), device="/CPU:0"):
+    """ Train steps per second of the graph train step over batch sizes and atom counts """
+    params = paramdict_single()
+    results = {}
+    with tf.device(device):
+        for atoms in atom_counts:
+            for batch_size in batch_sizes:
+                batch = random_batch(batch_size, action_len)
+                agent = make_agent(action_len, dict(params, atoms=atoms))
+                agent.qvalues(batch[0])
+                agent.target_estimates(batch[0])
+                rate = time_train(agent.train, batch, steps)
+                results[f"atoms {atoms}, batch {batch_size}"] = rate
+                print(f"Atoms {atoms}, batch size {batch_size}: {rate:.1f} train steps/s")
+    return results
+
+
+def bench_suite(output="benchmarks.json", steps=100, game="synthetic", device="/CPU:0"):
+    """ Replay and learner benchmarks written to a JSON file, which is diffed between commits. The
+        synthetic game needs no ROM, the library may be built without ALE. """
+    results = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "game": game,
+        "device": device,
+        "replay": bench_replay(game=game, batches=10 * steps),
+        "train steps/s": bench_train_grid(steps=steps, device=device),
+    }
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True, default=float)
+    print(f"Results written to {output}")
+    return results
+
+
+def recorded_states(game="synthetic", states=512, num_envs=8, seed=0):
+    """ Observations [N x 4 x 84 x 84] of environments of the game stepped by random actions """
+    env = VecAtariEnv(game, num_envs, mem_size=0, seed=seed)
+    rng = np.random.default_rng(seed)
+    recorded = []
+    for _ in range(states // num_envs):
+        obs, _, _ = env.stepBatch(rng.integers(0, env.actionLength(), size=num_envs, dtype=np.uint8))
+        recorded.append(np.copy(obs))
+    return np.concatenate(recorded)
+
+
+def bench_quantized(steps=100, game="synthetic", batch_sizes=(1, 8, 32)):
+    """ Converts a network to an int8 model calibrated on half of the recorded states and checks the
+        agreement of greedy actions with float32 on the other half, and compares their CPU latency per call """
+    states = recorded_states(game)
+    calibration, held_out = states[::2], states[1::2]
+    with tf.device("/CPU:0"):
+        agent = make_agent(VecAtariEnv(game, 1, mem_size=0).actionLength(), paramdict_single())
+        actor = QuantizedActor(agent)
+        actor.export(calibration)
+        agreement = actor.agreement(held_out)
+        latencies = {batch_size: actor.latency(held_out[:batch_size], steps) for batch_size in batch_sizes}
+    print(f"Greedy agreement with float32: {100 * agreement:.1f}% on {len(held_out)} states, " +
+          f"model {actor.model_bytes / 2**20:.1f} MB")
+    for batch_size, (int8, float32) in latencies.items():
+        print(f"Batch size {batch_size}: int8 {1000 * int8:.2f} ms/call, float32 {1000 * float32:.2f} ms/call " +
+              f"({float32 / int8:.2f}x)")
+    return agreement, latencies
+
+
+def bench_analysis(folder="data", reps=2000):
+    """ Times loading all runs from the source files and from the cache, and the stratified bootstrap of
+        aggregate human normalized scores over all iterations """
+    cache_path = f"{folder}/.runs_supplementary.npz"
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    start = time.perf_counter()
+    scores, games = analysis.load_runs(folder)
+    parsed = time.perf_counter() - start
+    start = time.perf_counter()
+    analysis.load_runs(folder)
+    cached = time.perf_counter() - start
+    normalized = analysis.human_normalized(scores, games)
+    start = time.perf_counter()
+    estimates, intervals = analysis.stratified_bootstrap(normalized, reps=reps)
+    bootstrap = time.perf_counter() - start
+    print(f"Runs {scores.shape} (games x seeds x iterations): {1000 * parsed:.1f} ms parsed, " +
+          f"{1000 * cached:.1f} ms cached, bootstrap ({reps} samples) {bootstrap:.2f} s")
+    for name, values in estimates.items():
+        lower, upper = intervals[name]
+        print(f"Final {name}: {values[-1]:.3f} [{lower[-1]:.3f}, {upper[-1]:.3f}]")
+    return estimates, intervals
@@ -7,9 +7,13 @@ prefetch_batch_size = 8
 obs_stack = 4
 obs_width = 84
 
+# Trace events of native sections, see stats.hpp
+trace_event = np.dtype([("stat", np.int32), ("thread", np.int32), ("start", np.int64), ("duration", np.int64)])
+
 lt = {
     "env": ctypes.c_void_p,
     "game": ctypes.c_char_p,
+    "path": ctypes.c_char_p,
     "mem size": ctypes.c_int,
     "stateBuffer": ndpointer(
         dtype=np.uint8,
@@ -45,7 +49,52 @@ lt = {
     "rgb dims": ctypes.c_int,
     "rgb": ndpointer(
         dtype=np.uint8, flags=["C", "O", "W", "A"]
-    )
+    ),
+    "vec env": ctypes.c_void_p,
+    "num envs": ctypes.c_int,
+    "num threads": ctypes.c_int,
+    "exponent": ctypes.c_float,
+    "seed": ctypes.c_uint64,
+    "codec": ctypes.c_int,
+    "memory": ctypes.c_void_p,
+    "sampler": ctypes.c_void_p,
+    "slot": ctypes.c_int,
+    "actions": ndpointer(
+        dtype=np.uint8, ndim=1, flags=["C", "A"]
+    ),
+    "stateBuffers": ndpointer(
+        dtype=np.uint8, ndim=4, flags=["C", "O", "W", "A"]
+    ),
+    "terminals": ndpointer(
+        dtype=np.bool_, ndim=1, flags=["C", "O", "W", "A"]
+    ),
+    "rewards": ndpointer(
+        dtype=np.int32, ndim=1, flags=["C", "O", "W", "A"]
+    ),
+    "episode stats": ndpointer(
+        dtype=np.int32, ndim=1, flags=["C", "O", "W", "A"]
+    ),
+    "indices": ndpointer(
+        dtype=np.int32, ndim=1, flags=["C", "A"]
+    ),
+    "priorities": ndpointer(
+        dtype=np.float32, ndim=1, flags=["C", "A"]
+    ),
+    "int array": ndpointer(
+        dtype=np.int32, ndim=1, flags=["C", "A"]
+    ),
+    "bool array": ndpointer(
+        dtype=np.bool_, ndim=1, flags=["C", "A"]
+    ),
+    "frames": ndpointer(
+        dtype=np.uint8, ndim=3, flags=["C", "A"]
+    ),
+    "stats": ndpointer(
+        dtype=np.int64, flags=["C", "W", "A"]
+    ),
+    "trace events": ndpointer(
+        dtype=trace_event, ndim=1, flags=["C", "W", "A"]
+    ),
 }
 
 libc2d = ctypes.cdll.LoadLibrary("libc2d.so")
@@ -58,6 +107,9 @@ libc2d.initEnv.argtypes = [
     lt["env"],
     lt["game"],
     lt["mem size"],
+    lt["seed"],
+    lt["codec"],
+    ctypes.c_int,
 ]
 libc2d.initEnv.restype = None
 libc2d.resetEnv.argtypes = [lt["env"]]
@@ -74,6 +126,8 @@ libc2d.episodeStepsEnv.argtypes = [lt["env"]]
 libc2d.episodeScoreEnv.restype = lt["episode score"]
 libc2d.actEnv.argtypes = [lt["env"], lt["action"], ctypes.c_bool]
 libc2d.actEnv.restype = lt["reward"]
+libc2d.actObsEnv.argtypes = [lt["env"], lt["action"], ctypes.c_bool, lt["stateBuffer"]]
+libc2d.actObsEnv.restype = lt["reward"]
 libc2d.gameOverEnv.argtypes = [lt["env"]]
 libc2d.gameOverEnv.restype = ctypes.c_bool
 libc2d.maxStepReachedEnv.argtypes = [lt["env"]]
@@ -98,14 +152,189 @@ libc2d.getRawHeightEnv.restype = lt["rgb dims"]
 libc2d.getRGBEnv.argtypes = [lt["env"], lt["rgb"]]
 libc2d.getRGBEnv.restype = None
 
+libc2d.newVecEnv.argtypes = None
+libc2d.newVecEnv.restype = lt["vec env"]
+libc2d.delVecEnv.argtypes = [lt["vec env"]]
+libc2d.delVecEnv.restype = None
+libc2d.initVecEnv.argtypes = [
+    lt["vec env"],
+    lt["game"],
+    lt["num envs"],
+    lt["mem size"],
+    lt["num threads"],
+    lt["exponent"],
+    lt["seed"],
+    lt["codec"],
+    ctypes.c_int,
+]
+libc2d.initVecEnv.restype = None
+libc2d.numEnvsVecEnv.argtypes = [lt["vec env"]]
+libc2d.numEnvsVecEnv.restype = lt["num envs"]
+libc2d.actionLengthVecEnv.argtypes = [lt["vec env"]]
+libc2d.actionLengthVecEnv.restype = lt["num actions"]
+libc2d.stepVecEnv.argtypes = [
+    lt["vec env"],
+    lt["actions"],
+    lt["stateBuffers"],
+    lt["terminals"],
+    lt["rewards"],
+    lt["episode stats"],
+    lt["episode stats"],
+]
+libc2d.stepVecEnv.restype = None
+libc2d.stepAsyncVecEnv.argtypes = libc2d.stepVecEnv.argtypes
+libc2d.stepAsyncVecEnv.restype = None
+libc2d.waitVecEnv.argtypes = [lt["vec env"]]
+libc2d.waitVecEnv.restype = None
+libc2d.getObsVecEnv.argtypes = [lt["vec env"], lt["stateBuffers"]]
+libc2d.getObsVecEnv.restype = None
+libc2d.hardResetVecEnv.argtypes = [lt["vec env"]]
+libc2d.hardResetVecEnv.restype = None
+libc2d.getMemoryVecEnv.argtypes = [lt["vec env"]]
+libc2d.getMemoryVecEnv.restype = lt["memory"]
+libc2d.residentBytesVecEnv.argtypes = [lt["vec env"]]
+libc2d.residentBytesVecEnv.restype = ctypes.c_int64
+libc2d.transitionsVecEnv.argtypes = [
+    lt["vec env"],
+    lt["actions"],
+    lt["rewards"],
+    lt["terminals"],
+    lt["terminals"],
+    lt["episode stats"],
+    lt["episode stats"],
+]
+libc2d.transitionsVecEnv.restype = None
+libc2d.saveMemoryVecEnv.argtypes = [lt["vec env"], lt["path"]]
+libc2d.saveMemoryVecEnv.restype = None
+libc2d.loadMemoryVecEnv.argtypes = [lt["vec env"], lt["path"]]
+libc2d.loadMemoryVecEnv.restype = ctypes.c_bool
+libc2d.prefetchBatchVecEnv.argtypes = [
+    lt["vec env"],
+    lt["bs"],
+    lt["ba"],
+    lt["br"],
+    lt["bes"],
+    lt["bd"],
+    lt["batch position"],
+    lt["batch count"],
+]
+libc2d.prefetchBatchVecEnv.restype = None
+
+libc2d.newMemory.argtypes = [
+    lt["mem size"], lt["num envs"], lt["exponent"], lt["seed"], lt["codec"], ctypes.c_int
+]
+libc2d.newMemory.restype = lt["memory"]
+libc2d.delMemory.argtypes = [lt["memory"]]
+libc2d.delMemory.restype = None
+libc2d.addFramesMemory.argtypes = [
+    lt["memory"],
+    lt["batch count"],
+    lt["int array"],
+    lt["actions"],
+    lt["int array"],
+    lt["bool array"],
+    lt["int array"],
+    lt["int array"],
+    lt["frames"],
+]
+libc2d.addFramesMemory.restype = None
+libc2d.sampleMemory.argtypes = [
+    lt["memory"],
+    lt["bs"],
+    lt["ba"],
+    lt["br"],
+    lt["bes"],
+    lt["bd"],
+]
+libc2d.sampleMemory.restype = None
+libc2d.residentBytesMemory.argtypes = [lt["memory"]]
+libc2d.residentBytesMemory.restype = ctypes.c_int64
+libc2d.updatePrioritiesMemory.argtypes = [
+    lt["memory"],
+    lt["indices"],
+    lt["priorities"],
+    lt["batch count"],
+]
+libc2d.updatePrioritiesMemory.restype = None
+libc2d.setImportanceExponentMemory.argtypes = [lt["memory"], lt["exponent"]]
+libc2d.setImportanceExponentMemory.restype = None
+libc2d.prioritizedMemory.argtypes = [lt["memory"]]
+libc2d.prioritizedMemory.restype = ctypes.c_bool
+libc2d.saveMemory.argtypes = [lt["memory"], lt["path"]]
+libc2d.saveMemory.restype = None
+libc2d.loadMemory.argtypes = [lt["memory"], lt["path"]]
+libc2d.loadMemory.restype = ctypes.c_bool
+
+libc2d.newSampler.argtypes = [lt["memory"], ctypes.c_int]
+libc2d.newSampler.restype = lt["sampler"]
+libc2d.delSampler.argtypes = [lt["sampler"]]
+libc2d.delSampler.restype = None
+libc2d.startSampler.argtypes = [lt["sampler"]]
+libc2d.startSampler.restype = None
+libc2d.stopSampler.argtypes = [lt["sampler"]]
+libc2d.stopSampler.restype = None
+libc2d.readySampler.argtypes = [lt["sampler"]]
+libc2d.readySampler.restype = ctypes.c_int
+libc2d.acquireSampler.argtypes = [lt["sampler"]]
+libc2d.acquireSampler.restype = lt["slot"]
+libc2d.releaseSampler.argtypes = [lt["sampler"], lt["slot"]]
+libc2d.releaseSampler.restype = None
+libc2d.bufferSampler.argtypes = [lt["sampler"], lt["slot"], ctypes.c_int]
+libc2d.bufferSampler.restype = ctypes.c_void_p
+libc2d.exportSampler.argtypes = [lt["sampler"], lt["slot"], ctypes.c_int]
+libc2d.exportSampler.restype = ctypes.c_void_p
+
+libc2d.benchPreprocess.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_bool]
+libc2d.benchPreprocess.restype = ctypes.c_double
+libc2d.checkPreprocess.argtypes = [ctypes.c_int, ctypes.c_int]
+libc2d.checkPreprocess.restype = ctypes.c_bool
+libc2d.benchCodec.argtypes = [lt["codec"], ctypes.c_int, lt["frames"], ctypes.c_int, ctypes.c_int,
+                              ndpointer(dtype=np.float64, ndim=1, flags=["C", "W", "A"])]
+libc2d.benchCodec.restype = None
+libc2d.allocationCount.argtypes = []
+libc2d.allocationCount.restype = ctypes.c_int64
+libc2d.setStatsEnabled.argtypes = [ctypes.c_bool, ctypes.c_bool]
+libc2d.setStatsEnabled.restype = None
+libc2d.statsCount.argtypes = []
+libc2d.statsCount.restype = ctypes.c_int
+libc2d.statsBuckets.argtypes = []
+libc2d.statsBuckets.restype = ctypes.c_int
+libc2d.statName.argtypes = [ctypes.c_int]
+libc2d.statName.restype = ctypes.c_char_p
+libc2d.readStats.argtypes = [lt["stats"], lt["stats"], lt["stats"], ctypes.c_bool]
+libc2d.readStats.restype = None
+libc2d.drainTraceStats.argtypes = [lt["trace events"], ctypes.c_int]
+libc2d.drainTraceStats.restype = ctypes.c_int
+libc2d.droppedTraceStats.argtypes = []
+libc2d.droppedTraceStats.restype = ctypes.c_int64
+libc2d.benchStats.argtypes = [ctypes.c_int, ctypes.c_bool]
+libc2d.benchStats.restype = ctypes.c_double
+
+
+def rom_path(game):
+    """ ROM path of an ALE game, the synthetic game is generated without ROM """
+    return game if game == "synthetic" else f"ale_roms/{game}.bin"
+
+
+# Frame codecs of replay memories, see framecodec.hpp for their levels
+codecs = {"raw": 0, "lz4": 1, "lz4hc": 2, "zlib": 3}
+
+# DLPack tensors are handed to frameworks as capsules named "dltensor". Capsules that are not consumed
+# free their tensor by the destructor of the library.
+dltensor_name = b"dltensor"
+capsule_new = ctypes.pythonapi.PyCapsule_New
+capsule_new.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_void_p]
+capsule_new.restype = ctypes.py_object
+capsule_destructor = ctypes.cast(libc2d.deleteCapsule, ctypes.c_void_p)
+
 class AtariEnv:
     def __init__(
-        self, game, mem_size,
+        self, game, mem_size, seed=0, codec="lz4", codec_level=1,
     ):
-        gamestr = f"ale_roms/{game}.bin"
+        gamestr = rom_path(game)
         self.env_p = libc2d.newEnv()
         libc2d.initEnv(
-            self.env_p, gamestr.encode("utf-8"), mem_size,
+            self.env_p, gamestr.encode("utf-8"), mem_size, seed, codecs[codec], codec_level,
         )
         self.rawWidth = libc2d.getRawWidthEnv(self.env_p)
         self.rawHeight = libc2d.getRawHeightEnv(self.env_p)
@@ -138,7 +367,6 @@ class AtariEnv:
         if batchWork:
             self._prefetch(self.batch_it)
             self.batch_it = (self.batch_it + prefetch_batch_size) % batch_size
-        self._updateObs()
         return self.stateBuffer, terminal, info
 
     def actionLength(self):
@@ -175,7 +403,8 @@ class AtariEnv:
         libc2d.getObsEnv(self.env_p, self.stateBuffer)
 
     def _act(self, action, evalmode):
-        return libc2d.actEnv(self.env_p, action, evalmode)
+        # Writes the next state into the state buffer
+        return libc2d.actObsEnv(self.env_p, action, evalmode, self.stateBuffer)
 
     def _gameOver(self):
         return libc2d.gameOverEnv(self.env_p)
@@ -197,3 +426,257 @@ class AtariEnv:
     
     def _noopStart(self):
         libc2d.noopStartEnv(self.env_p) 
+
+
+class VecAtariEnv:
+    """ N Atari environments sharing one replay memory, stepped by a single library call.
+        Library calls through ctypes.cdll release the GIL, so Python threads run during emulation,
+        and stepBatchAsync lets the calling thread itself do other work until wait().
+        A positive priority exponent makes the memory sample by priority. Environments and memory of the
+        same seed emulate and sample the same, given the same actions. Frames are compressed by a codec
+        of codecs at a level. """
+    def __init__(
+        self, game, num_envs, mem_size, num_threads=0, priority_exponent=0.0, seed=0, codec="lz4",
+        codec_level=1,
+    ):
+        gamestr = rom_path(game)
+        self.num_envs = num_envs
+        self.env_p = libc2d.newVecEnv()
+        libc2d.initVecEnv(
+            self.env_p, gamestr.encode("utf-8"), num_envs, mem_size, num_threads,
+            priority_exponent, seed, codecs[codec], codec_level,
+        )
+        self.memory_p = libc2d.getMemoryVecEnv(self.env_p)
+        self.stateBuffer = np.zeros(
+            (num_envs, obs_stack, obs_width, obs_width), dtype=np.uint8
+        )
+        self.terminals = np.zeros(num_envs, dtype=np.bool_)
+        self.rewards = np.zeros(num_envs, dtype=np.int32)
+        self.episodeSteps = np.zeros(num_envs, dtype=np.int32)
+        self.episodeScores = np.zeros(num_envs, dtype=np.int32)
+        self.bs = np.zeros(
+            (batch_size, obs_stack, obs_width, obs_width), dtype=np.uint8
+        )
+        self.ba = np.zeros(batch_size, dtype=np.uint8)
+        self.br = np.zeros(batch_size, dtype=np.float32)
+        self.bes = np.zeros(
+            (batch_size, obs_stack, obs_width, obs_width), dtype=np.uint8
+        )
+        self.bd = np.zeros(batch_size, dtype=np.float32)
+        self.tActions = np.zeros(num_envs, dtype=np.uint8)
+        self.tRewards = np.zeros(num_envs, dtype=np.int32)
+        self.tDones = np.zeros(num_envs, dtype=np.bool_)
+        self.tStored = np.zeros(num_envs, dtype=np.bool_)
+        self.tNewFrames = np.zeros(num_envs, dtype=np.int32)
+        self.tValidFrames = np.zeros(num_envs, dtype=np.int32)
+
+    def stepBatch(self, actions):
+        self.stepBatchAsync(actions)
+        return self.wait()
+
+    def stepBatchAsync(self, actions):
+        actions = np.ascontiguousarray(actions, dtype=np.uint8)
+        libc2d.stepAsyncVecEnv(
+            self.env_p,
+            actions,
+            self.stateBuffer,
+            self.terminals,
+            self.rewards,
+            self.episodeSteps,
+            self.episodeScores,
+        )
+
+    def wait(self):
+        libc2d.waitVecEnv(self.env_p)
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(self.terminals):
+            infos[i]["Episode Length"] = int(self.episodeSteps[i])
+            infos[i]["Episode Score"] = int(self.episodeScores[i])
+        return self.stateBuffer, self.terminals, infos
+
+    def actionLength(self):
+        return libc2d.actionLengthVecEnv(self.env_p)
+
+    def transitions(self):
+        """ Stored experiences of the last step, as needed by ReplayMemory.addFrames: environment indices,
+            actions, rewards, dones, new frame counts, valid frame counts and the new end state frames """
+        libc2d.transitionsVecEnv(
+            self.env_p,
+            self.tActions,
+            self.tRewards,
+            self.tDones,
+            self.tStored,
+            self.tNewFrames,
+            self.tValidFrames,
+        )
+        envs = np.flatnonzero(self.tStored)
+        new_frames = self.tNewFrames[envs]
+        frames = np.zeros((int(new_frames.sum()), obs_width, obs_width), dtype=np.uint8)
+        pos = 0
+        for i, n in zip(envs, new_frames):
+            frames[pos:pos + n] = self.stateBuffer[i, obs_stack - n:]
+            pos += n
+        return (envs, self.tActions[envs], self.tRewards[envs], self.tDones[envs], new_frames,
+                self.tValidFrames[envs], frames)
+
+    def getObs(self):
+        libc2d.getObsVecEnv(self.env_p, self.stateBuffer)
+        return self.stateBuffer
+
+    def sampleBatch(self):
+        libc2d.prefetchBatchVecEnv(
+            self.env_p,
+            self.bs,
+            self.ba,
+            self.br,
+            self.bes,
+            self.bd,
+            0,
+            batch_size,
+        )
+        return self.bs, self.ba, self.br, self.bes, self.bd
+
+    def hardReset(self):
+        libc2d.hardResetVecEnv(self.env_p)
+
+    def residentBytes(self):
+        return libc2d.residentBytesVecEnv(self.env_p)
+
+    def saveMemory(self, path):
+        libc2d.saveMemoryVecEnv(self.env_p, path.encode("utf-8"))
+
+    def loadMemory(self, path):
+        """ Restores a memory snapshot of saveMemory, returns False if there is none """
+        return libc2d.loadMemoryVecEnv(self.env_p, path.encode("utf-8"))
+
+    def prioritized(self):
+        return libc2d.prioritizedMemory(self.memory_p)
+
+    def updatePriorities(self, indices, priorities):
+        indices = np.ascontiguousarray(indices, dtype=np.int32)
+        priorities = np.ascontiguousarray(priorities, dtype=np.float32)
+        libc2d.updatePrioritiesMemory(self.memory_p, indices, priorities, len(indices))
+
+    def setImportanceExponent(self, exponent):
+        libc2d.setImportanceExponentMemory(self.memory_p, exponent)
+
+    def sampler(self, depth):
+        return BatchSampler(self, self.memory_p, depth)
+
+
+class ReplayMemory:
+    """ Replay memory of lanes written by remote actors instead of local environments """
+    def __init__(self, mem_size, num_lanes, priority_exponent=0.0, seed=0, codec="lz4", codec_level=1):
+        self.memory_p = libc2d.newMemory(mem_size, num_lanes, priority_exponent, seed, codecs[codec],
+                                         codec_level)
+        self.bs = np.zeros(
+            (batch_size, obs_stack, obs_width, obs_width), dtype=np.uint8
+        )
+        self.ba = np.zeros(batch_size, dtype=np.uint8)
+        self.br = np.zeros(batch_size, dtype=np.float32)
+        self.bes = np.zeros(
+            (batch_size, obs_stack, obs_width, obs_width), dtype=np.uint8
+        )
+        self.bd = np.zeros(batch_size, dtype=np.float32)
+
+    def addFrames(self, lanes, actions, rewards, dones, new_frames, valid_frames, frames):
+        """ Adds experiences in lane order, item i brings new_frames[i] frames of frames """
+        libc2d.addFramesMemory(
+            self.memory_p,
+            len(lanes),
+            np.ascontiguousarray(lanes, dtype=np.int32),
+            np.ascontiguousarray(actions, dtype=np.uint8),
+            np.ascontiguousarray(rewards, dtype=np.int32),
+            np.ascontiguousarray(dones, dtype=np.bool_),
+            np.ascontiguousarray(new_frames, dtype=np.int32),
+            np.ascontiguousarray(valid_frames, dtype=np.int32),
+            np.ascontiguousarray(frames, dtype=np.uint8),
+        )
+
+    def sampleBatch(self):
+        libc2d.sampleMemory(self.memory_p, self.bs, self.ba, self.br, self.bes, self.bd)
+        return self.bs, self.ba, self.br, self.bes, self.bd
+
+    def residentBytes(self):
+        return libc2d.residentBytesMemory(self.memory_p)
+
+    def saveMemory(self, path):
+        libc2d.saveMemory(self.memory_p, path.encode("utf-8"))
+
+    def loadMemory(self, path):
+        """ Restores a memory snapshot of saveMemory, returns False if there is none """
+        return libc2d.loadMemory(self.memory_p, path.encode("utf-8"))
+
+    def prioritized(self):
+        return libc2d.prioritizedMemory(self.memory_p)
+
+    def updatePriorities(self, indices, priorities):
+        indices = np.ascontiguousarray(indices, dtype=np.int32)
+        priorities = np.ascontiguousarray(priorities, dtype=np.float32)
+        libc2d.updatePrioritiesMemory(self.memory_p, indices, priorities, len(indices))
+
+    def setImportanceExponent(self, exponent):
+        libc2d.setImportanceExponentMemory(self.memory_p, exponent)
+
+    def sampler(self, depth):
+        return BatchSampler(self, self.memory_p, depth)
+
+    def __del__(self):
+        libc2d.delMemory(self.memory_p)
+
+
+class BatchSampler:
+    """ Background sampler that keeps up to depth ready batches of a replay memory in native buffers.
+        nextBatch returns zero-copy views (s, a, r, es, d, indices, weights) which stay valid
+        until the following nextBatch call. nextCapsules hands out the same items as DLPack capsules,
+        which own their buffers until the framework tensors made of them are freed. """
+    def __init__(self, owner, memory_p, depth):
+        self.owner = owner  # Keeps the memory alive
+        self.depth = depth
+        self.sampler_p = libc2d.newSampler(memory_p, depth)
+        self.views = [self._slotViews(slot) for slot in range(depth)]
+        self.slot = None
+
+    def start(self):
+        libc2d.startSampler(self.sampler_p)
+
+    def stop(self):
+        libc2d.stopSampler(self.sampler_p)
+
+    def ready(self):
+        return libc2d.readySampler(self.sampler_p)
+
+    def nextBatch(self):
+        if self.slot is not None:
+            libc2d.releaseSampler(self.sampler_p, self.slot)
+        self.slot = libc2d.acquireSampler(self.sampler_p)
+        return self.views[self.slot]
+
+    def nextCapsules(self):
+        """ Next batch as DLPack capsules, e.g. for tf.experimental.dlpack.from_dlpack. Each capsule leases
+            the batch slot, which is refilled once their tensors are freed or, for capsules that were
+            not consumed, the capsules are. Capsules and tensors must not outlive the sampler. """
+        if self.slot is not None:
+            libc2d.releaseSampler(self.sampler_p, self.slot)
+            self.slot = None
+        slot = libc2d.acquireSampler(self.sampler_p)
+        capsules = tuple(
+            capsule_new(libc2d.exportSampler(self.sampler_p, slot, item), dltensor_name, capsule_destructor)
+            for item in range(7))
+        libc2d.releaseSampler(self.sampler_p, slot)
+        return capsules
+
+    def _slotViews(self, slot):
+        state_shape = (batch_size, obs_stack, obs_width, obs_width)
+        items = [(state_shape, ctypes.c_uint8), ((batch_size,), ctypes.c_uint8),
+                 ((batch_size,), ctypes.c_float), (state_shape, ctypes.c_uint8),
+                 ((batch_size,), ctypes.c_float), ((batch_size,), ctypes.c_int32),
+                 ((batch_size,), ctypes.c_float)]
+        views = []
+        for item, (shape, ctype) in enumerate(items):
+            ptr = libc2d.bufferSampler(self.sampler_p, slot, item)
+            views.append(np.ctypeslib.as_array(ctypes.cast(ptr, ctypes.POINTER(ctype)), shape=shape))
+        return tuple(views)
+
+    def __del__(self):
+        libc2d.delSampler(self.sampler_p)
@@ -9,16 +9,38 @@ def paramdict_single():
         "learning rate": 0.5e-4,
         "adam epsilon": 0.01/32,
         "mem size": int(1e6),
+        "replay codec": 'lz4',
+        "replay codec level": 1,
         "prefill size": int(20e3),
         "max episode steps": 27000,
         "intensity": 8,
         "repeat action probability": 0.25,
         "batch size": 32,
         "batch prefetch size": 8,
+        "sampler depth": 4,
+        "priority exponent": 0.0,
+        "importance exponent": 0.4,
+        "num envs": 1,
+        "worker threads": 0,
+        "num actors": 0,
+        "actor send steps": 16,
+        "actor epsilon base": 0.4,
+        "weight broadcast period": 100,
+        "checkpoint memory": True,
+        "dataset prefetch": 0,
+        "dataset device prefetch": False,
+        "train batches per call": 1,
         "training phase steps": 250000,
         "eval phase steps": 0,
+        "eval envs": 16,
         "evaluation epsilon": 0.001,
         "scaling epsilon": 0.001,
         "atoms": 32,
+        "precision": 'float32',
+        "jit compile": False,
+        "quantized acting": False,
+        "quantized export period": 50000,
+        "profile": False,
+        "profile trace": False,
     }
     return d
@@ -0,0 +1,69 @@
+import threading
+import time
+import numpy as np
+import tensorflow as tf
+from c2d.configured.atarienv import batch_size, obs_stack, obs_width
+
+
+class BatchDataset:
+    """ tf.data pipeline over a BatchSampler, uniform or prioritized. Elements are K stacked batches
+        (s, a, r, es, d, indices, weights) [K x B x ...], prefetched on the host and optionally onto a
+        device, such that sampling, decompression and the transfer of the next element overlap with
+        training on the current one. """
+    def __init__(self, sampler, batches_per_element=1, prefetch=2, device=None):
+        self.sampler = sampler
+        self.lock = threading.Lock()
+        self.reset_stats()
+        state = tf.TensorSpec((batch_size, obs_stack, obs_width, obs_width), tf.uint8)
+        signature = (state, tf.TensorSpec((batch_size,), tf.uint8),
+                     tf.TensorSpec((batch_size,), tf.float32), state,
+                     tf.TensorSpec((batch_size,), tf.float32), tf.TensorSpec((batch_size,), tf.int32),
+                     tf.TensorSpec((batch_size,), tf.float32))
+        dataset = tf.data.Dataset.from_generator(self._generate, output_signature=signature)
+        dataset = dataset.batch(batches_per_element, drop_remainder=True).prefetch(prefetch)
+        if device is not None:
+            # Must be the last transformation
+            dataset = dataset.apply(tf.data.experimental.prefetch_to_device(device, buffer_size=1))
+        self.iterator = iter(dataset)
+
+    def __next__(self):
+        start = time.perf_counter()
+        element = next(self.iterator)
+        with self.lock:
+            self.wait_time += time.perf_counter() - start
+            self.elements += 1
+        return element
+
+    def __iter__(self):
+        return self
+
+    def reset_stats(self):
+        with self.lock:
+            self.start_time = time.perf_counter()
+            self.sampled = 0
+            self.acquire_time = 0.0
+            self.elements = 0
+            self.wait_time = 0.0
+
+    def stats(self):
+        """ Batches sampled and elements consumed per second, the time the pipeline waited per batch of the
+            native sampler and the fraction of time the consumer waited for elements since the last reset """
+        with self.lock:
+            elapsed = time.perf_counter() - self.start_time
+            return {
+                "batches/s": self.sampled / elapsed,
+                "elements/s": self.elements / elapsed,
+                "ms/acquire": 1000 * self.acquire_time / max(self.sampled, 1),
+                "wait fraction": self.wait_time / elapsed,
+            }
+
+    def _generate(self):
+        while True:
+            start = time.perf_counter()
+            batch = self.sampler.nextBatch()
+            with self.lock:
+                self.acquire_time += time.perf_counter() - start
+                self.sampled += 1
+            # Views expire with the next batch, while tensors converted from them may alias their buffers
+            # and are held by batch() for the following batches of the element
+            yield tuple(np.copy(view) for view in batch)
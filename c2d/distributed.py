@@ -0,0 +1,331 @@
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+import tensorflow as tf
+from c2d.agent import make_agent
+from c2d.profiler import Profiler
+from c2d.quantized import QuantizedActor
+from c2d.runner import Runner
+from c2d.util import (Linear, phase_formatter, loss_formatter, derive_seeds, makeRow, save_model,
+                      save_current_data, checkpoint_prefix, trace_path, Checkpointer)
+from c2d.configured.hyperparameters import paramdict_single
+from c2d.configured.atarienv import VecAtariEnv, ReplayMemory
+
+
+class WeightBroadcast:
+    """ Network weights in shared memory with a version counter. The version is odd while the learner
+        writes, so readers retry if it was odd or changed during their copy. """
+    def __init__(self, num_weights, name=None):
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=8 + 4 * num_weights)
+        self.version = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf, offset=0)
+        self.weights = np.ndarray((num_weights,), dtype=np.float32, buffer=self.shm.buf, offset=8)
+        if name is None:
+            self.version[0] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def publish(self, variables):
+        self.version[0] += 1
+        pos = 0
+        for v in variables:
+            value = v.numpy().ravel()
+            self.weights[pos:pos + value.size] = value
+            pos += value.size
+        self.version[0] += 1
+
+    def pull(self, variables, version):
+        """ Assigns published weights newer than version, returns the version of the assigned weights """
+        while True:
+            current = int(self.version[0])
+            if current == version or current == 0:
+                return version
+            if current % 2 == 1:
+                time.sleep(0.001)
+                continue
+            weights = self.weights.copy()
+            if int(self.version[0]) == current:
+                break
+        pos = 0
+        for v in variables:
+            size = int(np.prod(v.shape))
+            v.assign(weights[pos:pos + size].reshape(v.shape))
+            pos += size
+        return current
+
+    def close(self, unlink=False):
+        # Views of the buffer must be released before it is closed
+        del self.version, self.weights
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def actor_epsilons(actor_id, num_actors, num_envs, base, alpha=7.0):
+    """ Ape-X exploration, environment i of all N environments of the actors acts by epsilon
+        base^(1 + alpha * i / (N - 1)) """
+    total = num_actors * num_envs
+    if total == 1:
+        return np.full(1, base, dtype=np.float32)
+    i = actor_id * num_envs + np.arange(num_envs)
+    return (base**(1 + alpha * i / (total - 1))).astype(np.float32)
+
+
+def actor_main(actor_id, game, params, epsilons, channel, weights_name, num_weights, stop, seed=0):
+    """ Actor process, steps its environments by epsilon greedy actions of a CPU copy of the network
+        and sends the stored experiences and episode scores and lengths to the learner """
+    tf.config.set_visible_devices([], "GPU")
+    tf.random.set_seed(seed)
+    num_envs = params["num envs"]
+    env = VecAtariEnv(game, num_envs, mem_size=0, num_threads=params["worker threads"], seed=seed)
+    agent = make_agent(env.actionLength(), params)
+    states = env.getObs()
+    agent.qvalues(states)
+    broadcast = WeightBroadcast(num_weights, name=weights_name)
+    version = 0
+    # With quantized acting, pulled weights are converted at most once per export period
+    quantized = QuantizedActor(agent, seed=seed) if params["quantized acting"] else None
+    recent_states = deque([np.copy(states)], maxlen=max(128 // num_envs, 1))
+    taken_steps, exported_steps = 0, None
+    while not stop.is_set():
+        version = broadcast.pull(agent.net.variables, version)
+        if quantized is not None and (exported_steps is None or
+                                      taken_steps - exported_steps >= params["quantized export period"]):
+            quantized.export(np.concatenate(recent_states))
+            exported_steps = taken_steps
+        steps, episodes = [], []
+        for _ in range(params["actor send steps"]):
+            if quantized is None:
+                actions = agent.eps_greedy_action(states, epsilons).numpy()
+            else:
+                actions = quantized.eps_greedy_action(states, epsilons)
+            states, terminals, infos = env.stepBatch(actions)
+            if quantized is not None:
+                recent_states.append(np.copy(states))
+            steps.append(env.transitions())
+            episodes += [(infos[i]["Episode Score"], infos[i]["Episode Length"])
+                         for i in np.flatnonzero(terminals)]
+        # Items are concatenated step by step, which keeps the order of experiences of every lane
+        message = (actor_id, [np.concatenate(items) for items in zip(*steps)], episodes,
+                   len(steps) * num_envs)
+        taken_steps += len(steps) * num_envs
+        while not stop.is_set():
+            try:
+                channel.put(message, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+    # Unsent messages are dropped, such that the process can exit without a reading learner
+    channel.cancel_join_thread()
+    broadcast.close()
+
+
+class DistributedRunner(Runner):
+    """ Learner of an actor/learner split (Ape-X). Actor processes step their environments by CPU copies
+        of the network and send experiences into the replay memory of the learner. The learner trains
+        continuously at the replay ratio of the training intensity and broadcasts its weights periodically.
+        Resumed runs restore the learner and its replay memory, actors start new episodes. """
+    def __init__(self, game, iterations, dtag, resume=False, seed=None):
+        gpus = tf.config.experimental.list_physical_devices("GPU")
+        tf.config.experimental.set_memory_growth(gpus[0], True)
+
+        self.game = game
+        self.iterations = iterations
+        self.dtag = dtag
+        self.resume = resume
+        self.params = paramdict_single()
+        self.num_actors = self.params["num actors"]
+        self.seed, seeds = derive_seeds(seed, 3 + self.num_actors)
+        memory_seed, self.eval_seed, tf_seed, *actor_seeds = seeds
+        self.params["seed"] = self.seed
+        tf.random.set_seed(tf_seed)
+        self.training_steps = self.params["training phase steps"]
+        self.prefill_history = self.params["prefill size"]
+        self.batch_size = self.params["batch size"]
+        self.num_envs = self.params["num envs"]
+        self.target_update_period = self.params["target update period"]
+        self.weight_period = self.params["weight broadcast period"]
+        # Train steps per received environment step
+        self.replay_ratio = self.params["intensity"] / self.batch_size
+
+        print("Creating memory/network...")
+        env = VecAtariEnv(game, 1, mem_size=0)
+        self.action_len = env.actionLength()
+        del env
+        self.memory = ReplayMemory(self.params["mem size"],
+                                   self.num_actors * self.num_envs,
+                                   priority_exponent=self.params["priority exponent"],
+                                   seed=memory_seed,
+                                   codec=self.params["replay codec"],
+                                   codec_level=self.params["replay codec level"])
+        self.prioritized = self.memory.prioritized()
+        self.beta = Linear(
+            self.params["importance exponent"],
+            1.0,
+            self.iterations * self.training_steps,
+        )
+        self.agent = make_agent(self.action_len, self.params)
+        self.agent.qvalues(np.zeros((1, 4, 84, 84), dtype=np.uint8))
+        self.train_many = (self.agent.train_many_fused
+                           if self.params["jit compile"] else self.agent.train_many)
+        self.train_batches = self.params["train batches per call"]
+        self.sampler = self.memory.sampler(depth=self.params["sampler depth"])
+        num_weights = sum(int(np.prod(v.shape)) for v in self.agent.net.variables)
+        self.broadcast = WeightBroadcast(num_weights)
+        self.broadcast.publish(self.agent.net.variables)
+        self.evaluator = self._make_evaluator()
+        self.eval_row = None
+        prefix = checkpoint_prefix(dtag, game)
+        self.memory_path = prefix + "_replay.snap"
+        self.checkpointer = Checkpointer(prefix + "_state.npz")
+        # Profiles the learner, actor processes are not timed
+        self.profiler = Profiler(self.params["profile"],
+                                 trace_path(dtag, game) if self.params["profile trace"] else None)
+
+        ctx = mp.get_context("spawn")
+        self.channel = ctx.Queue(maxsize=4 * self.num_actors)
+        self.stop = ctx.Event()
+        self.actors = [
+            ctx.Process(target=actor_main,
+                        args=(i, game, self.params,
+                              actor_epsilons(i, self.num_actors, self.num_envs,
+                                             self.params["actor epsilon base"]),
+                              self.channel, self.broadcast.name, num_weights, self.stop, actor_seeds[i]),
+                        daemon=True) for i in range(self.num_actors)
+        ]
+        self.receiver = threading.Thread(target=self._receive, daemon=True)
+        self.lock = threading.Lock()
+        self.received_steps = 0
+        self.scores = []
+        self.trains = 0
+        print("Done.")
+
+    def run(self):
+        """ Runs the actors and trains for a number of iterations measured in received 1M frames """
+        checkpoint = self.checkpointer.load() if self.resume else None
+        self.metrics = self._open_metrics(checkpoint is not None)
+        # A resumed run continues the count of received steps at the end of the checkpointed iteration
+        trained_steps = 0 if checkpoint is None else (int(checkpoint["iteration"]) + 1) * self.training_steps
+        resume_steps = 0 if checkpoint is None else int(checkpoint["steps"])
+        self.received_steps = resume_steps
+        self.trains = int(trained_steps * self.replay_ratio)
+        restored = checkpoint is not None and self._restore_memory()
+        for actor in self.actors:
+            actor.start()
+        self.receiver.start()
+        if not restored:
+            print("Collecting history from actors...")
+            while self._received()[0] - resume_steps < self.prefill_history:
+                time.sleep(0.1)
+        self._warmup_construct()
+        start_iteration, data_row_list = 0, []
+        if checkpoint is not None:
+            start_iteration, data_row_list = self._restore(checkpoint)
+            self.broadcast.publish(self.agent.net.variables)
+            self.metrics.resume(start_iteration, resume_steps)
+        self.sampler.start()
+        self._output_settings()
+        tottime = time.perf_counter()
+        # Phases end when the steps of their iteration are received after the prefill
+        self.start_steps = self._received()[0] - trained_steps
+        self.next_target = self._received()[0]
+        for iteration in range(start_iteration, self.iterations):
+            diff_time, episodes, avg_return, avg_loss, min_atom, max_atom, gnorm = self._train_phase(
+                iteration, self.start_steps)
+            phase_formatter(iteration, episodes, avg_return, diff_time, self.training_steps)
+            loss_formatter(avg_loss, min_atom, max_atom)
+            self._report_dataset()
+            data_row_list.append(
+                makeRow(iteration=iteration,
+                        total_steps=(iteration + 1) * self.training_steps,
+                        episodes=episodes,
+                        avg_return=avg_return,
+                        avg_loss=avg_loss,
+                        supp_min=min_atom,
+                        supp_max=max_atom,
+                        norm_max=gnorm))
+            self._report_profile(data_row_list[-1])
+            self.metrics.iteration(data_row_list[-1])
+            self._evaluate(data_row_list)
+            print("=" * 64)
+            self._checkpoint(iteration, data_row_list)
+
+        self._complete_evaluation()
+        save_current_data(data_row_list, self.dtag, self.game, self.action_len, self.params)
+        self.stop.set()
+        for actor in self.actors:
+            actor.join()
+        self.receiver.join()
+        self.metrics.close()
+        self.checkpointer.close()
+        self.sampler.stop()
+        self.broadcast.close(unlink=True)
+        save_model(self.agent, self.dtag, self.game)
+
+        diff_time = time.perf_counter() - tottime
+        print(f"Learning done in {diff_time}s.")
+        print("Done.")
+
+    def _checkpoint_steps(self, iteration):
+        return self.start_steps + (iteration + 1) * self.training_steps
+
+    def _received(self):
+        with self.lock:
+            return self.received_steps, len(self.scores)
+
+    def _receive(self):
+        """ Adds the experiences sent by actors to the memory, runs on its own thread """
+        while not self.stop.is_set():
+            try:
+                actor_id, items, episodes, steps = self.channel.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            envs, actions, rewards, dones, new_frames, valid_frames, frames = items
+            self.memory.addFrames(actor_id * self.num_envs + envs, actions, rewards, dones, new_frames,
+                                  valid_frames, frames)
+            with self.lock:
+                self.received_steps += steps
+                self.scores += [score for score, _ in episodes]
+                for score, length in episodes:
+                    self.metrics.episode(self.received_steps, score, length)
+
+    def _train_phase(self, iteration, start_steps):
+        """ Trains until the actors sent the environment steps of one iteration """
+        phase_time = time.perf_counter()
+        stats = self._new_stats()
+        self.profiler.reset()
+        _, first_score = self._received()
+        phase_end = start_steps + (iteration + 1) * self.training_steps
+        while True:
+            steps, _ = self._received()
+            if steps >= phase_end:
+                break
+            # The learner waits while it is ahead of the replay ratio
+            due = int((steps - start_steps) * self.replay_ratio) - self.trains
+            if due < self.train_batches:
+                with self.profiler.section("actor_wait"):
+                    time.sleep(0.001)
+                continue
+            with self.profiler.section("train"):
+                self._train_batches(stats)
+            self.trains += self.train_batches
+            if self.trains % self.weight_period < self.train_batches:
+                with self.profiler.section("broadcast"):
+                    self.broadcast.publish(self.agent.net.variables)
+            # Periodically update the clone network for distributional DQN (every 8k received steps)
+            if steps >= self.next_target:
+                with self.profiler.section("target_update"):
+                    self.agent.update_target()
+                self.next_target += self.target_update_period
+                if self.prioritized:
+                    self.memory.setImportanceExponent(self.beta(steps - start_steps))
+
+        diff_time = time.perf_counter() - phase_time
+        with self.lock:
+            train_scores = self.scores[first_score:]
+        return self._phase_results(diff_time, train_scores, stats)
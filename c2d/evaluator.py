@@ -0,0 +1,53 @@
+import threading
+import numpy as np
+from c2d.configured.atarienv import VecAtariEnv
+from c2d.quantized import QuantizedActor
+
+
+class Evaluator:
+    """ Greedy evaluation phases on a pool of environments without replay memory. All environments act by
+        one batched pass of the evaluation network per step. A phase runs on a background thread against a
+        copy of the network, such that it overlaps with the training that continues meanwhile. With quantized,
+        the copy is an int8 model on the CPU. """
+    def __init__(self, game, agent, num_envs, steps, num_threads=0, seed=0, quantized=False):
+        self.agent = agent
+        self.steps = steps
+        self.env = VecAtariEnv(game, num_envs, mem_size=0, num_threads=num_threads, seed=seed)
+        # Builds the evaluation network, such that weights can be copied into it
+        self.agent.eval_action(self.env.getObs())
+        self.quantized = QuantizedActor(agent, network="enet", seed=seed) if quantized else None
+        self.epsilons = np.full(num_envs, float(agent.evaleps), dtype=np.float32)
+        self.thread = None
+        self.scores = []
+
+    def start(self, calibration_states=None):
+        """ Starts a phase by the current weights of the network, an int8 model is calibrated on states """
+        self.join()
+        self.agent.update_eval()
+        if self.quantized is not None:
+            self.quantized.export(calibration_states)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def join(self):
+        """ Waits for the running phase, returns its number of finished episodes and average return """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        episodes = len(self.scores)
+        avg_return = np.nan if episodes == 0 else np.mean(np.array(self.scores))
+        return episodes, avg_return
+
+    def _run(self):
+        # Every phase starts new episodes, unfinished episodes at the end of a phase are not counted
+        self.env.hardReset()
+        states = self.env.getObs()
+        scores = []
+        for _ in range(0, self.steps, self.env.num_envs):
+            if self.quantized is None:
+                actions = self.agent.eval_action(states).numpy()
+            else:
+                actions = self.quantized.eps_greedy_action(states, self.epsilons)
+            states, terminals, infos = self.env.stepBatch(actions)
+            scores += [infos[i]["Episode Score"] for i in np.flatnonzero(terminals)]
+        self.scores = scores
@@ -2,24 +2,33 @@ import tensorflow as tf
 
 
 class DiscreteNet(tf.keras.Model):
-    """ Our network model for discrete distribution estimates """
-    def __init__(self, num_actions, num_atoms, name):
+    """ Our network model for discrete distribution estimates. With a precision of bfloat16 or float16
+        the representation network computes in that precision on float32 weights, while both heads,
+        the softmax and the support activation stay in float32. """
+    def __init__(self, num_actions, num_atoms, name, precision="float32"):
         super(DiscreteNet, self).__init__(name=name)
+        trunk = "float32"
+        if precision != "float32":
+            trunk = tf.keras.mixed_precision.Policy(f"mixed_{precision}")
+        self.trunk_dtype = tf.as_dtype(precision)
         # DQN layers, we use the original padding of DQN for fewer weights.
         self.conv1 = tf.keras.layers.Conv2D(32,
                                             kernel_size=8,
                                             strides=4,
                                             input_shape=(4, 84, 84),
-                                            data_format="channels_first")
+                                            data_format="channels_first",
+                                            dtype=trunk)
         self.conv2 = tf.keras.layers.Conv2D(64,
                                             kernel_size=4,
                                             strides=2,
-                                            data_format="channels_first")
+                                            data_format="channels_first",
+                                            dtype=trunk)
         self.conv3 = tf.keras.layers.Conv2D(64,
                                             kernel_size=3,
                                             strides=1,
-                                            data_format="channels_first")
-        self.encoder = tf.keras.layers.Dense(512, activation="relu")
+                                            data_format="channels_first",
+                                            dtype=trunk)
+        self.encoder = tf.keras.layers.Dense(512, activation="relu", dtype=trunk)
 
         self.logits = tf.keras.layers.Dense(
             num_actions * num_atoms,
@@ -42,13 +51,13 @@ class DiscreteNet(tf.keras.Model):
 
         self.num_actions = num_actions
         self.num_atoms = num_atoms
-        self.bn1 = tf.keras.layers.BatchNormalization()
-        self.bn2 = tf.keras.layers.BatchNormalization()
-        self.bn3 = tf.keras.layers.BatchNormalization()
+        self.bn1 = tf.keras.layers.BatchNormalization(dtype=trunk)
+        self.bn2 = tf.keras.layers.BatchNormalization(dtype=trunk)
+        self.bn3 = tf.keras.layers.BatchNormalization(dtype=trunk)
 
     @tf.function
     def call(self, states, training=False):
-        x = tf.cast(states, tf.float32) / 255.0
+        x = tf.cast(states, self.trunk_dtype) / 255.0
 
         # Representation network (DQN + BatchNormalization)
         x = self.conv1(x)
@@ -61,7 +70,7 @@ class DiscreteNet(tf.keras.Model):
         x = self.bn3(x, training=training)
         x = tf.nn.relu(x)
         x = tf.keras.layers.Flatten()(x)
-        encoded_states = self.encoder(x)
+        encoded_states = tf.cast(self.encoder(x), tf.float32)
 
         # Probability function
         logits = tf.reshape(self.logits(encoded_states), [-1, self.num_actions, self.num_atoms])
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+import numpy as np
+from c2d.configured.atarienv import libc2d, trace_event
+
+
+def histogram_percentile(histogram, q):
+    """ Upper bound in ns of the log2 histogram bucket holding the q quantile of native section runs, NaN
+        without runs """
+    cumulative = np.cumsum(histogram)
+    if cumulative[-1] == 0:
+        return np.nan
+    return float(1 << int(np.searchsorted(cumulative, q * cumulative[-1])))
+
+
+class _Section:
+    """ Times one run of a Python section """
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._record(self.name, self.start, time.perf_counter_ns() - self.start)
+        return False
+
+
+class Profiler:
+    """ Time breakdown of the training loop. Python sections are timed by section(name), the native ones
+        (emulation, preprocessing, compression, sampling, acquire) by the library, which keeps log2
+        histograms of their durations. With a trace path, section runs are also collected and exported as a
+        Chrome trace (chrome://tracing or Perfetto). The trace is bounded by max_events, i.e., meant for
+        short diagnostic runs. Disabled profilers time nothing and sections are shared null contexts. """
+    def __init__(self, enabled=False, trace_path=None, max_events=1 << 20):
+        self.enabled = enabled
+        self.trace_path = trace_path if enabled else None
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        self.disabled_section = nullcontext()
+        self.native_names = [libc2d.statName(s).decode() for s in range(libc2d.statsCount())]
+        self.counts = np.zeros(len(self.native_names), dtype=np.int64)
+        self.nanos = np.zeros_like(self.counts)
+        self.histograms = np.zeros((len(self.native_names), libc2d.statsBuckets()), dtype=np.int64)
+        # Python section name -> [runs, ns] since the last breakdown
+        self.sections = {}
+        # Trace events (name, thread, start ns, duration ns) of Python sections and drained native ones
+        self.events = []
+        self.native_events = []
+        self.native_event_count = 0
+        self.dropped = 0
+        self.drain_buffer = np.zeros(1 << 16, dtype=trace_event)
+        self.origin = time.perf_counter_ns()
+        self.reset_time = self.origin
+        if enabled:
+            libc2d.setStatsEnabled(True, self.trace_path is not None)
+
+    def section(self, name):
+        """ Context manager timing a run of the named section """
+        if not self.enabled:
+            return self.disabled_section
+        return _Section(self, name)
+
+    def breakdown(self):
+        """ Seconds spent in every section and the p99 run time in µs of native sections since the last
+            breakdown, as data row columns. Starts the next breakdown. """
+        if not self.enabled:
+            return {}
+        self.poll()
+        libc2d.readStats(self.counts, self.nanos, self.histograms, True)
+        now = time.perf_counter_ns()
+        with self.lock:
+            sections, self.sections = self.sections, {}
+            row = {"profiled_s": (now - self.reset_time) / 1e9}
+            self.reset_time = now
+        for name, (_, nanos) in sections.items():
+            row[f"{name}_s"] = nanos / 1e9
+        for name, nanos, histogram in zip(self.native_names, self.nanos, self.histograms):
+            row[f"{name}_s"] = nanos / 1e9
+            row[f"{name}_p99_us"] = histogram_percentile(histogram, 0.99) / 1e3
+        return row
+
+    def reset(self):
+        """ Starts the next breakdown, e.g., past work outside of the profiled loop """
+        self.breakdown()
+
+    def poll(self):
+        """ Moves native trace events out of the library, which holds a bounded number of them """
+        if self.trace_path is None:
+            return
+        while True:
+            n = libc2d.drainTraceStats(self.drain_buffer, len(self.drain_buffer))
+            if n == 0:
+                break
+            kept = min(n, self.max_events - self.native_event_count)
+            if kept > 0:
+                self.native_events.append(self.drain_buffer[:kept].copy())
+                self.native_event_count += kept
+            self.dropped += n - kept
+
+    def export_trace(self, path=None):
+        """ Writes the collected section runs as a Chrome trace, Python and native sections as two
+            processes of one thread per caller. Times are µs since the profiler was created. """
+        path = path or self.trace_path
+        if path is None:
+            return
+        self.poll()
+        trace = [
+            {"name": "process_name", "ph": "M", "pid": 0, "args": {"name": "python"}},
+            {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "c2d"}},
+        ]
+        with self.lock:
+            events = list(self.events)
+        for name, thread, start, duration in events:
+            trace.append(self._complete_event(name, 0, thread, start, duration))
+        for chunk in self.native_events:
+            for stat, thread, start, duration in chunk.tolist():
+                trace.append(self._complete_event(self.native_names[stat], 1, thread, start, duration))
+        dropped = self.dropped + libc2d.droppedTraceStats()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms", "otherData": {"dropped": dropped}}, f)
+        os.replace(tmp_path, path)
+
+    def _record(self, name, start, duration):
+        with self.lock:
+            section = self.sections.setdefault(name, [0, 0])
+            section[0] += 1
+            section[1] += duration
+            if self.trace_path is not None:
+                if len(self.events) < self.max_events:
+                    self.events.append((name, threading.get_native_id(), start, duration))
+                else:
+                    self.dropped += 1
+
+    def _complete_event(self, name, pid, thread, start, duration):
+        # Python perf_counter_ns and the native steady clock share the monotonic clock
+        return {"name": name, "ph": "X", "pid": pid, "tid": thread, "ts": (start - self.origin) / 1e3,
+                "dur": duration / 1e3}
@@ -0,0 +1,77 @@
+import time
+import numpy as np
+import tensorflow as tf
+from c2d.agent import states_spec
+
+
+class QuantizedActor:
+    """ Epsilon greedy acting by an int8 TFLite copy of a network of the agent on the CPU, such that acting
+        and evaluation do not compete with the learner for the accelerator. Weights and activations are
+        quantized by calibration states, e.g., sampled replay states. export() converts the current weights
+        of the network, which is done periodically. Its agreement with the float network is measured on
+        held-out states, i.e., states other than the calibration ones. An interpreter is not thread-safe,
+        every acting thread needs its own actor. """
+    def __init__(self, agent, network="net", num_threads=None, seed=0):
+        self.agent = agent
+        self.net = getattr(agent, network)
+        self.action_len = int(agent.action_len)
+        self.num_threads = num_threads
+        self.rng = np.random.default_rng(seed)
+        self.interpreter = None
+        self.batch = None
+        self.model_bytes = 0
+
+        @tf.function(input_signature=[states_spec])
+        def qvalues(states):
+            probs, supps = self.net(states)
+            return tf.einsum("ajk, ajk-> aj", probs, agent.phiinv(supps))
+
+        self.float_qvalues = qvalues
+
+    def export(self, calibration_states):
+        """ Converts the current weights of the network to an int8 model calibrated on states [N x 4 x 84 x 84] """
+        converter = tf.lite.TFLiteConverter.from_concrete_functions([self.float_qvalues.get_concrete_function()],
+                                                                    self.net)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([s[np.newaxis]] for s in calibration_states)
+        # Ops without int8 kernels, e.g., the square roots of the inverse transform phiinv, stay in float
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+        model = converter.convert()
+        self.interpreter = tf.lite.Interpreter(model_content=model, num_threads=self.num_threads)
+        self.input = self.interpreter.get_input_details()[0]["index"]
+        self.output = self.interpreter.get_output_details()[0]["index"]
+        self.batch = None
+        self.model_bytes = len(model)
+
+    def qvalues(self, states):
+        """ Q-values of the int8 model for states of any batch size """
+        if len(states) != self.batch:
+            self.interpreter.resize_tensor_input(self.input, states.shape)
+            self.interpreter.allocate_tensors()
+            self.batch = len(states)
+        self.interpreter.set_tensor(self.input, states)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output)
+
+    def eps_greedy_action(self, states, epsilons):
+        """ Same as Agent.eps_greedy_action, but returns a numpy array """
+        actions = self.qvalues(states).argmax(-1).astype(np.uint8)
+        explore = self.rng.random(len(states)) < epsilons
+        actions[explore] = self.rng.integers(0, self.action_len, size=np.count_nonzero(explore))
+        return actions
+
+    def agreement(self, states):
+        """ Fraction of states of which the int8 model and the float network choose the same greedy action """
+        expected = self.float_qvalues(states).numpy().argmax(-1)
+        return float(np.mean(self.qvalues(states).argmax(-1) == expected))
+
+    def latency(self, states, calls=100):
+        """ Seconds per call of the int8 model and the float network on states """
+        results = []
+        for qvalues in (self.qvalues, lambda s: self.float_qvalues(s).numpy()):
+            qvalues(states)
+            start = time.perf_counter()
+            for _ in range(calls):
+                qvalues(states)
+            results.append((time.perf_counter() - start) / calls)
+        return tuple(results)
@@ -2,28 +2,42 @@ import numpy as np
 import tensorflow as tf
 import numpy as np
 import time
-from c2d.agent import Agent
-from c2d.util import (Linear, ReturnFormatter, phase_formatter, loss_formatter, makeRow, save_model,
-                      save_current_data)
+from c2d.agent import make_agent
+from c2d.dataset import BatchDataset
+from c2d.evaluator import Evaluator
+from c2d.profiler import Profiler
+from c2d.quantized import QuantizedActor
+from c2d.util import (Linear, ReturnFormatter, phase_formatter, eval_formatter, loss_formatter,
+                      dataset_formatter, profile_formatter, quantized_formatter, derive_seeds, makeRow,
+                      save_model, save_current_data, checkpoint_prefix, trace_path, metrics_path, games_dict,
+                      Checkpointer, MetricsWriter, rows_to_array, array_to_rows)
 from c2d.configured.hyperparameters import paramdict_single
-from c2d.configured.atarienv import AtariEnv
+from c2d.configured.atarienv import VecAtariEnv
 
 
 class Runner:
-    """ Simple class to handle experiments. This includes agent exploration & training in atari MDPs """
-    def __init__(self, game, iterations, dtag):
+    """ Simple class to handle experiments. This includes agent exploration & training in atari MDPs.
+        Runs of the same seed emulate, explore and sample replay the same, up to thread timing and
+        nondeterministic ops. """
+    def __init__(self, game, iterations, dtag, resume=False, seed=None):
         gpus = tf.config.experimental.list_physical_devices("GPU")
         tf.config.experimental.set_memory_growth(gpus[0], True)
 
         self.game = game
         self.iterations = iterations
         self.dtag = dtag
+        self.resume = resume
         self.params = paramdict_single()
+        self.seed, (env_seed, self.eval_seed, tf_seed, np_seed, act_seed) = derive_seeds(seed, 5)
+        self.params["seed"] = self.seed
+        tf.random.set_seed(tf_seed)
+        self.rng = np.random.default_rng(np_seed)
         self.training_steps = self.params["training phase steps"]
         self.eval_steps = self.params["eval phase steps"]
         self.prefill_history = self.params["prefill size"]
         self.batch_size = self.params["batch size"]
         self.prefetch_size = self.params["batch prefetch size"]
+        self.num_envs = self.params["num envs"]
         self.train_update_period = self.batch_size // self.prefetch_size
         self.target_update_period = self.params["target update period"]
         self.eps = Linear(
@@ -32,37 +46,70 @@ class Runner:
             self.params["explore steps"],
         )
         assert self.train_update_period == self.batch_size / self.prefetch_size
+        assert self.training_steps % self.num_envs == 0
 
         print("Creating environment/memory/network...")
-        self.env = AtariEnv(game, mem_size=self.params["mem size"])
+        self.env = VecAtariEnv(game,
+                               self.num_envs,
+                               mem_size=self.params["mem size"],
+                               num_threads=self.params["worker threads"],
+                               priority_exponent=self.params["priority exponent"],
+                               seed=env_seed,
+                               codec=self.params["replay codec"],
+                               codec_level=self.params["replay codec level"])
+        # The environments write into and own the replay memory
+        self.memory = self.env
+        self.prioritized = self.memory.prioritized()
+        self.beta = Linear(
+            self.params["importance exponent"],
+            1.0,
+            self.iterations * self.training_steps,
+        )
         self.action_len = self.env.actionLength()
-        self.agent = Agent(
-            self.action_len,
-            starteps=self.params["start epsilon"],
-            gamma=self.params["gamma"],
-            learning_rate=[self.params["learning rate"], self.params["learning rate"]],
-            adameps=self.params["adam epsilon"],
-            evaleps=self.params["evaluation epsilon"],
-            heps=self.params["scaling epsilon"],
-            atoms=self.params["atoms"])
+        self.agent = make_agent(self.action_len, self.params)
+        self.train_many = (self.agent.train_many_fused
+                           if self.params["jit compile"] else self.agent.train_many)
+        self.train_batches = self.params["train batches per call"]
+        self.quantized = (QuantizedActor(self.agent, seed=act_seed)
+                          if self.params["quantized acting"] else None)
+        self.quantized_period = self.params["quantized export period"]
+        # Due training steps not yet trained on, carried over between phases
+        self.pending_trains = 0
+        self.sampler = self.env.sampler(depth=self.params["sampler depth"])
+        self.evaluator = self._make_evaluator()
+        # Data row of the running evaluation phase
+        self.eval_row = None
+        prefix = checkpoint_prefix(dtag, game)
+        self.memory_path = prefix + "_replay.snap"
+        self.checkpointer = Checkpointer(prefix + "_state.npz")
+        self.profiler = Profiler(self.params["profile"],
+                                 trace_path(dtag, game) if self.params["profile trace"] else None)
         print("Done.")
         self.return_formatter = ReturnFormatter()
 
     def run(self):
         """ One full experiment run for a number of iterations measured in 1M frames. 
             Collects and stores statistics, saves models. """
-        print("Collecting random history...")
-        self._prefill()
+        checkpoint = self.checkpointer.load() if self.resume else None
+        self.metrics = self._open_metrics(checkpoint is not None)
+        if checkpoint is None or not self._restore_memory():
+            print("Collecting random history...")
+            self._prefill()
         self._warmup_construct()
+        start_iteration, data_row_list = 0, []
+        if checkpoint is not None:
+            start_iteration, data_row_list = self._restore(checkpoint)
+            self.metrics.resume(start_iteration, start_iteration * self.training_steps)
+        self.sampler.start()
         self._output_settings()
         print("Waiting for initial returns...", end="\r")
         tottime = time.perf_counter()
-        data_row_list = []
-        for iteration in range(self.iterations):
+        for iteration in range(start_iteration, self.iterations):
             diff_time, episodes, avg_return, avg_loss, min_atom, max_atom, gnorm = self._train_phase(
                 iteration)
             phase_formatter(iteration, episodes, avg_return, diff_time, self.training_steps)
             loss_formatter(avg_loss, min_atom, max_atom)
+            self._report_dataset()
             data_row_list.append(
                 makeRow(iteration=iteration,
                         total_steps=(iteration + 1) * self.training_steps,
@@ -72,15 +119,107 @@ class Runner:
                         supp_min=min_atom,
                         supp_max=max_atom,
                         norm_max=gnorm))
+            self._report_profile(data_row_list[-1])
+            self.metrics.iteration(data_row_list[-1])
+            self._evaluate(data_row_list)
             print("=" * 64)
-            save_current_data(data_row_list, self.dtag, self.game, self.action_len, self.params)
+            self._checkpoint(iteration, data_row_list)
 
+        # The data files are written once, records of the run are streamed to the metrics file
+        self._complete_evaluation()
+        save_current_data(data_row_list, self.dtag, self.game, self.action_len, self.params)
+        self.metrics.close()
+        self.checkpointer.close()
+        self.sampler.stop()
         save_model(self.agent, self.dtag, self.game)
 
         diff_time = time.perf_counter() - tottime
         print(f"Learning done in {diff_time}s.")
         print("Done.")
 
+    def _checkpoint(self, iteration, data_row_list):
+        """ Copies the training state of the finished iteration, which is then written in the background """
+        if self.params["checkpoint memory"]:
+            self.memory.saveMemory(self.memory_path)
+        arrays = {f"var{i}": value for i, value in enumerate(self.agent.get_state())}
+        arrays["iteration"] = np.array(iteration)
+        arrays["steps"] = np.array(self._checkpoint_steps(iteration))
+        arrays["data rows"] = rows_to_array(data_row_list)
+        self.checkpointer.save(arrays)
+
+    def _checkpoint_steps(self, iteration):
+        """ Environment steps by the end of the iteration, from which the episode steps of a resumed run
+            continue """
+        return (iteration + 1) * self.training_steps
+
+    def _restore_memory(self):
+        if not self.params["checkpoint memory"] or not self.memory.loadMemory(self.memory_path):
+            return False
+        print("Restored replay memory.")
+        return True
+
+    def _restore(self, checkpoint):
+        """ Restores the training state into the built networks, returns the next iteration and data rows """
+        num_vars = len([key for key in checkpoint if key.startswith("var")])
+        variables = [checkpoint[f"var{i}"] for i in range(num_vars)]
+        self.agent.set_state(variables)
+        iteration = int(checkpoint["iteration"]) + 1
+        print(f"Resuming at iteration {iteration}.")
+        return iteration, array_to_rows(checkpoint["data rows"])
+
+    def _open_metrics(self, resumed):
+        """ Metrics file of the run. Runs resumed from a checkpoint append to it after a resume record, other
+            runs replace it. """
+        return MetricsWriter(metrics_path(self.dtag, self.game),
+                             header=dict(tag=self.dtag, game=games_dict[self.game], actions=self.action_len,
+                                         params=self.params),
+                             append=resumed)
+
+    def _make_evaluator(self):
+        if self.params["eval phase steps"] == 0:
+            return None
+        return Evaluator(self.game,
+                         self.agent,
+                         self.params["eval envs"],
+                         self.params["eval phase steps"],
+                         num_threads=self.params["worker threads"],
+                         seed=self.eval_seed,
+                         quantized=self.params["quantized acting"])
+
+    def _report_profile(self, row):
+        """ Adds the time breakdown of the training phase to its data row and exports the trace so far """
+        breakdown = self.profiler.breakdown()
+        profile_formatter(breakdown)
+        row.update(breakdown)
+        self.profiler.export_trace()
+
+    def _evaluate(self, data_row_list):
+        """ Completes the evaluation of the previous iteration and starts the one of the last data row.
+            Its results are filled into the row when it is done, i.e., after the next training phase. """
+        if self.evaluator is None:
+            return
+        self._complete_evaluation()
+        self.eval_row = data_row_list[-1]
+        self.eval_row.update(eval_episodes=0, eval_avg_return=np.nan)
+        self.evaluator.start(self._calibration_states() if self.params["quantized acting"] else None)
+
+    def _complete_evaluation(self):
+        """ Waits for the running evaluation phase, returns False if there is none """
+        if self.eval_row is None:
+            return False
+        episodes, avg_return = self.evaluator.join()
+        self.eval_row.update(eval_episodes=episodes, eval_avg_return=avg_return)
+        self.metrics.evaluation(self.eval_row["iteration"], episodes, avg_return)
+        eval_formatter(self.eval_row["iteration"], episodes, avg_return)
+        self.eval_row = None
+        return True
+
+    def _report_dataset(self):
+        if self.dataset is None:
+            return
+        dataset_formatter(self.dataset.stats())
+        self.dataset.reset_stats()
+
     def _output_settings(self):
         print("=" * 24 + " Settings Agent " + "=" * 24)
         print(f"Data Tag: {self.dtag}")
@@ -94,66 +233,145 @@ class Runner:
     def _prefill(self):
         """ Prefills the replay buffer with random history """
         start = time.perf_counter()
-        bwork = False
-        for t in range(1, self.prefill_history + 1):
-            action = np.random.randint(self.action_len, dtype=np.uint8)
-            if t == (self.prefill_history - self.batch_size + 1):
-                bwork = True
-            self.env.step(action, batchWork=bwork)
-            if t % 10000 == 0:
+        for t in range(self.num_envs, self.prefill_history + 1, self.num_envs):
+            actions = self.rng.integers(self.action_len, size=self.num_envs, dtype=np.uint8)
+            self.env.stepBatch(actions)
+            if t % 10000 < self.num_envs:
                 tf.print(f"Collected {t} samples.")
 
         mssmp = 1000 * (time.perf_counter() - start) / self.prefill_history
         self.env.hardReset()
-        print(f"Done ({mssmp:.2f} ms/smp).")
+        mb = self.env.residentBytes() / 2**20
+        print(f"Done ({mssmp:.2f} ms/smp, {mb:.1f} MB replay memory).")
 
     def _warmup_construct(self):
-        states, _, _, _, _ = self.env.getBatch()
+        states, _, _, _, _ = self.memory.sampleBatch()
         self.agent.qvalues(states)
         self.agent.target_estimates(states)
         self.agent.update_target()
+        # Training loops in graphs can not create optimizer slots
+        self.agent.build_optimizer()
+        self.stacked = [
+            np.zeros((self.train_batches,) + view.shape, dtype=view.dtype)
+            for view in self.sampler.views[0]
+        ]
+        self.dataset = None
+        if self.params["dataset prefetch"] > 0:
+            device = "/GPU:0" if self.params["dataset device prefetch"] else None
+            self.dataset = BatchDataset(self.sampler,
+                                        batches_per_element=self.train_batches,
+                                        prefetch=self.params["dataset prefetch"],
+                                        device=device)
 
     def _train_phase(self, iteration):
         """ One iteration training loop 250k steps (1M frames) """
-        state = self.env.getObs()
+        states = self.env.getObs()
+        epsilons = np.zeros(self.num_envs, dtype=np.float32)
         phase_time = time.perf_counter()
         train_scores = []
-        losses = []
-        min_atom, max_atom = (np.finfo(np.float32).max, np.finfo(np.float32).min)
-        max_norm = np.finfo(np.float32).min
-        # Exploration and training loop
-        for train_step in range(self.training_steps):
+        stats = self._new_stats()
+        self.profiler.reset()
+        # Environment steps since the last training step, such that we train on the first step
+        untrained_steps = self.train_update_period - 1
+        # Exploration and training loop, every loop steps all environments once
+        for train_step in range(0, self.training_steps, self.num_envs):
             # Update current epsilon (only relevant on the first training phase)
             current_step = iteration * self.training_steps + train_step
-            t_eps = tf.constant(self.eps(current_step), dtype=tf.float32)
+            epsilons.fill(self.eps(current_step))
+            # Anneal the importance exponent of prioritized replay along with target updates
+            if self.prioritized and current_step % self.target_update_period < self.num_envs:
+                self.env.setImportanceExponent(self.beta(current_step))
+
+            # Periodically convert the current network for quantized acting
+            if self.quantized is not None and current_step % self.quantized_period < self.num_envs:
+                self._export_quantized()
+
+            # Compute eps-greedy actions for all environments by one batched pass
+            with self.profiler.section("act"):
+                actions = self._act(states, epsilons)
 
-            # Compute eps-greedy action given the current state
-            action = (self.agent.eps_greedy_action(state, t_eps).numpy().astype(np.uint8))[0]
+            # Training steps due this loop (one for every 4th environment step)
+            untrained_steps += self.num_envs
+            train_count, untrained_steps = divmod(untrained_steps, self.train_update_period)
+            self.pending_trains += train_count
 
-            # Take step by action
+            # Take steps by actions on the native workers while we train on sampled batches
+            self.env.stepBatchAsync(actions)
+            with self.profiler.section("train"):
+                while self.pending_trains >= self.train_batches:
+                    self._train_batches(stats)
+                    self.pending_trains -= self.train_batches
             with tf.device("/CPU:0"):
-                state, terminal, info = self.env.step(action, batchWork=True)
-                if terminal:
-                    train_scores.append(info["Episode Score"])
-                    self.return_formatter(current_step + 1, info)
-
-            # Periodically train (every 4th step)
-            if train_step % self.train_update_period == 0:
-                with tf.device("/CPU:0"):
-                    sts, acs, rws, ests, dns = self.env.getBatch()
-                loss, amin, amax, norm = self.agent.train(sts, acs, rws, ests, dns)
-                with tf.device("/CPU:0"):
-                    losses.append(loss)
-                    min_atom = tf.minimum(min_atom, amin).numpy()
-                    max_atom = tf.maximum(max_atom, amax).numpy()
-                    max_norm = tf.maximum(max_norm, norm).numpy()
+                with self.profiler.section("env_wait"):
+                    states, terminals, infos = self.env.wait()
+                for env_idx in np.flatnonzero(terminals):
+                    train_scores.append(infos[env_idx]["Episode Score"])
+                    self.return_formatter(current_step + env_idx + 1, infos[env_idx])
+                    self.metrics.episode(current_step + env_idx + 1, infos[env_idx]["Episode Score"],
+                                         infos[env_idx]["Episode Length"])
 
             # Periodically update the clone network for distributional DQN (every 8k steps)
-            if current_step % self.target_update_period == 0:
-                self.agent.update_target()
+            if current_step % self.target_update_period < self.num_envs:
+                with self.profiler.section("target_update"):
+                    self.agent.update_target()
 
         diff_time = time.perf_counter() - phase_time
+        return self._phase_results(diff_time, train_scores, stats)
+
+    def _act(self, states, epsilons):
+        if self.quantized is not None:
+            return self.quantized.eps_greedy_action(states, epsilons)
+        return self.agent.eps_greedy_action(states, epsilons).numpy()
+
+    def _calibration_states(self, batches=4):
+        """ Sampled replay states, on which int8 models are calibrated """
+        return np.concatenate([np.copy(self.memory.sampleBatch()[0]) for _ in range(batches)])
+
+    def _export_quantized(self):
+        self.quantized.export(self._calibration_states())
+        # Greedy agreement on states sampled apart from the calibration states
+        agreement = self.quantized.agreement(self._calibration_states())
+        quantized_formatter(agreement, self.quantized.model_bytes)
+
+    def _new_stats(self):
+        # Statistics stay on the device until the end of the phase
+        return {
+            "loss sum": tf.constant(0.0),
+            "trains": 0,
+            "min atom": tf.constant(np.finfo(np.float32).max),
+            "max atom": tf.constant(np.finfo(np.float32).min),
+            "max norm": tf.constant(np.finfo(np.float32).min),
+        }
+
+    def _phase_results(self, diff_time, train_scores, stats):
         episodes = len(train_scores)
         avg_return = np.nan if episodes == 0 else np.mean(np.array(train_scores))
-        avg_loss = np.nan if episodes == 0 else np.mean(np.array(losses))
-        return diff_time, episodes, avg_return, avg_loss, min_atom, max_atom, max_norm
\ No newline at end of file
+        trains = max(stats["trains"], 1)
+        avg_loss = np.nan if episodes == 0 else stats["loss sum"].numpy() / trains
+        return (diff_time, episodes, avg_return, avg_loss, stats["min atom"].numpy(),
+                stats["max atom"].numpy(), stats["max norm"].numpy())
+
+    def _train_batches(self, stats):
+        """ Trains on K sampled batches by one graph call and accumulates loss and support statistics """
+        if self.dataset is not None:
+            sts, acs, rws, ests, dns, idx, wts = next(self.dataset)
+        elif self.train_batches == 1:
+            # A single batch is trained on from the sampler buffers without copy
+            batch = [tf.experimental.dlpack.from_dlpack(c) for c in self.sampler.nextCapsules()]
+            sts, acs, rws, ests, dns, idx, wts = [tf.expand_dims(x, 0) for x in batch]
+        else:
+            for k in range(self.train_batches):
+                # Sampled batch views are only valid until the next batch, so they are stacked by copy
+                for buffer, view in zip(self.stacked, self.sampler.nextBatch()):
+                    buffer[k] = view
+            sts, acs, rws, ests, dns, idx, wts = self.stacked
+        loss_sum, amin, amax, norm, losses = self.train_many(sts, acs, rws, ests, dns, wts)
+        if self.prioritized:
+            # Sampled items get their Cramér losses as new priorities
+            with self.profiler.section("priority_sync"):
+                self.memory.updatePriorities(np.reshape(idx, -1), losses.numpy().reshape(-1))
+        stats["loss sum"] += loss_sum
+        stats["trains"] += self.train_batches
+        stats["min atom"] = tf.minimum(stats["min atom"], amin)
+        stats["max atom"] = tf.maximum(stats["max atom"], amax)
+        stats["max norm"] = tf.maximum(stats["max norm"], norm)
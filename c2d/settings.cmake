@@ -13,6 +13,13 @@ set(CR_EVAL_EPS 0.001)
 # Replay Buffer Size 
 set(CR_MEM_SIZE "int(1e6)")
 
+# Codec of replay frames: 'lz4' (level = acceleration), 'lz4hc' (level 1-12), 'zlib' (level 0-9,
+# with a preset dictionary of the first frames) or 'raw' (uncompressed, for small memories)
+set(CR_REPLAY_CODEC "'lz4'")
+
+# Level of the replay codec
+set(CR_REPLAY_CODEC_LEVEL 1)
+
 # History Prefill Size
 set(CR_MEM_PREFILL "int(20e3)")
 
@@ -55,14 +62,74 @@ set(CR_ADAM_EPS 0.01/32)
 # Single environment batchsize
 set(CR_BATCH_SIZE_ONE 32)
 
+# Number of environments stepped together by batched action selection
+set(CR_NUM_ENVS 1)
+
+# Number of native worker threads stepping the environments (0 = automatic)
+set(CR_NUM_THREADS 0)
+
 # Single prefetch batch items (divisor of CR_BATCH_SIZE_ONE)
 set(CR_PREFETCH 8)
 
+# Number of ready batches kept by the background sampler
+set(CR_SAMPLER_DEPTH 4)
+
+# Prioritized replay exponent alpha (0 = uniform sampling)
+set(CR_PRIORITY_EXPONENT 0.0)
+
+# Starting importance sampling exponent beta, annealed to 1 over all iterations
+set(CR_IMPORTANCE_EXPONENT 0.4)
+
+# Number of actor processes stepping environments for a separate learner (0 = no split)
+set(CR_NUM_ACTORS 0)
+
+# Actor steps sent to the learner at once
+set(CR_ACTOR_SEND_STEPS 16)
+
+# Ape-X exploration, actor i acts by epsilon base^(1 + 7 i / (actors - 1))
+set(CR_ACTOR_EPS_BASE 0.4)
+
+# Learner train steps between weight broadcasts to the actors
+set(CR_WEIGHT_PERIOD 100)
+
+# Snapshot the replay memory with every checkpoint for a resume without prefill
+set(CR_CHECKPOINT_MEMORY True)
+
+# tf.data elements prefetched from the background sampler (0 = no tf.data pipeline)
+set(CR_DATASET_PREFETCH 0)
+
+# Prefetch tf.data elements onto the GPU, overlapping the host to device transfer with training
+set(CR_DATASET_DEVICE_PREFETCH False)
+
+# Sampled batches trained on by one graph call (1 keeps training on every 4th step)
+set(CR_TRAIN_BATCHES_PER_CALL 1)
+
 # Training phase steps 
 set(CR_TRAIN_PHASE_STEPS 250000)
 
-# Eval phase steps 
+# Eval phase steps (0 = no evaluation), run alongside the next training phase
 set(CR_EVAL_PHASE_STEPS 0)
 
+# Number of environments playing evaluation episodes concurrently
+set(CR_EVAL_ENVS 16)
+
+# Compute precision of the representation network: 'float32', 'bfloat16' or 'float16' (loss scaled)
+set(CR_PRECISION "'float32'")
+
+# Train by the XLA compiled (fused) train step, checked against the graph train step by tests/test_agent.py
+set(CR_JIT_COMPILE False)
+
+# Act by an int8 TFLite copy of the network on the CPU, also in evaluation phases and actor processes
+set(CR_QUANTIZED_ACTING False)
+
+# Environment steps between conversions of the current network for quantized acting
+set(CR_QUANTIZED_EXPORT_PERIOD 50000)
+
+# Time the sections of the training loop and report their breakdown with every iteration
+set(CR_PROFILE False)
+
+# Export profiled section runs as a Chrome trace (bounded, meant for short diagnostic runs)
+set(CR_PROFILE_TRACE False)
+
 # Single Environment Atoms
 set(CR_ATOMS 32)
@@ -1,5 +1,9 @@
 import pandas as pd
+import numpy as np
+import json
 import os
+import queue
+import threading
 
 dopamine_games = [
     "airraid",
@@ -66,13 +70,20 @@ dopamine_games = [
 
 FOLDER = "experiments/new"
 
-games_dict = {}
-rom_list = os.listdir("ale_roms")
-for rom_file in rom_list:
-    rom = os.path.splitext(rom_file)[0]
-    truncgame = rom.replace('_', '')
-    if truncgame in dopamine_games:
-        games_dict[rom] = truncgame
+
+def rom_games(folder="ale_roms"):
+    """ Dopamine names of the games with a ROM in folder and of the synthetic game, which needs none """
+    games = {"synthetic": "synthetic"}
+    rom_list = os.listdir(folder) if os.path.isdir(folder) else []
+    for rom_file in rom_list:
+        rom = os.path.splitext(rom_file)[0]
+        truncgame = rom.replace('_', '')
+        if truncgame in dopamine_games:
+            games[rom] = truncgame
+    return games
+
+
+games_dict = rom_games()
 
 
 class Linear:
@@ -114,11 +125,50 @@ def phase_formatter(iteration, episodes, avg_return, diff_time, steps):
     )
 
 
+def eval_formatter(iteration, episodes, avg_return):
+    prefix_str = "EVALUATION PHASE -> "
+    print(prefix_str + f"Iteration: {iteration}, Episodes: {episodes}, Average return: {avg_return:.2f}")
+
+
 def loss_formatter(aloss, min_atom, max_atom):
     print(f"Avg Loss -> {aloss:.4f}")
     print(f"Max Theo. Supp Range -> [{min_atom:.2f}, {max_atom:.2f}]")
 
 
+def dataset_formatter(stats):
+    print(f"Dataset -> {stats['batches/s']:.1f} batches/s sampled ({stats['ms/acquire']:.2f} ms/acquire), " +
+          f"{stats['elements/s']:.1f} elements/s trained, {100 * stats['wait fraction']:.1f}% waiting")
+
+
+def quantized_formatter(agreement, model_bytes):
+    print(f"Quantized actor -> {100 * agreement:.1f}% greedy agreement, {model_bytes / 2**20:.1f} MB")
+
+
+def profile_formatter(breakdown):
+    if not breakdown:
+        return
+    total = breakdown["profiled_s"]
+    parts = []
+    for key, value in breakdown.items():
+        if key == "profiled_s" or not key.endswith("_s"):
+            continue
+        name = key[:-2]
+        part = f"{name} {value:.1f}s ({100 * value / total:.0f}%)"
+        p99 = breakdown.get(f"{name}_p99_us")
+        if p99 is not None and not np.isnan(p99):
+            part += f" p99 {p99:.0f} µs"
+        parts.append(part)
+    print("Profile -> " + ", ".join(parts))
+
+
+def derive_seeds(seed, count):
+    """ Seeds of count independent random streams of a run, e.g., environments and networks. A new run seed
+        is drawn if seed is None. Returns the run seed and the derived seeds. """
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    return seed, [int(s) for s in np.random.SeedSequence(seed).generate_state(count)]
+
+
 def makeRow(**kwargs):
     C = {}
     for key, value in kwargs.items():
@@ -133,6 +183,139 @@ def save_model(agent, dtag, game, folder=FOLDER):
     agent.save_model(prefix)
 
 
+def checkpoint_prefix(dtag, game, folder=FOLDER):
+    dopamine_game = games_dict[game]
+    os.makedirs(f"{folder}/checkpoints/", exist_ok=True)
+    return f"{folder}/checkpoints/{dopamine_game}_{dtag}"
+
+
+def trace_path(dtag, game, folder=FOLDER):
+    dopamine_game = games_dict[game]
+    return f"{folder}/traces/{dopamine_game}_{dtag}.json"
+
+
+class Checkpointer:
+    """ Writes checkpoints of named arrays on a background thread. Every checkpoint is written to a
+        temporary file that atomically replaces the previous one, so the file is always complete. """
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def save(self, arrays):
+        """ Queues a checkpoint, blocks only while the previous one is still waiting """
+        self.queue.put(arrays)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with np.load(self.path, allow_pickle=False) as data:
+            return dict(data)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _work(self):
+        while True:
+            arrays = self.queue.get()
+            if arrays is None:
+                return
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **arrays)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+
+class MetricsWriter:
+    """ Appends metrics records as JSON lines on a background thread, i.e., a header with the settings of
+        the run once, then episode, iteration and evaluation records. A record costs the same at any point
+        of a run, and records are written in batches without stalling the caller. A resume record marks
+        where a resumed run continues, records of later iterations before it are superseded. Without
+        append, an existing file of the path is replaced. """
+    def __init__(self, path, header, append=False):
+        self.path = path
+        self.queue = queue.Queue()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a" if append else "w")
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+        if new:
+            self._put("header", **header)
+
+    def episode(self, step, score, length):
+        self._put("episode", step=step, score=score, length=length)
+
+    def iteration(self, row):
+        self._put("iteration", **row)
+
+    def evaluation(self, iteration, episodes, avg_return):
+        self._put("evaluation", iteration=iteration, eval_episodes=episodes, eval_avg_return=avg_return)
+
+    def resume(self, iteration, step):
+        self._put("resume", iteration=iteration, step=step)
+
+    def close(self):
+        """ Writes the queued records and closes the file """
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+    def _put(self, kind, **fields):
+        # Copies the fields, e.g., of data rows completed later
+        self.queue.put(dict(kind=kind, **fields))
+
+    def _work(self):
+        while True:
+            records = [self.queue.get()]
+            while not self.queue.empty():
+                records.append(self.queue.get())
+            done = records[-1] is None
+            lines = [json.dumps(r, default=float, separators=(",", ":")) + "\n" for r in records if r is not None]
+            self.file.write("".join(lines))
+            self.file.flush()
+            if done:
+                return
+
+
+def read_metrics(path):
+    """ Header, iteration rows with their evaluation results and episode records of a metrics file """
+    header, rows, episodes = None, {}, []
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            kind = record.pop("kind")
+            if kind == "header":
+                header = record
+            elif kind == "resume":
+                rows = {i: row for i, row in rows.items() if i < record["iteration"]}
+                episodes = [e for e in episodes if e["step"] <= record["step"]]
+            elif kind == "episode":
+                episodes.append(record)
+            elif kind == "iteration":
+                rows[record["iteration"]] = record
+            elif kind == "evaluation" and record["iteration"] in rows:
+                rows[record["iteration"]].update(record)
+    return header, [rows[i] for i in sorted(rows)], episodes
+
+
+def metrics_path(dtag, game, folder=FOLDER):
+    dopamine_game = games_dict[game]
+    return f"{folder}/metrics/{dopamine_game}_{dtag}.jsonl"
+
+
+def rows_to_array(data_row_list):
+    return np.array(json.dumps(data_row_list, default=float))
+
+
+def array_to_rows(array):
+    return json.loads(str(array))
+
+
 def save_current_data(data_row_list, dtag, game, action_len, params, folder=FOLDER):
     dopamine_game = games_dict[game]
     os.makedirs(f"{folder}/training_data/", exist_ok=True)
@@ -1,5 +1,7 @@
 import argparse
 from c2d.runner import Runner
+from c2d.distributed import DistributedRunner
+from c2d.configured.hyperparameters import paramdict_single
 
 if __name__ == "__main__":
 
@@ -24,6 +26,22 @@ if __name__ == "__main__":
         default=1,
         help="Number of training and evaluation phases. Default is 1 iterations.",
     )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        help="Resume from the last checkpoint of the tag if there is one.",
+    )
+    parser.add_argument(
+        "--seed",
+        dest="seed",
+        type=int,
+        default=None,
+        help="Seed of environments, replay sampling and networks. Default is a random seed.",
+    )
     args = parser.parse_args()
-    runner = Runner(args.game, args.iterations, args.dtag)
+    if paramdict_single()["num actors"] > 0:
+        runner = DistributedRunner(args.game, args.iterations, args.dtag, resume=args.resume, seed=args.seed)
+    else:
+        runner = Runner(args.game, args.iterations, args.dtag, resume=args.resume, seed=args.seed)
     runner.run()
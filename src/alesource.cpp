@@ -0,0 +1,41 @@
+#include "alesource.hpp"
+
+namespace c2d {
+
+AleSource::AleSource(const std::string &rom, int seed) {
+  ale_interface.setInt("random_seed", seed);
+  ale_interface.setFloat("repeat_action_probability", repeatActionProbability);
+  ale_interface.loadROM(rom);
+  actionMap = ale_interface.getMinimalActionSet();
+}
+
+auto AleSource::act(int action) -> reward_t {
+  return ale_interface.act(actionMap[action]);
+}
+
+auto AleSource::lives() -> int { return ale_interface.lives(); }
+
+auto AleSource::gameOver() -> bool { return ale_interface.game_over(); }
+
+void AleSource::resetGame() { ale_interface.reset_game(); }
+
+void AleSource::grayscale(Frame &screen) {
+  ale_interface.getScreenGrayscale(screen);
+}
+
+void AleSource::rgb(std::vector<pixel_t> &screen) {
+  ale_interface.getScreenRGB(screen);
+}
+
+auto AleSource::height() -> int {
+  return static_cast<int>(ale_interface.getScreen().height());
+}
+
+auto AleSource::width() -> int {
+  return static_cast<int>(ale_interface.getScreen().width());
+}
+
+auto AleSource::actionLength() -> int {
+  return static_cast<int>(actionMap.size());
+}
+} // namespace c2d
@@ -0,0 +1,27 @@
+#ifndef ALESOURCE_HPP
+#define ALESOURCE_HPP
+#include "framesource.hpp"
+#include <ale/ale_interface.hpp>
+
+namespace c2d {
+
+// Screens of an ALE game by its ROM, with sticky actions
+class AleSource final : public FrameSource {
+public:
+  AleSource(const std::string &rom, int seed);
+  auto act(int action) -> reward_t override;
+  [[nodiscard]] auto lives() -> int override;
+  [[nodiscard]] auto gameOver() -> bool override;
+  void resetGame() override;
+  void grayscale(Frame &screen) override;
+  void rgb(std::vector<pixel_t> &screen) override;
+  [[nodiscard]] auto height() -> int override;
+  [[nodiscard]] auto width() -> int override;
+  [[nodiscard]] auto actionLength() -> int override;
+
+private:
+  ale::ALEInterface ale_interface;
+  ale::ActionVect actionMap;
+};
+} // namespace c2d
+#endif // ALESOURCE_HPP
@@ -0,0 +1,35 @@
+#include "allocationcounter.hpp"
+#include <atomic>
+#include <cstdlib>
+#include <new>
+
+#ifdef C2D_COUNT_ALLOCATIONS
+namespace {
+std::atomic<int64_t> allocations{0};
+
+auto countedAlloc(std::size_t bytes) -> void * {
+  allocations.fetch_add(1, std::memory_order_relaxed);
+  if (auto *ptr = std::malloc(bytes == 0 ? 1 : bytes)) {
+    return ptr;
+  }
+  throw std::bad_alloc();
+}
+} // namespace
+
+auto operator new(std::size_t bytes) -> void * { return countedAlloc(bytes); }
+auto operator new[](std::size_t bytes) -> void * { return countedAlloc(bytes); }
+void operator delete(void *ptr) noexcept { std::free(ptr); }
+void operator delete[](void *ptr) noexcept { std::free(ptr); }
+void operator delete(void *ptr, std::size_t /*bytes*/) noexcept {
+  std::free(ptr);
+}
+void operator delete[](void *ptr, std::size_t /*bytes*/) noexcept {
+  std::free(ptr);
+}
+
+auto c2d::allocationCount() -> int64_t {
+  return allocations.load(std::memory_order_relaxed);
+}
+#else
+auto c2d::allocationCount() -> int64_t { return -1; }
+#endif
@@ -0,0 +1,13 @@
+#ifndef ALLOCATIONCOUNTER_HPP
+#define ALLOCATIONCOUNTER_HPP
+#include <cstdint>
+
+namespace c2d {
+
+// Number of operator new calls bound to this library since it was loaded,
+// e.g., to check that stepping allocates nothing. Counting replaces the
+// global operator new and is only built with C2D_COUNT_ALLOCATIONS, otherwise
+// the count is -1.
+[[nodiscard]] auto allocationCount() -> int64_t;
+} // namespace c2d
+#endif // ALLOCATIONCOUNTER_HPP
@@ -1,77 +1,108 @@
 #include "atarienv.hpp"
 #include "common.hpp"
+#include "stats.hpp"
+#include "xoshiro.hpp"
 #include <algorithm>
+#include <iostream>
 #include <iterator>
-#include <opencv2/imgproc.hpp>
 
 namespace c2d {
 
-void AtariEnv::initialize(const std::string &game, int memSize) {
-  memory = std::make_unique<ReplayBuffer>(memSize);
-  ale_interface.setInt("random_seed", time(0));
-  ale_interface.setFloat("repeat_action_probability", repeatActionProbability);
-  ale_interface.loadROM(game);
-  rawWidth = static_cast<int>(ale_interface.getScreen().width());
-  rawHeight = static_cast<int>(ale_interface.getScreen().height());
+void AtariEnv::initialize(const std::string &game, int memSize,
+                          uint64_t seed, CodecConfig codec) {
+  initialize(game,
+             std::make_shared<ReplayBuffer>(memSize, 1, 0.0F, seed, codec), 0,
+             seed);
+}
+
+void AtariEnv::initialize(const std::string &game,
+                          std::shared_ptr<ReplayBuffer> sharedMemory, int lane,
+                          uint64_t seed) {
+  memory = std::move(sharedMemory);
+  memoryLane = lane;
+  source = makeFrameSource(
+      game, splitmix64(seed + static_cast<uint64_t>(lane) + 1));
+  rawWidth = source->width();
+  rawHeight = source->height();
   rawFrames.at(0).resize(rawHeight * rawWidth, 0);
   rawFrames.at(1).resize(rawHeight * rawWidth, 0);
+  rgbScreen.resize(3 * rawHeight * rawWidth);
+  endState.resize(stateSize);
+  downsampler = std::make_unique<Downsampler>(rawHeight, rawWidth);
+  fusedPreprocessing = downsampler->matchesReference();
+  if (!fusedPreprocessing) {
+    std::cerr << "Fused preprocessing differs from cv::resize, "
+              << "using cv::resize." << std::endl;
+  }
   obsWin.resize(stateSize, 0);  
-  actionMap = ale_interface.getMinimalActionSet();
-  numActions = static_cast<int>(actionMap.size());
+  numActions = source->actionLength();
   resetObs();
 }
 
 auto AtariEnv::getActionLength() const -> int { return numActions; }
 
 auto AtariEnv::act(action_t action, bool evalmode) -> reward_t {
-  auto rew = act_func(action);
-  if (!evalmode) {
-    FlatState endstate(stateSize);
-    getObs(endstate);
-    if (!framesReached) { // Don't store and train on max step terminations
-      memory->add(action, rew, endstate, episodeDone);
-    }
+  if (evalmode) {
+    transition.stored = false;
+    return act_func(action);
   }
-  return rew;
+  return act(action, endState, evalmode);
 }
 
-auto AtariEnv::act(action_t action, std::span<pixel_t> sbuff) -> reward_t {
+auto AtariEnv::act(action_t action, std::span<pixel_t> sbuff, bool evalmode)
+    -> reward_t {
+  transition.stored = false;
   auto rew = act_func(action);
+  // The window is rotated once, experiences are compressed from the result
   getObs(sbuff);
-  if (!framesReached) { // Don't store and train on max step terminations
-    memory->add(action, rew, sbuff, episodeDone);
+  // Don't store and train on max step terminations
+  if (!evalmode && !framesReached) {
+    store(action, rew, sbuff);
   }
   return rew;
 }
 
+void AtariEnv::store(action_t action, reward_t rew,
+                     std::span<const pixel_t> endstate) {
+  transition = Transition{action,           rew,        episodeDone, true,
+                          framesSinceStore, validFrames};
+  if (memory) {
+    memory->add(action, rew, endstate, episodeDone, framesSinceStore,
+                validFrames, memoryLane);
+  }
+  framesSinceStore = 0;
+}
+
 auto AtariEnv::act_func(action_t action) -> reward_t {
   ++stepCount;
   framesReached = stepCount == endStepMax;
-  auto a = actionMap[action];
-  auto prelives = ale_interface.lives();
+  auto prelives = source->lives();
   reward_t rew = 0.0;
-  for (int t = 0; t < frameSkip; t++) { // Loop ALE by Dopamine logic
-    auto r = ale_interface.act(a);
-    rew += r;
-    scoreCount += r;
-    auto lives = ale_interface.lives();
-    bool life_lost = (lives < prelives);
-    go = ale_interface.game_over();
-    episodeDone = go || life_lost || framesReached;
-    if (episodeDone) {
-      if (go || framesReached) {
-        ale_interface.reset_game();
-        lastEpisodeScore = scoreCount;
-        lastEpisodeSteps = stepCount;
-        stepCount = 0;
-        scoreCount = 0;
+  {
+    ScopedTimer timer(Stat::emulation);
+    for (int t = 0; t < frameSkip; t++) { // Loop ALE by Dopamine logic
+      auto r = source->act(action);
+      rew += r;
+      scoreCount += r;
+      auto lives = source->lives();
+      bool life_lost = (lives < prelives);
+      go = source->gameOver();
+      episodeDone = go || life_lost || framesReached;
+      if (episodeDone) {
+        if (go || framesReached) {
+          source->resetGame();
+          lastEpisodeScore = scoreCount;
+          lastEpisodeSteps = stepCount;
+          stepCount = 0;
+          scoreCount = 0;
+        }
+        resetObs();
+        break;
+      }
+      if (t >= frameSkip - 2) {
+        auto idx = t - (frameSkip - 2);
+        source->grayscale(rawFrames.at(idx));
       }
-      resetObs();
-      break;
-    }
-    if (t >= frameSkip - 2) {
-      auto idx = t - (frameSkip - 2);
-      ale_interface.getScreenGrayscale(rawFrames.at(idx));
     }
   }
   updateObs();
@@ -93,6 +124,13 @@ void AtariEnv::softReset() {
   framesReached = false;
 }
 
+void AtariEnv::hardReset() {
+  source->resetGame();
+  resetObs();
+  softReset();
+  resetCounts();
+}
+
 void AtariEnv::resetCounts() {
   stepCount = 0;
   scoreCount = 0;
@@ -103,37 +141,43 @@ void AtariEnv::getObs(std::span<pixel_t> stateBuffer) const {
   std::rotate_copy(obsWin.begin(), it, obsWin.end(), stateBuffer.begin());
 }
 
-void AtariEnv::getRGB(uint8_t *screenBuffer){
-  std::vector<pixel_t> v(3*rawHeight*rawWidth);
-  ale_interface.getScreenRGB(v);
-  std::copy(v.begin(),v.end(),screenBuffer);
+void AtariEnv::getRGB(uint8_t *screenBuffer) {
+  source->rgb(rgbScreen);
+  std::copy(rgbScreen.begin(), rgbScreen.end(), screenBuffer);
 }
 
 auto AtariEnv::getMemory() const -> ReplayBuffer & { return *memory; }
 
-auto AtariEnv::getALE() -> ale::ALEInterface & { return ale_interface; }
+auto AtariEnv::lastTransition() const -> const Transition & {
+  return transition;
+}
+
+auto AtariEnv::getSource() -> FrameSource & { return *source; }
 
 void AtariEnv::resetObs() {
-  ale_interface.getScreenGrayscale(rawFrames.at(1));
+  source->grayscale(rawFrames.at(1));
   std::fill(obsWin.begin(), obsWin.end(), 0);
   std::fill(rawFrames.at(0).begin(), rawFrames.at(0).end(), 0);
   currentObsFrame = obsWin.begin();
+  validFrames = 0;
   updateObs();
 }
 
 void AtariEnv::updateObs() {
-  // Max pool screens #3 and #4
-  std::transform(rawFrames.at(0).begin(), rawFrames.at(0).end(),
-                 rawFrames.at(1).begin(), rawFrames.at(0).begin(),
-                 [](auto a, auto b) { return std::max(a, b); });
-  cv::Mat rawView(rawHeight, rawWidth, 0, &rawFrames.at(0)[0]);
-  // Rescale to 84x84 and update the current state
+  // Max pool screens #3 and #4, rescale to 84x84 and update the current state
+  ScopedTimer timer(Stat::preprocessing);
   auto curridx = currentObsFrame - obsWin.begin();
-  cv::Mat obsView(obsWidth, obsWidth, 0, &obsWin[curridx]);
-  cv::resize(rawView, obsView, obsView.size(), 0, 0, cv::INTER_AREA);
+  std::span<pixel_t> frame(&obsWin[curridx], frameSize);
+  if (fusedPreprocessing) {
+    downsampler->apply(rawFrames.at(0), rawFrames.at(1), frame);
+  } else {
+    downsampler->reference(rawFrames.at(0), rawFrames.at(1), frame);
+  }
   currentObsFrame = std::next(currentObsFrame, frameSize);
   if (currentObsFrame == obsWin.end()) {
     currentObsFrame = obsWin.begin();
   }
+  ++framesSinceStore;
+  validFrames = std::min(validFrames + 1, obsStack);
 }
 } // namespace c2d
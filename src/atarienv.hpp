@@ -1,8 +1,10 @@
 #ifndef ATARIENV_HPP
 #define ATARIENV_HPP
 #include "common.hpp"
+#include "downsampler.hpp"
+#include "framesource.hpp"
 #include "replaybuffer.hpp"
-#include <ale/ale_interface.hpp>
+#include <memory>
 #include <set>
 
 namespace c2d {
@@ -10,15 +12,36 @@ namespace c2d {
 // Atari Environment
 class AtariEnv {
 public:
-  // Initializes the environment.
-  void initialize(const std::string &game, int memSize);
+  // Experience of the last step, recorded also without memory
+  struct Transition {
+    action_t action = 0;
+    reward_t reward = 0;
+    bool done = false;
+    bool stored = false;
+    int newFrames = 0;
+    int validFrames = 0;
+  };
+  // Initializes the environment of a game, i.e., a ROM path or "synthetic".
+  // The game and the memory are seeded by seed, the memory compresses frames
+  // by codec.
+  void initialize(const std::string &game, int memSize, uint64_t seed = 0,
+                  CodecConfig codec = {});
+  // Initializes the environment as one lane writer of a shared memory. Without
+  // memory, experiences are only recorded as the last transition. Lanes of
+  // the same seed get different ALE seeds.
+  void initialize(const std::string &game,
+                  std::shared_ptr<ReplayBuffer> sharedMemory, int lane,
+                  uint64_t seed = 0);
   // Returns the size of the minimal action set.
   [[nodiscard]] auto getActionLength() const -> int;
   // Steps the environment by an action chosen in [0, <size of the minimal
   // action set>).
   [[nodiscard]] auto act(action_t action, bool evalmode = false) -> reward_t;
-  auto act(action_t action, std::span<pixel_t> sbuff) -> reward_t;
-  // Signals that game over was reached in ALE.
+  // Same, also writes the new observation window into sbuff, from which the
+  // experience is stored. Steps allocate no memory.
+  auto act(action_t action, std::span<pixel_t> sbuff, bool evalmode = false)
+      -> reward_t;
+  // Signals that game over was reached in the game.
   [[nodiscard]] auto gameOver() const -> bool;
   // Signals that the episodic max step was reached.
   [[nodiscard]] auto maxStepReached() const -> bool;
@@ -32,12 +55,16 @@ public:
   [[nodiscard]] auto done() const -> bool;
   // Must be called if done().
   void softReset();
+  // Resets the game, the observations and all counts.
+  void hardReset();
   // Writes the current observation window [4 x 84 x 84] into a stateBuffer.
   void getObs(std::span<pixel_t> stateBuffer) const;
   // Direct access to ReplayBuffer
   [[nodiscard]] auto getMemory() const -> ReplayBuffer &;
-  // Direct access to ALE
-  [[nodiscard]] auto getALE() -> ale::ALEInterface &;
+  // Experience of the last step, stored is false for unstored steps
+  [[nodiscard]] auto lastTransition() const -> const Transition &;
+  // Direct access to the emulated game
+  [[nodiscard]] auto getSource() -> FrameSource &;
   // Nulls and initializes the observations buffer
   void resetObs();
   // RGB dimensions
@@ -47,9 +74,9 @@ public:
   void getRGB(uint8_t *screenBuffer);
 
 private:
-  std::unique_ptr<ReplayBuffer> memory;
-  ale::ALEInterface ale_interface;
-  ale::ActionVect actionMap;
+  std::shared_ptr<ReplayBuffer> memory;
+  int memoryLane = 0;
+  std::unique_ptr<FrameSource> source;
   int numActions;
   bool episodeDone = false;
   bool go = false;
@@ -59,9 +86,20 @@ private:
   reward_t scoreCount = 0;
   reward_t lastEpisodeScore = 0;
   std::array<Frame, 2> rawFrames;
+  std::vector<pixel_t> rgbScreen;
+  // End state of steps without an external state buffer
+  FlatState endState;
+  std::unique_ptr<Downsampler> downsampler;
+  // Preprocessing by the fused kernel, unless it differs from cv::resize
+  bool fusedPreprocessing = true;
   ObsWindow obsWin;
   std::vector<pixel_t>::const_iterator currentObsFrame = obsWin.begin();
+  // Frames written since the last stored experience and since the last reset
+  int framesSinceStore = 0;
+  int validFrames = 0;
+  Transition transition;
   void updateObs();
+  void store(action_t action, reward_t rew, std::span<const pixel_t> endstate);
   [[nodiscard]] auto act_func(action_t action) -> reward_t;
 };
 } // namespace c2d
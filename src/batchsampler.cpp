@@ -0,0 +1,200 @@
+#include "batchsampler.hpp"
+#include "common.hpp"
+#include "stats.hpp"
+#include <algorithm>
+#include <array>
+#include <cstdlib>
+#include <memory>
+#include <new>
+
+namespace c2d {
+
+namespace {
+constexpr size_t pageSize = 4096;
+constexpr size_t alignUp(size_t n) { return (n + pageSize - 1) & ~(pageSize - 1); }
+
+// Owner of an exported tensor and its shape
+struct ExportedItem {
+  DLManagedTensor managed{};
+  std::array<int64_t, 4> shape{};
+  BatchSampler *sampler = nullptr;
+  int slot = 0;
+};
+
+void deleteExported(DLManagedTensor *self) {
+  auto *exported = static_cast<ExportedItem *>(self->manager_ctx);
+  exported->sampler->release(exported->slot);
+  delete exported;
+}
+} // namespace
+
+BatchSampler::BatchSampler(ReplayBuffer &memory, int depth)
+    : memory(memory), slots(depth) {
+  constexpr size_t stateBytes = alignUp(batchSizeOne * stateSize);
+  constexpr size_t scalarBytes = alignUp(batchSizeOne * sizeof(float));
+  constexpr size_t slotBytes = 2 * stateBytes + 5 * scalarBytes;
+  for (auto &slot : slots) {
+    auto *raw = static_cast<pixel_t *>(std::aligned_alloc(pageSize, slotBytes));
+    if (raw == nullptr) {
+      throw std::bad_alloc();
+    }
+    slot.data.reset(raw);
+    auto *bs = raw;
+    auto *bes = raw + stateBytes;
+    auto *ba = raw + 2 * stateBytes;
+    auto *br = reinterpret_cast<float *>(ba + scalarBytes);
+    auto *bd = reinterpret_cast<float *>(ba + 2 * scalarBytes);
+    auto *bi = reinterpret_cast<int *>(ba + 3 * scalarBytes);
+    auto *bw = reinterpret_cast<float *>(ba + 4 * scalarBytes);
+    slot.view = BatchView{{bs, batchSizeOne * stateSize},
+                          {ba, batchSizeOne},
+                          {br, batchSizeOne},
+                          {bes, batchSizeOne * stateSize},
+                          {bd, batchSizeOne},
+                          {bi, batchSizeOne},
+                          {bw, batchSizeOne}};
+  }
+}
+
+BatchSampler::~BatchSampler() { stop(); }
+
+void BatchSampler::start() {
+  stop();
+  for (auto &slot : slots) {
+    if (slot.state == SlotState::Ready) {
+      slot.state = SlotState::Free;
+    }
+  }
+  fillPos = acquirePos;
+  worker = std::jthread([this](const std::stop_token &st) { work(st); });
+}
+
+void BatchSampler::stop() {
+  if (worker.joinable()) {
+    {
+      std::lock_guard lock(mtx);
+      worker.request_stop();
+    }
+    cv.notify_all();
+    worker.join();
+  }
+}
+
+auto BatchSampler::depth() const -> int {
+  return static_cast<int>(slots.size());
+}
+
+auto BatchSampler::ready() -> int {
+  std::lock_guard lock(mtx);
+  return static_cast<int>(std::count_if(
+      slots.begin(), slots.end(),
+      [](const Slot &slot) { return slot.state == SlotState::Ready; }));
+}
+
+auto BatchSampler::acquire() -> int {
+  std::unique_lock lock(mtx);
+  {
+    ScopedTimer timer(Stat::acquire);
+    cv.wait(lock, [this] {
+      return slots[acquirePos].state == SlotState::Ready;
+    });
+  }
+  auto slot = acquirePos;
+  slots[slot].state = SlotState::Acquired;
+  slots[slot].leases = 1;
+  acquirePos = (acquirePos + 1) % depth();
+  return slot;
+}
+
+void BatchSampler::retain(int slot) {
+  std::lock_guard lock(mtx);
+  slots[slot].leases++;
+}
+
+void BatchSampler::release(int slot) {
+  {
+    std::lock_guard lock(mtx);
+    if (--slots[slot].leases > 0) {
+      return;
+    }
+    slots[slot].state = SlotState::Free;
+  }
+  cv.notify_all();
+}
+
+auto BatchSampler::view(int slot) const -> BatchView { return slots[slot].view; }
+
+auto BatchSampler::exportItem(int slot, int item) -> DLManagedTensor * {
+  constexpr DLDataType uint8Type{kDLUInt, 8, 1};
+  constexpr DLDataType int32Type{kDLInt, 32, 1};
+  constexpr DLDataType floatType{kDLFloat, 32, 1};
+  const auto &view = slots[slot].view;
+  auto exported = std::make_unique<ExportedItem>();
+  auto &tensor = exported->managed.dl_tensor;
+  // States are [B x 4 x 84 x 84], all other items [B]
+  exported->shape = {batchSizeOne, obsStack, obsWidth, obsWidth};
+  tensor.shape = exported->shape.data();
+  tensor.ndim = 1;
+  tensor.device = {kDLCPU, 0};
+  switch (item) {
+  case 0:
+    tensor.data = view.bs.data();
+    tensor.ndim = 4;
+    tensor.dtype = uint8Type;
+    break;
+  case 1:
+    tensor.data = view.ba.data();
+    tensor.dtype = uint8Type;
+    break;
+  case 2:
+    tensor.data = view.br.data();
+    tensor.dtype = floatType;
+    break;
+  case 3:
+    tensor.data = view.bes.data();
+    tensor.ndim = 4;
+    tensor.dtype = uint8Type;
+    break;
+  case 4:
+    tensor.data = view.bd.data();
+    tensor.dtype = floatType;
+    break;
+  case 5:
+    tensor.data = view.bi.data();
+    tensor.dtype = int32Type;
+    break;
+  default:
+    tensor.data = view.bw.data();
+    tensor.dtype = floatType;
+  }
+  exported->sampler = this;
+  exported->slot = slot;
+  exported->managed.manager_ctx = exported.get();
+  exported->managed.deleter = deleteExported;
+  retain(slot);
+  return &exported.release()->managed;
+}
+
+void BatchSampler::work(const std::stop_token &stoken) {
+  while (true) {
+    {
+      std::unique_lock lock(mtx);
+      cv.wait(lock, [&] {
+        return stoken.stop_requested() ||
+               slots[fillPos].state == SlotState::Free;
+      });
+      if (stoken.stop_requested()) {
+        return;
+      }
+    }
+    // Only this thread writes free slots, so sampling runs without the lock
+    memory.sample(slots[fillPos].view);
+    {
+      std::lock_guard lock(mtx);
+      slots[fillPos].state = SlotState::Ready;
+      fillPos = (fillPos + 1) % depth();
+    }
+    cv.notify_all();
+  }
+}
+} // namespace c2d
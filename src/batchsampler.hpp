@@ -0,0 +1,65 @@
+#ifndef BATCHSAMPLER_HPP
+#define BATCHSAMPLER_HPP
+#include "common.hpp"
+#include "dlpack.hpp"
+#include "replaybuffer.hpp"
+#include <condition_variable>
+#include <memory>
+#include <mutex>
+#include <thread>
+
+namespace c2d {
+
+// Samples batches from a ReplayBuffer on a background thread into a ring of
+// preallocated batch slots. A consumer acquires ready slots in ring order and
+// owns them until released, after which the slot is refilled. Acquired slots
+// can be leased out further, e.g. as DLPack tensors, and are refilled only
+// after every lease is released.
+class BatchSampler {
+public:
+  BatchSampler(ReplayBuffer &memory, int depth);
+  BatchSampler(const BatchSampler &) = delete;
+  auto operator=(const BatchSampler &) -> BatchSampler & = delete;
+  ~BatchSampler();
+  // Starts the sampling thread, all slots are (re)filled.
+  void start();
+  // Stops the sampling thread, acquired slots stay valid.
+  void stop();
+  // Number of batch slots.
+  [[nodiscard]] auto depth() const -> int;
+  // Number of ready batches.
+  [[nodiscard]] auto ready() -> int;
+  // Blocks until the next batch is ready and hands over its slot.
+  [[nodiscard]] auto acquire() -> int;
+  // Adds a lease to an acquired slot, which needs one more release.
+  void retain(int slot);
+  // Releases a lease, the slot returns to the sampler with the last one.
+  void release(int slot);
+  // View of the batch buffers of a slot.
+  [[nodiscard]] auto view(int slot) const -> BatchView;
+  // Exports a batch item of an acquired slot in the order (s, a, r, es, d,
+  // indices, weights) as a CPU tensor without copy. The tensor holds a lease
+  // of the slot until its deleter is called, and must not outlive the
+  // sampler.
+  [[nodiscard]] auto exportItem(int slot, int item) -> DLManagedTensor *;
+
+private:
+  enum class SlotState { Free, Ready, Acquired };
+  // Page aligned batch buffers [bs | bes | ba | br | bd | bi | bw] of a slot
+  struct Slot {
+    std::unique_ptr<pixel_t[], decltype(&std::free)> data{nullptr, &std::free};
+    BatchView view;
+    SlotState state = SlotState::Free;
+    int leases = 0;
+  };
+  ReplayBuffer &memory;
+  std::vector<Slot> slots;
+  int fillPos = 0;
+  int acquirePos = 0;
+  std::mutex mtx;
+  std::condition_variable cv;
+  std::jthread worker;
+  void work(const std::stop_token &stoken);
+};
+} // namespace c2d
+#endif // BATCHSAMPLER_HPP
@@ -1,20 +1,25 @@
+#include "allocationcounter.hpp"
 #include "atarienv.hpp"
+#include "batchsampler.hpp"
 #include "common.hpp"
+#include "downsampler.hpp"
+#include "framearena.hpp"
+#include "stats.hpp"
+#include "vecatarienv.hpp"
+#include <array>
+#include <chrono>
+#include <random>
 // For data exchange with single environment Python wrappers
 extern "C" {
 c2d::AtariEnv *newEnv() { return new c2d::AtariEnv(); }
 void delEnv(c2d::AtariEnv *env) { delete env; }
-void initEnv(c2d::AtariEnv *env, const char *game, int memSize) {
-  env->initialize(game, memSize);
+void initEnv(c2d::AtariEnv *env, const char *game, int memSize,
+             uint64_t seed, int codec, int level) {
+  env->initialize(game, memSize, seed,
+                  {static_cast<c2d::Codec>(codec), level});
 }
 void resetEnv(c2d::AtariEnv *env) { env->softReset(); }
-void hardResetEnv(c2d::AtariEnv *env) {
-  auto &ale = env->getALE();
-  ale.reset_game();
-  env->resetObs();
-  env->softReset();
-  env->resetCounts();
-}
+void hardResetEnv(c2d::AtariEnv *env) { env->hardReset(); }
 void getObsEnv(c2d::AtariEnv *env, uint8_t *stateBuffer) {
   env->getObs({stateBuffer, c2d::stateSize});
 }
@@ -33,6 +38,10 @@ int episodeScoreEnv(c2d::AtariEnv *env) { return env->episodeScore(); }
 int actEnv(c2d::AtariEnv *env, uint8_t action, bool evalmode) {
   return env->act(action, evalmode);
 }
+int actObsEnv(c2d::AtariEnv *env, uint8_t action, bool evalmode,
+              uint8_t *stateBuffer) {
+  return env->act(action, {stateBuffer, c2d::stateSize}, evalmode);
+}
 bool doneEnv(c2d::AtariEnv *env) { return env->done(); }
 bool gameOverEnv(c2d::AtariEnv *env) { return env->gameOver(); }
 bool maxStepReachedEnv(c2d::AtariEnv *env) { return env->maxStepReached(); }
@@ -47,3 +56,279 @@ void prefetchBatchEnv(c2d::AtariEnv *env, uint8_t *sbuff, uint8_t *abuff,
   env->getMemory().sample(batch.subspan(pos, count));
 }
 }
+
+// For data exchange with vectorized environment Python wrappers
+extern "C" {
+c2d::VecAtariEnv *newVecEnv() { return new c2d::VecAtariEnv(); }
+void delVecEnv(c2d::VecAtariEnv *env) { delete env; }
+void initVecEnv(c2d::VecAtariEnv *env, const char *game, int numEnvs,
+                int memSize, int numThreads, float priorityExponent,
+                uint64_t seed, int codec, int level) {
+  env->initialize(game, numEnvs, memSize, numThreads, priorityExponent, seed,
+                  {static_cast<c2d::Codec>(codec), level});
+}
+int numEnvsVecEnv(c2d::VecAtariEnv *env) { return env->size(); }
+int actionLengthVecEnv(c2d::VecAtariEnv *env) {
+  return env->getActionLength();
+}
+void stepVecEnv(c2d::VecAtariEnv *env, const uint8_t *actions,
+                uint8_t *stateBuffer, bool *terminals, int *rewards,
+                int *episodeSteps, int *episodeScores) {
+  auto n = static_cast<size_t>(env->size());
+  env->step({actions, n}, {stateBuffer, n * c2d::stateSize}, {terminals, n},
+            {rewards, n}, {episodeSteps, n}, {episodeScores, n});
+}
+void stepAsyncVecEnv(c2d::VecAtariEnv *env, const uint8_t *actions,
+                     uint8_t *stateBuffer, bool *terminals, int *rewards,
+                     int *episodeSteps, int *episodeScores) {
+  auto n = static_cast<size_t>(env->size());
+  env->stepAsync({actions, n}, {stateBuffer, n * c2d::stateSize},
+                 {terminals, n}, {rewards, n}, {episodeSteps, n},
+                 {episodeScores, n});
+}
+void waitVecEnv(c2d::VecAtariEnv *env) { env->wait(); }
+void getObsVecEnv(c2d::VecAtariEnv *env, uint8_t *stateBuffer) {
+  auto n = static_cast<size_t>(env->size());
+  env->getObs({stateBuffer, n * c2d::stateSize});
+}
+void hardResetVecEnv(c2d::VecAtariEnv *env) { env->hardReset(); }
+c2d::ReplayBuffer *getMemoryVecEnv(c2d::VecAtariEnv *env) {
+  return env->hasMemory() ? &env->getMemory() : nullptr;
+}
+void transitionsVecEnv(c2d::VecAtariEnv *env, uint8_t *actions, int *rewards,
+                       bool *dones, bool *stored, int *newFrames,
+                       int *validFrames) {
+  auto n = static_cast<size_t>(env->size());
+  env->transitions({actions, n}, {rewards, n}, {dones, n}, {stored, n},
+                   {newFrames, n}, {validFrames, n});
+}
+int64_t residentBytesVecEnv(c2d::VecAtariEnv *env) {
+  if (!env->hasMemory()) {
+    return 0;
+  }
+  env->wait();
+  return static_cast<int64_t>(env->getMemory().residentBytes());
+}
+void saveMemoryVecEnv(c2d::VecAtariEnv *env, const char *path) {
+  env->saveMemory(path);
+}
+bool loadMemoryVecEnv(c2d::VecAtariEnv *env, const char *path) {
+  return env->loadMemory(path);
+}
+void prefetchBatchVecEnv(c2d::VecAtariEnv *env, uint8_t *sbuff,
+                         uint8_t *abuff, float *rbuff, uint8_t *esbuff,
+                         float *dbuff, int pos, int count) {
+  c2d::BatchView batch{{sbuff, c2d::batchSizeOne * c2d::stateSize},
+                       {abuff, c2d::batchSizeOne},
+                       {rbuff, c2d::batchSizeOne},
+                       {esbuff, c2d::batchSizeOne * c2d::stateSize},
+                       {dbuff, c2d::batchSizeOne}};
+  // Sampling is safe while workers add, but waiting samples the experiences of
+  // all taken steps, such that environments of a seed sample the same batches
+  env->wait();
+  env->getMemory().sample(batch.subspan(pos, count));
+}
+}
+
+// For replay memories without environments and priority updates
+extern "C" {
+c2d::ReplayBuffer *newMemory(int memSize, int laneCount,
+                             float priorityExponent, uint64_t seed, int codec,
+                             int level) {
+  return new c2d::ReplayBuffer(memSize, laneCount, priorityExponent, seed,
+                               {static_cast<c2d::Codec>(codec), level});
+}
+void delMemory(c2d::ReplayBuffer *memory) { delete memory; }
+// Adds count experiences, item i brings newFrames[i] frames of frames
+void addFramesMemory(c2d::ReplayBuffer *memory, int count, const int *lanes,
+                     const uint8_t *actions, const int *rewards,
+                     const bool *dones, const int *newFrames,
+                     const int *validFrames, const uint8_t *frames) {
+  size_t pos = 0;
+  for (int i = 0; i < count; i++) {
+    auto bytes = static_cast<size_t>(newFrames[i]) * c2d::frameSize;
+    memory->addFrames(actions[i], rewards[i], {frames + pos, bytes}, dones[i],
+                      validFrames[i], lanes[i]);
+    pos += bytes;
+  }
+}
+void sampleMemory(c2d::ReplayBuffer *memory, uint8_t *sbuff, uint8_t *abuff,
+                  float *rbuff, uint8_t *esbuff, float *dbuff) {
+  memory->sample({{sbuff, c2d::batchSizeOne * c2d::stateSize},
+                  {abuff, c2d::batchSizeOne},
+                  {rbuff, c2d::batchSizeOne},
+                  {esbuff, c2d::batchSizeOne * c2d::stateSize},
+                  {dbuff, c2d::batchSizeOne}});
+}
+int64_t residentBytesMemory(c2d::ReplayBuffer *memory) {
+  return static_cast<int64_t>(memory->residentBytes());
+}
+void updatePrioritiesMemory(c2d::ReplayBuffer *memory, const int *indices,
+                            const float *priorities, int count) {
+  auto n = static_cast<size_t>(count);
+  memory->updatePriorities({indices, n}, {priorities, n});
+}
+void setImportanceExponentMemory(c2d::ReplayBuffer *memory, float exponent) {
+  memory->setImportanceExponent(exponent);
+}
+bool prioritizedMemory(c2d::ReplayBuffer *memory) {
+  return memory->prioritized();
+}
+void saveMemory(c2d::ReplayBuffer *memory, const char *path) {
+  memory->save(path);
+}
+bool loadMemory(c2d::ReplayBuffer *memory, const char *path) {
+  return memory->load(path);
+}
+}
+
+// For data exchange with background batch sampler Python wrappers
+extern "C" {
+c2d::BatchSampler *newSampler(c2d::ReplayBuffer *memory, int depth) {
+  return new c2d::BatchSampler(*memory, depth);
+}
+void delSampler(c2d::BatchSampler *sampler) { delete sampler; }
+void startSampler(c2d::BatchSampler *sampler) { sampler->start(); }
+void stopSampler(c2d::BatchSampler *sampler) { sampler->stop(); }
+int readySampler(c2d::BatchSampler *sampler) { return sampler->ready(); }
+int acquireSampler(c2d::BatchSampler *sampler) { return sampler->acquire(); }
+void releaseSampler(c2d::BatchSampler *sampler, int slot) {
+  sampler->release(slot);
+}
+// Item order follows the batch tuple (s, a, r, es, d, indices, weights)
+void *bufferSampler(c2d::BatchSampler *sampler, int slot, int item) {
+  auto view = sampler->view(slot);
+  switch (item) {
+  case 0:
+    return view.bs.data();
+  case 1:
+    return view.ba.data();
+  case 2:
+    return view.br.data();
+  case 3:
+    return view.bes.data();
+  case 4:
+    return view.bd.data();
+  case 5:
+    return view.bi.data();
+  default:
+    return view.bw.data();
+  }
+}
+// Exports a batch item of an acquired slot as DLPack tensor holding a lease
+DLManagedTensor *exportSampler(c2d::BatchSampler *sampler, int slot, int item) {
+  return sampler->exportItem(slot, item);
+}
+}
+
+// Native micro-benchmarks without ALE
+extern "C" {
+// Preprocessing time in ns/frame of screens [height x width], by the fused
+// kernel or by std::max and cv::resize. Screens are random 4x4 blocks.
+double benchPreprocess(int height, int width, int frames, bool fused) {
+  std::mt19937 rng(0);
+  std::uniform_int_distribution<int> pixel(0, 255);
+  const int blockWidth = width / 4 + 2;
+  std::vector<c2d::pixel_t> blocks((height / 4 + 1) * blockWidth);
+  for (auto &block : blocks) {
+    block = static_cast<c2d::pixel_t>(pixel(rng));
+  }
+  // The second screen is the first one moved by one block
+  std::vector<c2d::pixel_t> first(height * width);
+  std::vector<c2d::pixel_t> second(height * width);
+  for (int y = 0; y < height; y++) {
+    for (int x = 0; x < width; x++) {
+      first[y * width + x] = blocks[(y / 4) * blockWidth + x / 4];
+      second[y * width + x] = blocks[(y / 4) * blockWidth + (x / 4 + 1)];
+    }
+  }
+  c2d::Downsampler downsampler(height, width);
+  std::vector<c2d::pixel_t> frame(c2d::frameSize);
+  auto start = std::chrono::steady_clock::now();
+  for (int t = 0; t < frames; t++) {
+    if (fused) {
+      downsampler.apply(first, second, frame);
+    } else {
+      downsampler.reference(first, second, frame);
+    }
+  }
+  std::chrono::duration<double, std::nano> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / frames;
+}
+// Signals that the fused kernel matches cv::resize on screens [height x width]
+bool checkPreprocess(int height, int width) {
+  return c2d::Downsampler(height, width).matchesReference();
+}
+// Stores count frames by a codec at a level and decompresses samples random
+// ones. Writes the compression ratio and ns/frame of adds and of samples.
+void benchCodec(int codec, int level, const uint8_t *frames, int count,
+                int samples, double *results) {
+  c2d::FrameArena arena(count, {static_cast<c2d::Codec>(codec), level});
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < count; i++) {
+    arena.push({frames + static_cast<size_t>(i) * c2d::frameSize,
+                c2d::frameSize});
+  }
+  std::chrono::duration<double, std::nano> added =
+      std::chrono::steady_clock::now() - start;
+  std::mt19937 rng(0);
+  std::uniform_int_distribution<int> fno(0, count - 1);
+  std::vector<c2d::pixel_t> frame(c2d::frameSize);
+  start = std::chrono::steady_clock::now();
+  for (int s = 0; s < samples; s++) {
+    arena.get(fno(rng), frame);
+  }
+  std::chrono::duration<double, std::nano> sampled =
+      std::chrono::steady_clock::now() - start;
+  results[0] = static_cast<double>(count) * c2d::frameSize /
+               static_cast<double>(arena.storedBytes());
+  results[1] = added.count() / count;
+  results[2] = sampled.count() / samples;
+}
+// Allocations by the library so far, -1 unless built with
+// C2D_COUNT_ALLOCATIONS
+int64_t allocationCount() { return c2d::allocationCount(); }
+// Times the hot path sections if timing is set and traces their runs in
+// addition if tracing is set
+void setStatsEnabled(bool timing, bool tracing) {
+  c2d::stats().enable(timing, tracing);
+}
+int statsCount() { return c2d::numStats; }
+int statsBuckets() { return c2d::histogramBuckets; }
+const char *statName(int stat) {
+  return c2d::Stats::name(static_cast<c2d::Stat>(stat));
+}
+// Copies counts and ns sums [statsCount] and log2 ns histograms [statsCount x
+// statsBuckets] of the sections, zeroes them if reset is set
+void readStats(int64_t *counts, int64_t *nanos, int64_t *histograms,
+               bool reset) {
+  constexpr auto n = static_cast<size_t>(c2d::numStats);
+  c2d::stats().read({counts, n}, {nanos, n},
+                    {histograms, n * c2d::histogramBuckets}, reset);
+}
+// Moves up to capacity trace events of 24 bytes (stat, thread, start ns,
+// duration ns) into events, returns their number
+int drainTraceStats(c2d::TraceEvent *events, int capacity) {
+  return c2d::stats().drainTrace({events, static_cast<size_t>(capacity)});
+}
+int64_t droppedTraceStats() { return c2d::stats().droppedEvents(); }
+// Returns the ns of an empty timed scope, with timing disabled or enabled.
+// Disables timing and resets the statistics, it is meant for benchmarks.
+double benchStats(int iterations, bool enabled) {
+  auto &st = c2d::stats();
+  st.enable(enabled, false);
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < iterations; i++) {
+    c2d::ScopedTimer timer(c2d::Stat::acquire);
+  }
+  std::chrono::duration<double, std::nano> elapsed =
+      std::chrono::steady_clock::now() - start;
+  st.enable(false, false);
+  std::array<int64_t, c2d::numStats> counts{};
+  std::array<int64_t, c2d::numStats> nanos{};
+  std::array<int64_t, c2d::numStats * c2d::histogramBuckets> histograms{};
+  st.read(counts, nanos, histograms, true);
+  return elapsed.count() / iterations;
+}
+}
@@ -30,11 +30,17 @@ struct BatchView {
   std::span<float> br{};
   std::span<pixel_t> bes{};
   std::span<float> bd{};
+  // Optional sampled memory indices and importance weights
+  std::span<int> bi{};
+  std::span<float> bw{};
   [[nodiscard]] auto subspan(int pos, int count) const -> BatchView {
     return BatchView{bs.subspan(pos * stateSize, count * stateSize),
-                     ba.subspan(pos, count), br.subspan(pos, count),
+                     ba.subspan(pos, count),
+                     br.subspan(pos, count),
                      bes.subspan(pos * stateSize, count * stateSize),
-                     bd.subspan(pos, count)};
+                     bd.subspan(pos, count),
+                     bi.empty() ? bi : bi.subspan(pos, count),
+                     bw.empty() ? bw : bw.subspan(pos, count)};
   }
 };
 
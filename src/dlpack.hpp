@@ -0,0 +1,36 @@
+#ifndef DLPACK_HPP
+#define DLPACK_HPP
+#include <cstdint>
+
+// Tensor structs of the DLPack ABI (v0.6), by which frameworks take over
+// foreign buffers without a copy. Only the parts used here are declared.
+extern "C" {
+enum DLDeviceType : int32_t { kDLCPU = 1 };
+enum DLDataTypeCode : uint8_t { kDLInt = 0U, kDLUInt = 1U, kDLFloat = 2U };
+struct DLDevice {
+  DLDeviceType device_type;
+  int32_t device_id;
+};
+struct DLDataType {
+  uint8_t code;
+  uint8_t bits;
+  uint16_t lanes;
+};
+struct DLTensor {
+  void *data;
+  DLDevice device;
+  int32_t ndim;
+  DLDataType dtype;
+  int64_t *shape;
+  // Null for compact row-major tensors
+  int64_t *strides;
+  uint64_t byte_offset;
+};
+// The consumer calls deleter once it no longer needs the tensor.
+struct DLManagedTensor {
+  DLTensor dl_tensor;
+  void *manager_ctx;
+  void (*deleter)(DLManagedTensor *self);
+};
+}
+#endif // DLPACK_HPP
@@ -0,0 +1,22 @@
+// Python.h must come first, it sets feature macros of the standard headers
+#include <Python.h>
+
+#include "dlpack.hpp"
+
+// Destructor of the DLPack capsules of Python wrappers. The library is loaded
+// into the interpreter, which provides the Python symbols.
+extern "C" {
+// Frameworks rename the capsules they consume to "used_dltensor" and call the
+// deleter once their tensor is freed. Capsules dropped before that still own
+// their tensor, i.e., the lease of a batch slot, which is returned here.
+void deleteCapsule(PyObject *capsule) {
+  if (PyCapsule_IsValid(capsule, "dltensor") == 0) {
+    return;
+  }
+  auto *managed = static_cast<DLManagedTensor *>(
+      PyCapsule_GetPointer(capsule, "dltensor"));
+  if (managed->deleter != nullptr) {
+    managed->deleter(managed);
+  }
+}
+}
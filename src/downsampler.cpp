@@ -0,0 +1,144 @@
+#include "downsampler.hpp"
+#include <algorithm>
+#include <cmath>
+#include <opencv2/imgproc.hpp>
+#include <utility>
+
+// Built with -ffp-contract=off, see CMakeLists.txt
+namespace c2d {
+
+namespace {
+// Weights of computeResizeAreaTab in OpenCV, grouped by target pixel
+auto areaTaps(int srcSize, int dstSize) -> Downsampler::Taps {
+  const double scale = 1.0 / (static_cast<double>(dstSize) / srcSize);
+  std::vector<std::vector<std::pair<int, float>>> entries(dstSize);
+  for (int d = 0; d < dstSize; d++) {
+    auto &entry = entries[d];
+    double fs1 = d * scale;
+    double fs2 = fs1 + scale;
+    double cellWidth = std::min(scale, srcSize - fs1);
+    int s1 = static_cast<int>(std::ceil(fs1));
+    int s2 = std::min(static_cast<int>(std::floor(fs2)), srcSize - 1);
+    s1 = std::min(s1, s2);
+    if (s1 - fs1 > 1e-3) {
+      entry.emplace_back(s1 - 1, static_cast<float>((s1 - fs1) / cellWidth));
+    }
+    for (int s = s1; s < s2; s++) {
+      entry.emplace_back(s, static_cast<float>(1.0 / cellWidth));
+    }
+    if (fs2 - s2 > 1e-3) {
+      auto part = std::min(std::min(fs2 - s2, 1.0), cellWidth);
+      entry.emplace_back(s2, static_cast<float>(part / cellWidth));
+    }
+  }
+  Downsampler::Taps taps;
+  for (const auto &entry : entries) {
+    taps.count = std::max(taps.count, static_cast<int>(entry.size()));
+  }
+  taps.index.resize(taps.count * dstSize);
+  taps.weight.resize(taps.count * dstSize, 0.0F);
+  for (int d = 0; d < dstSize; d++) {
+    const auto &entry = entries[d];
+    for (int k = 0; k < taps.count; k++) {
+      // Adding a zero weighted source pixel leaves sums unchanged
+      auto used = k < static_cast<int>(entry.size());
+      taps.index[k * dstSize + d] = used ? entry[k].first : entry[0].first;
+      taps.weight[k * dstSize + d] = used ? entry[k].second : 0.0F;
+    }
+  }
+  return taps;
+}
+
+// Rounds half to even and saturates like cv::saturate_cast<uchar>(float)
+auto saturate(float value) -> pixel_t {
+  return static_cast<pixel_t>(
+      std::clamp(std::nearbyint(value), 0.0F, 255.0F));
+}
+} // namespace
+
+Downsampler::Downsampler(int srcHeight, int srcWidth, int dstHeight,
+                         int dstWidth)
+    : srcHeight(srcHeight), srcWidth(srcWidth), dstHeight(dstHeight),
+      dstWidth(dstWidth), xTaps(areaTaps(srcWidth, dstWidth)),
+      yTaps(areaTaps(srcHeight, dstHeight)), pooled(srcHeight * srcWidth),
+      columns(srcHeight * dstWidth), sums(dstWidth) {}
+
+void Downsampler::apply(std::span<const pixel_t> first,
+                        std::span<const pixel_t> second,
+                        std::span<pixel_t> frame) {
+  // Horizontal pass, every source row is pooled and downsampled once
+  for (int y = 0; y < srcHeight; y++) {
+    const auto *a = first.data() + y * srcWidth;
+    const auto *b = second.data() + y * srcWidth;
+    auto *row = pooled.data();
+    for (int x = 0; x < srcWidth; x++) {
+      row[x] = std::max(a[x], b[x]);
+    }
+    auto *col = columns.data() + y * dstWidth;
+    std::fill_n(col, dstWidth, 0.0F);
+    for (int k = 0; k < xTaps.count; k++) {
+      const auto *index = xTaps.index.data() + k * dstWidth;
+      const auto *weight = xTaps.weight.data() + k * dstWidth;
+      for (int d = 0; d < dstWidth; d++) {
+        col[d] += static_cast<float>(row[index[d]]) * weight[d];
+      }
+    }
+  }
+  // Vertical pass over the downsampled rows
+  auto *sum = sums.data();
+  for (int d = 0; d < dstHeight; d++) {
+    for (int k = 0; k < yTaps.count; k++) {
+      const auto *col =
+          columns.data() + yTaps.index[k * dstHeight + d] * dstWidth;
+      auto weight = yTaps.weight[k * dstHeight + d];
+      if (k == 0) {
+        for (int x = 0; x < dstWidth; x++) {
+          sum[x] = weight * col[x];
+        }
+      } else {
+        for (int x = 0; x < dstWidth; x++) {
+          sum[x] += weight * col[x];
+        }
+      }
+    }
+    auto *out = frame.data() + d * dstWidth;
+    for (int x = 0; x < dstWidth; x++) {
+      out[x] = saturate(sum[x]);
+    }
+  }
+}
+
+void Downsampler::reference(std::span<const pixel_t> first,
+                            std::span<const pixel_t> second,
+                            std::span<pixel_t> frame) {
+  std::transform(first.begin(), first.end(), second.begin(), pooled.begin(),
+                 [](auto a, auto b) { return std::max(a, b); });
+  cv::Mat rawView(srcHeight, srcWidth, 0, pooled.data());
+  cv::Mat frameView(dstHeight, dstWidth, 0, frame.data());
+  cv::resize(rawView, frameView, frameView.size(), 0, 0, cv::INTER_AREA);
+}
+
+auto Downsampler::matchesReference() -> bool {
+  const auto srcSize = static_cast<size_t>(srcHeight * srcWidth);
+  std::vector<pixel_t> first(srcSize);
+  std::vector<pixel_t> second(srcSize);
+  std::vector<pixel_t> fused(dstHeight * dstWidth);
+  std::vector<pixel_t> expected(dstHeight * dstWidth);
+  // Noise covers all rounding cases, a gradient all pixel values
+  uint32_t state = 12345;
+  for (int test = 0; test < 4; test++) {
+    for (size_t i = 0; i < srcSize; i++) {
+      state = state * 1664525U + 1013904223U;
+      first[i] = test == 0 ? static_cast<pixel_t>(i % 256)
+                           : static_cast<pixel_t>(state >> 24U);
+      second[i] = test < 2 ? 0 : static_cast<pixel_t>(state >> 16U);
+    }
+    apply(first, second, fused);
+    reference(first, second, expected);
+    if (fused != expected) {
+      return false;
+    }
+  }
+  return true;
+}
+} // namespace c2d
@@ -0,0 +1,49 @@
+#ifndef DOWNSAMPLER_HPP
+#define DOWNSAMPLER_HPP
+#include "common.hpp"
+#include <span>
+#include <vector>
+
+namespace c2d {
+
+// Max pools two grayscale screens and downsamples the result by area
+// averaging in one pass over the screens. Weights and the order of float
+// operations follow cv::resize with INTER_AREA, such that frames are
+// bit-identical to max pooling followed by cv::resize.
+class Downsampler {
+public:
+  Downsampler(int srcHeight, int srcWidth, int dstHeight = obsWidth,
+              int dstWidth = obsWidth);
+  // Writes the downsampled maximum of two screens [srcHeight x srcWidth]
+  // into a frame [dstHeight x dstWidth].
+  void apply(std::span<const pixel_t> first, std::span<const pixel_t> second,
+             std::span<pixel_t> frame);
+  // Same by std::max and cv::resize.
+  void reference(std::span<const pixel_t> first,
+                 std::span<const pixel_t> second, std::span<pixel_t> frame);
+  // Compares apply with reference on test screens.
+  [[nodiscard]] auto matchesReference() -> bool;
+
+  // Area weights of one axis, target pixel d sums the source pixels
+  // index[k * dstSize + d] by weight[k * dstSize + d] in order k < count.
+  // Unused taps have weight 0.
+  struct Taps {
+    int count = 0;
+    std::vector<int> index;
+    std::vector<float> weight;
+  };
+
+private:
+  int srcHeight;
+  int srcWidth;
+  int dstHeight;
+  int dstWidth;
+  Taps xTaps;
+  Taps yTaps;
+  // Max pooled source row, and all source rows downsampled horizontally
+  std::vector<pixel_t> pooled;
+  std::vector<float> columns;
+  std::vector<float> sums;
+};
+} // namespace c2d
+#endif // DOWNSAMPLER_HPP
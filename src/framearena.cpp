@@ -0,0 +1,181 @@
+#include "framearena.hpp"
+#include "common.hpp"
+#include <algorithm>
+#include <array>
+#include <cstring>
+#include <iostream>
+#include <stdexcept>
+
+namespace c2d {
+
+FrameArena::FrameArena(int frameCapacity, CodecConfig codecConfig)
+    : capacity(frameCapacity), index(frameCapacity), codec(codecConfig) {}
+
+void FrameArena::push(std::span<const pixel_t> frame) {
+  if (active.empty() ||
+      chunks[active.back()].used + frameBound > arenaChunkSize) {
+    nextChunk();
+  }
+  auto id = active.back();
+  auto &chunk = chunks[id];
+  auto compressionBytes = codec.compress(frame, chunk.data + chunk.used);
+  index[count % capacity] = FrameRef{id, static_cast<uint32_t>(chunk.used),
+                                     static_cast<uint32_t>(compressionBytes)};
+  chunk.used += compressionBytes;
+  chunk.lastFrame = count;
+  chunk.dirty = true;
+  ++count;
+  recycle();
+}
+
+void FrameArena::get(int64_t fno, std::span<pixel_t> frame) const {
+  const auto &ref = index[fno % capacity];
+  codec.decompress(chunks[ref.chunk].data + ref.offset,
+                   static_cast<int>(ref.bytes), frame);
+}
+
+auto FrameArena::frameCount() const -> int64_t { return count; }
+
+auto FrameArena::firstFrame() const -> int64_t {
+  return std::max<int64_t>(count - capacity, 0);
+}
+
+auto FrameArena::residentBytes() const -> size_t {
+  return chunks.size() * (arenaChunkSize + sizeof(Chunk)) +
+         index.size() * sizeof(FrameRef);
+}
+
+auto FrameArena::storedBytes() const -> size_t {
+  size_t bytes = 0;
+  for (auto fno = firstFrame(); fno < count; fno++) {
+    bytes += index[fno % capacity].bytes;
+  }
+  return bytes;
+}
+
+auto FrameArena::maxChunks(int frameCapacity) -> int {
+  // Every chunk but the newest and oldest is filled with frames that are kept
+  constexpr int chunkFrames = arenaChunkSize / frameBound;
+  return frameCapacity / chunkFrames + 3;
+}
+
+auto FrameArena::metaBytes(int frameCapacity) -> size_t {
+  auto n = static_cast<size_t>(maxChunks(frameCapacity));
+  return 2 * sizeof(int64_t) + n * (sizeof(uint32_t) + sizeof(ChunkMeta)) +
+         frameCapacity * sizeof(FrameRef) + sizeof(uint64_t) + dictionaryBytes;
+}
+
+void FrameArena::save(SnapshotFile &file, size_t metaOffset,
+                      size_t chunkOffset, bool all) {
+  auto n = static_cast<size_t>(maxChunks(capacity));
+  if (chunks.size() > n) {
+    std::cerr << "Snapshot failed (too many frame chunks).";
+    throw std::runtime_error("Snapshot error.");
+  }
+  // [count | #chunks | #active | active ids | chunk table | frame index |
+  //  dictionary size | dictionary]
+  std::vector<std::byte> meta(metaBytes(capacity));
+  auto *pos = meta.data();
+  auto put = [&pos](const void *src, size_t bytes) {
+    std::memcpy(pos, src, bytes);
+    pos += bytes;
+  };
+  std::array<uint32_t, 2> header{static_cast<uint32_t>(chunks.size()),
+                                 static_cast<uint32_t>(active.size())};
+  put(&count, sizeof(int64_t));
+  put(header.data(), sizeof(header));
+  std::vector<uint32_t> ids(n);
+  std::copy(active.begin(), active.end(), ids.begin());
+  put(ids.data(), n * sizeof(uint32_t));
+  std::vector<ChunkMeta> table(n);
+  std::transform(chunks.begin(), chunks.end(), table.begin(),
+                 [](const Chunk &chunk) {
+                   return ChunkMeta{chunk.used, chunk.lastFrame};
+                 });
+  put(table.data(), n * sizeof(ChunkMeta));
+  put(index.data(), index.size() * sizeof(FrameRef));
+  auto dict = codec.dictionary();
+  uint64_t dictSize = dict.size();
+  put(&dictSize, sizeof(uint64_t));
+  if (!dict.empty()) {
+    put(dict.data(), dict.size());
+  }
+  file.write(metaOffset, meta);
+  for (size_t id = 0; id < chunks.size(); id++) {
+    auto &chunk = chunks[id];
+    if ((all || chunk.dirty) && chunk.used > 0) {
+      file.write(chunkOffset + id * arenaChunkSize,
+                 std::as_bytes(std::span(chunk.data, chunk.used)));
+    }
+    chunk.dirty = false;
+  }
+}
+
+void FrameArena::load(std::shared_ptr<std::byte> mapped, size_t metaOffset,
+                      size_t chunkOffset) {
+  auto n = static_cast<size_t>(maxChunks(capacity));
+  const auto *pos = mapped.get() + metaOffset;
+  auto get = [&pos](void *dst, size_t bytes) {
+    std::memcpy(dst, pos, bytes);
+    pos += bytes;
+  };
+  std::array<uint32_t, 2> header{};
+  get(&count, sizeof(int64_t));
+  get(header.data(), sizeof(header));
+  auto [numChunks, numActive] = header;
+  if (numChunks > n || numActive > numChunks) {
+    std::cerr << "Snapshot restore failed (bad frame chunk table).";
+    throw std::runtime_error("Snapshot error.");
+  }
+  std::vector<uint32_t> ids(n);
+  get(ids.data(), n * sizeof(uint32_t));
+  std::vector<ChunkMeta> table(n);
+  get(table.data(), n * sizeof(ChunkMeta));
+  get(index.data(), index.size() * sizeof(FrameRef));
+  uint64_t dictSize = 0;
+  get(&dictSize, sizeof(uint64_t));
+  if (dictSize > dictionaryBytes) {
+    std::cerr << "Snapshot restore failed (bad dictionary).";
+    throw std::runtime_error("Snapshot error.");
+  }
+  codec.setDictionary(
+      {reinterpret_cast<const char *>(pos), static_cast<size_t>(dictSize)});
+  chunks.clear();
+  for (uint32_t id = 0; id < numChunks; id++) {
+    auto *data = reinterpret_cast<char *>(mapped.get() + chunkOffset +
+                                          id * arenaChunkSize);
+    chunks.push_back(
+        Chunk{nullptr, data, table[id].used, table[id].lastFrame, false});
+  }
+  active.assign(ids.begin(), ids.begin() + numActive);
+  freeChunks.clear();
+  for (uint32_t id = 0; id < numChunks; id++) {
+    if (std::find(active.begin(), active.end(), id) == active.end()) {
+      freeChunks.push_back(id);
+    }
+  }
+  mapping = std::move(mapped);
+}
+
+void FrameArena::nextChunk() {
+  if (freeChunks.empty()) {
+    freeChunks.push_back(static_cast<uint32_t>(chunks.size()));
+    auto owned = std::make_unique_for_overwrite<char[]>(arenaChunkSize);
+    auto *data = owned.get();
+    chunks.push_back(Chunk{std::move(owned), data});
+  }
+  active.push_back(freeChunks.back());
+  freeChunks.pop_back();
+}
+
+void FrameArena::recycle() {
+  // The newest chunk is kept even if empty, it receives the next frame
+  while (active.size() > 1 && chunks[active.front()].lastFrame < firstFrame()) {
+    auto &chunk = chunks[active.front()];
+    chunk.used = 0;
+    chunk.lastFrame = -1;
+    freeChunks.push_back(active.front());
+    active.pop_front();
+  }
+}
+} // namespace c2d
@@ -0,0 +1,78 @@
+#ifndef FRAMEARENA_HPP
+#define FRAMEARENA_HPP
+#include "common.hpp"
+#include "framecodec.hpp"
+#include "snapshotfile.hpp"
+#include <deque>
+#include <memory>
+
+namespace c2d {
+constexpr size_t arenaChunkSize = size_t{1} << 20;
+
+// Circular store of compressed frames in fixed size chunks. Frames are
+// compressed directly into the newest chunk and are indexed by chunk, offset
+// and length. The store keeps the last frameCapacity frames, and chunks whose
+// frames are all overwritten are recycled for new frames. Restored stores
+// use the chunks of a memory-mapped snapshot in place. Frames are compressed
+// by the configured codec, restored frames by the codec they were stored by.
+class FrameArena {
+public:
+  explicit FrameArena(int frameCapacity, CodecConfig codecConfig = {});
+  FrameArena(FrameArena &&) noexcept = default;
+  // Compresses and stores a frame as frame number frameCount().
+  void push(std::span<const pixel_t> frame);
+  // Decompresses frame number fno.
+  void get(int64_t fno, std::span<pixel_t> frame) const;
+  // Number of frames pushed so far.
+  [[nodiscard]] auto frameCount() const -> int64_t;
+  // Number of the oldest frame still stored.
+  [[nodiscard]] auto firstFrame() const -> int64_t;
+  // Bytes held by chunks and the frame index.
+  [[nodiscard]] auto residentBytes() const -> size_t;
+  // Compressed bytes of the stored frames.
+  [[nodiscard]] auto storedBytes() const -> size_t;
+  // Largest number of chunks held by a store of frameCapacity frames.
+  [[nodiscard]] static auto maxChunks(int frameCapacity) -> int;
+  // Bytes of the chunk table and frame index written by save().
+  [[nodiscard]] static auto metaBytes(int frameCapacity) -> size_t;
+  // Writes the chunk table and frame index at metaOffset and chunk i at
+  // chunkOffset + i * arenaChunkSize. Unless all is set, only chunks written
+  // since the last save are.
+  void save(SnapshotFile &file, size_t metaOffset, size_t chunkOffset,
+            bool all);
+  // Restores the store from a mapped file written by save().
+  void load(std::shared_ptr<std::byte> mapping, size_t metaOffset,
+            size_t chunkOffset);
+
+private:
+  struct FrameRef {
+    uint32_t chunk;
+    uint32_t offset;
+    uint32_t bytes;
+  };
+  struct Chunk {
+    std::unique_ptr<char[]> owned;
+    char *data = nullptr;
+    size_t used = 0;
+    int64_t lastFrame = -1;
+    bool dirty = false;
+  };
+  // Chunk table entries of snapshots
+  struct ChunkMeta {
+    uint64_t used;
+    int64_t lastFrame;
+  };
+  int capacity;
+  int64_t count = 0;
+  std::vector<FrameRef> index;
+  std::vector<Chunk> chunks;
+  std::deque<uint32_t> active;
+  std::vector<uint32_t> freeChunks;
+  std::shared_ptr<std::byte> mapping;
+  // Holds decompression state, get is called under the lane lock
+  mutable FrameCodec codec;
+  void nextChunk();
+  void recycle();
+};
+} // namespace c2d
+#endif // FRAMEARENA_HPP
@@ -0,0 +1,156 @@
+#include "framecodec.hpp"
+#include <algorithm>
+#include <cstring>
+#include <iostream>
+#include <lz4.h>
+#include <lz4hc.h>
+#include <stdexcept>
+#include <zlib.h>
+
+namespace c2d {
+
+namespace {
+// Raw deflate streams, i.e., without zlib header and checksum
+constexpr int rawWindowBits = -15;
+constexpr int memLevel = 8;
+
+void failed(const char *what) {
+  std::cerr << what;
+  throw std::runtime_error("Frame codec error.");
+}
+} // namespace
+
+void FrameCodec::DeflateEnd::operator()(z_stream_s *stream) const {
+  deflateEnd(stream);
+  delete stream;
+}
+
+void FrameCodec::InflateEnd::operator()(z_stream_s *stream) const {
+  inflateEnd(stream);
+  delete stream;
+}
+
+FrameCodec::FrameCodec(CodecConfig config)
+    : cfg(config), inflater(new z_stream_s{}) {
+  // Zlib frames of snapshots are readable by every codec
+  if (inflateInit2(inflater.get(), rawWindowBits) != Z_OK) {
+    failed("Codec setup failed (inflateInit2).");
+  }
+  if (cfg.codec == Codec::lz4hc) {
+    hcState = std::make_unique<char[]>(LZ4_sizeofStateHC());
+  } else if (cfg.codec == Codec::zlib) {
+    deflater.reset(new z_stream_s{});
+    if (deflateInit2(deflater.get(), cfg.level, Z_DEFLATED, rawWindowBits,
+                     memLevel, Z_DEFAULT_STRATEGY) != Z_OK) {
+      failed("Codec setup failed (deflateInit2).");
+    }
+    dict.reserve(dictionaryBytes);
+  }
+}
+
+FrameCodec::FrameCodec(FrameCodec &&) noexcept = default;
+auto FrameCodec::operator=(FrameCodec &&) noexcept -> FrameCodec & = default;
+FrameCodec::~FrameCodec() = default;
+
+auto FrameCodec::compress(std::span<const pixel_t> frame, char *dst) -> int {
+  const auto *src = reinterpret_cast<const char *>(frame.data());
+  int bytes = 0;
+  switch (cfg.codec) {
+  case Codec::raw:
+    return storeRaw(frame, dst);
+  case Codec::lz4:
+    bytes = LZ4_compress_fast(src, dst + 1, frameSize, compressBound,
+                              cfg.level);
+    break;
+  case Codec::lz4hc:
+    bytes = LZ4_compress_HC_extStateHC(hcState.get(), src, dst + 1, frameSize,
+                                       compressBound, cfg.level);
+    break;
+  case Codec::zlib: {
+    if (dict.size() < dictionaryBytes) {
+      // Blank frames, e.g., before episode starts, are not worth learning
+      if (std::any_of(frame.begin(), frame.end(),
+                      [](pixel_t p) { return p != 0; })) {
+        auto n = std::min(frame.size(), dictionaryBytes - dict.size());
+        dict.insert(dict.end(), src, src + n);
+      }
+      return storeRaw(frame, dst);
+    }
+    auto *stream = deflater.get();
+    deflateReset(stream);
+    deflateSetDictionary(stream, reinterpret_cast<const Bytef *>(dict.data()),
+                         static_cast<uInt>(dict.size()));
+    // Zlib only reads next_in, which is not const without ZLIB_CONST
+    stream->next_in = reinterpret_cast<Bytef *>(const_cast<char *>(src));
+    stream->avail_in = frameSize;
+    stream->next_out = reinterpret_cast<Bytef *>(dst + 1);
+    stream->avail_out = compressBound;
+    if (deflate(stream, Z_FINISH) == Z_STREAM_END) {
+      bytes = static_cast<int>(stream->total_out);
+    }
+    break;
+  }
+  default:
+    failed("Compression failed (unknown codec).");
+  }
+  if (bytes < 1) {
+    failed("Compression failed (bytes < 1).");
+  }
+  dst[0] = static_cast<char>(cfg.codec);
+  return bytes + 1;
+}
+
+auto FrameCodec::storeRaw(std::span<const pixel_t> frame, char *dst) const
+    -> int {
+  dst[0] = static_cast<char>(Codec::raw);
+  std::memcpy(dst + 1, frame.data(), frameSize);
+  return frameSize + 1;
+}
+
+void FrameCodec::decompress(const char *src, int bytes,
+                            std::span<pixel_t> frame) {
+  auto *dst = reinterpret_cast<char *>(frame.data());
+  const auto *payload = src + 1;
+  auto payloadBytes = bytes - 1;
+  int decompressed = 0;
+  switch (static_cast<Codec>(src[0])) {
+  case Codec::raw:
+    std::memcpy(dst, payload, frameSize);
+    return;
+  case Codec::lz4:
+  case Codec::lz4hc:
+    decompressed =
+        LZ4_decompress_safe(payload, dst, payloadBytes, frameSize);
+    break;
+  case Codec::zlib: {
+    auto *stream = inflater.get();
+    inflateReset(stream);
+    inflateSetDictionary(stream,
+                         reinterpret_cast<const Bytef *>(dict.data()),
+                         static_cast<uInt>(dict.size()));
+    stream->next_in =
+        reinterpret_cast<Bytef *>(const_cast<char *>(payload));
+    stream->avail_in = static_cast<uInt>(payloadBytes);
+    stream->next_out = reinterpret_cast<Bytef *>(dst);
+    stream->avail_out = frameSize;
+    if (inflate(stream, Z_FINISH) == Z_STREAM_END) {
+      decompressed = static_cast<int>(stream->total_out);
+    }
+    break;
+  }
+  default:
+    break;
+  }
+  if (decompressed != frameSize) {
+    failed("Decompression failed (bad frame).");
+  }
+}
+
+auto FrameCodec::dictionary() const -> std::span<const char> { return dict; }
+
+void FrameCodec::setDictionary(std::span<const char> bytes) {
+  dict.assign(bytes.begin(), bytes.end());
+}
+
+auto FrameCodec::config() const -> CodecConfig { return cfg; }
+} // namespace c2d
@@ -0,0 +1,65 @@
+#ifndef FRAMECODEC_HPP
+#define FRAMECODEC_HPP
+#include "common.hpp"
+#include <memory>
+#include <span>
+#include <vector>
+
+struct z_stream_s;
+
+namespace c2d {
+// Compression methods of stored frames
+enum class Codec : int32_t { raw = 0, lz4 = 1, lz4hc = 2, zlib = 3 };
+
+// A codec and its level, i.e., the acceleration of lz4 (1 = default) or the
+// compression level of lz4hc (1 to 12) and zlib (0 to 9)
+struct CodecConfig {
+  Codec codec = Codec::lz4;
+  int level = 1;
+};
+
+constexpr int compressBound = (frameSize + (frameSize / 255) + 16);
+// Compressed frames begin with a tag byte of their codec
+constexpr int frameBound = compressBound + 1;
+// Preset dictionaries of zlib hold about one frame, they are hashed anew for
+// every compressed frame and larger ones barely compress better
+constexpr size_t dictionaryBytes = size_t{1} << 13;
+
+// Compresses frames by a configured codec. Frames are decompressed by the
+// codec of their tag, such that frames of other codecs stay readable. Zlib
+// frames are raw deflate streams with a preset dictionary made of the first
+// non-blank frames, which are stored uncompressed until it is full. Codec
+// states are reused, compressing and decompressing allocate no memory.
+class FrameCodec {
+public:
+  explicit FrameCodec(CodecConfig config = {});
+  FrameCodec(FrameCodec &&) noexcept;
+  auto operator=(FrameCodec &&) noexcept -> FrameCodec &;
+  ~FrameCodec();
+  // Compresses a frame into dst of frameBound bytes, returns the bytes used.
+  auto compress(std::span<const pixel_t> frame, char *dst) -> int;
+  // Decompresses a frame of any codec.
+  void decompress(const char *src, int bytes, std::span<pixel_t> frame);
+  // Preset dictionary so far, empty unless the codec is zlib.
+  [[nodiscard]] auto dictionary() const -> std::span<const char>;
+  // Replaces the preset dictionary, e.g., by the one of a snapshot.
+  void setDictionary(std::span<const char> bytes);
+  [[nodiscard]] auto config() const -> CodecConfig;
+
+private:
+  struct DeflateEnd {
+    void operator()(z_stream_s *stream) const;
+  };
+  struct InflateEnd {
+    void operator()(z_stream_s *stream) const;
+  };
+  CodecConfig cfg;
+  std::vector<char> dict;
+  std::unique_ptr<char[]> hcState;
+  std::unique_ptr<z_stream_s, DeflateEnd> deflater;
+  std::unique_ptr<z_stream_s, InflateEnd> inflater;
+  [[nodiscard]] auto storeRaw(std::span<const pixel_t> frame, char *dst) const
+      -> int;
+};
+} // namespace c2d
+#endif // FRAMECODEC_HPP
@@ -0,0 +1,24 @@
+#include "framesource.hpp"
+#include "syntheticsource.hpp"
+#include <iostream>
+#include <stdexcept>
+#ifdef C2D_WITH_ALE
+#include "alesource.hpp"
+#endif
+
+namespace c2d {
+
+auto makeFrameSource(const std::string &game, uint64_t seed)
+    -> std::unique_ptr<FrameSource> {
+  if (game == "synthetic") {
+    return std::make_unique<SyntheticSource>(seed);
+  }
+#ifdef C2D_WITH_ALE
+  // ALE takes non-negative int seeds
+  return std::make_unique<AleSource>(game, static_cast<int>(seed >> 33U));
+#else
+  std::cerr << "Built without ALE, only synthetic games are available.";
+  throw std::runtime_error("ALE unavailable.");
+#endif
+}
+} // namespace c2d
@@ -0,0 +1,39 @@
+#ifndef FRAMESOURCE_HPP
+#define FRAMESOURCE_HPP
+#include "common.hpp"
+#include <cstdint>
+#include <memory>
+#include <string>
+#include <vector>
+
+namespace c2d {
+
+// Emulator of the screens of a game, i.e., ALE or a synthetic game. Steps
+// are single frames, frame skipping and episodes are handled by AtariEnv.
+class FrameSource {
+public:
+  FrameSource() = default;
+  FrameSource(const FrameSource &) = delete;
+  auto operator=(const FrameSource &) -> FrameSource & = delete;
+  virtual ~FrameSource() = default;
+  // Steps one frame by an action in [0, actionLength()), returns the reward.
+  virtual auto act(int action) -> reward_t = 0;
+  [[nodiscard]] virtual auto lives() -> int = 0;
+  [[nodiscard]] virtual auto gameOver() -> bool = 0;
+  virtual void resetGame() = 0;
+  // Writes the screen [height x width] as grayscale.
+  virtual void grayscale(Frame &screen) = 0;
+  // Writes the screen [height x width x 3] as RGB.
+  virtual void rgb(std::vector<pixel_t> &screen) = 0;
+  [[nodiscard]] virtual auto height() -> int = 0;
+  [[nodiscard]] virtual auto width() -> int = 0;
+  // Size of the minimal action set.
+  [[nodiscard]] virtual auto actionLength() -> int = 0;
+};
+
+// Games named "synthetic" are generated without ROM, others are ROM paths
+// of ALE games. ALE is seeded by seed.
+auto makeFrameSource(const std::string &game, uint64_t seed)
+    -> std::unique_ptr<FrameSource>;
+} // namespace c2d
+#endif // FRAMESOURCE_HPP
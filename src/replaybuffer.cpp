@@ -1,89 +1,451 @@
 #include "replaybuffer.hpp"
 #include "common.hpp"
+#include "stats.hpp"
 #include <algorithm>
+#include <array>
 #include <chrono>
-#include <iostream>
-#include <lz4.h>
-#include <stdexcept>
+#include <cmath>
+#include <cstring>
+#include <sstream>
 
 namespace c2d {
-ReplayBuffer::ReplayBuffer(int memSize)
-    : rng(std::random_device{}()),
-      maxSize(memSize), currentMemoryPosition(0), currentSize(0), amem(memSize),
-      rmem(memSize), esmem(memSize), dmem(memSize) {}
 
-void ReplayBuffer::add(action_t a, reward_t r, std::span<pixel_t> es, bool d) {
-  // To save memory we only compress and store the ending state
-  compress(es, esmem[currentMemoryPosition]); 
-  addScalars(a, r, d);
+namespace {
+// Keeps items with zero loss sampleable
+constexpr double priorityOffset = 1e-6;
+
+constexpr std::array<char, 8> snapshotMagic{"C2DSNAP"};
+constexpr uint32_t snapshotVersion = 3;
+constexpr size_t pageSize = 4096;
+constexpr size_t alignPage(size_t n) { return (n + pageSize - 1) & ~(pageSize - 1); }
+
+struct SnapshotHeader {
+  std::array<char, 8> magic;
+  uint32_t version;
+  uint32_t complete;
+  int32_t memSize;
+  int32_t numLanes;
+  int32_t laneFrames;
+  int32_t stateSize;
+  float alpha;
+  double maxPriority;
+  std::array<char, 128> rng;
+};
+
+struct LaneMeta {
+  int32_t position;
+  int32_t size;
+};
+
+// Page aligned file offsets of the snapshot sections
+struct SnapshotLayout {
+  size_t lanes, amem, rmem, dmem, fmem, vmem, tree, arenas, arenaBytes,
+      chunks, laneChunkBytes, total;
+};
+
+auto layoutOf(size_t memSize, int numLanes, int laneFrames, bool prioritized)
+    -> SnapshotLayout {
+  SnapshotLayout l{};
+  size_t pos = alignPage(sizeof(SnapshotHeader));
+  auto section = [&pos](size_t bytes) {
+    auto at = pos;
+    pos += alignPage(bytes);
+    return at;
+  };
+  l.lanes = section(numLanes * sizeof(LaneMeta));
+  l.amem = section(memSize * sizeof(action_t));
+  l.rmem = section(memSize * sizeof(float));
+  l.dmem = section(memSize * sizeof(float));
+  l.fmem = section(memSize * sizeof(int64_t));
+  l.vmem = section(memSize * sizeof(int8_t));
+  l.tree = section(prioritized ? memSize * sizeof(double) : 0);
+  l.arenaBytes = alignPage(FrameArena::metaBytes(laneFrames));
+  l.arenas = section(numLanes * l.arenaBytes);
+  // Chunks have fixed offsets, never allocated chunks leave holes in the file
+  l.laneChunkBytes = FrameArena::maxChunks(laneFrames) * arenaChunkSize;
+  l.chunks = section(numLanes * l.laneChunkBytes);
+  l.total = pos;
+  return l;
+}
+
+template <typename T> auto bytesOf(const std::vector<T> &vec) {
+  return std::as_bytes(std::span(vec));
+}
+
+template <typename T>
+void copyFrom(const std::byte *src, std::vector<T> &vec) {
+  std::memcpy(vec.data(), src, vec.size() * sizeof(T));
 }
+} // namespace
 
-void ReplayBuffer::addScalars(action_t a, reward_t r, bool d) {
-  amem[currentMemoryPosition] = a;
-  rmem[currentMemoryPosition] = static_cast<float>(r);
-  dmem[currentMemoryPosition] = static_cast<c2d::done_t>(d);
-  currentMemoryPosition =
-      (currentMemoryPosition + 1 == maxSize ? 0 : currentMemoryPosition + 1);
-  if (currentSize < maxSize) {
-    currentSize++;
+ReplayBuffer::ReplayBuffer(int memSize, int laneCount, float priorityExponent,
+                           uint64_t seed, CodecConfig codec)
+    : rng(seed), sampledIndices(batchSizeOne), sampledWeights(batchSizeOne),
+      sampledProbs(batchSizeOne), laneSizes(laneCount), numLanes(laneCount),
+      laneSize(memSize / laneCount),
+      // Episode starts add a second frame, so frames need some headroom
+      laneFrames(laneSize + laneSize / 8 + 2 * obsStack),
+      alpha(priorityExponent), lanes(laneCount), amem(memSize), rmem(memSize),
+      dmem(memSize), fmem(memSize), vmem(memSize) {
+  arenas.reserve(laneCount);
+  for (int lane = 0; lane < laneCount; lane++) {
+    arenas.emplace_back(laneFrames, codec);
+  }
+  if (alpha > 0.0F) {
+    priorities = std::make_unique<SumTree>(memSize);
+  }
+}
+
+void ReplayBuffer::add(action_t a, reward_t r, std::span<const pixel_t> es,
+                       bool d, int newFrames, int validFrames, int lane) {
+  // To save memory we only compress and store frames not seen before
+  newFrames = std::clamp(newFrames, 1, obsStack);
+  addFrames(a, r, es.last(newFrames * frameSize), d, validFrames, lane);
+}
+
+void ReplayBuffer::addFrames(action_t a, reward_t r,
+                             std::span<const pixel_t> frames, bool d,
+                             int validFrames, int lane) {
+  auto &ln = lanes[lane];
+  auto &arena = arenas[lane];
+  std::lock_guard lock(ln.mtx);
+  {
+    ScopedTimer timer(Stat::compression);
+    for (size_t pos = 0; pos < frames.size(); pos += frameSize) {
+      arena.push(frames.subspan(pos, frameSize));
+    }
+  }
+  evictStale(ln, lane);
+  auto idx = lane * laneSize + ln.position;
+  addScalars(a, r, d, idx);
+  fmem[idx] = arena.frameCount() - 1;
+  auto valid = std::min<int64_t>(std::clamp(validFrames, 1, obsStack),
+                                 arena.frameCount());
+  vmem[idx] = static_cast<int8_t>(valid);
+  ln.position = (ln.position + 1 == laneSize ? 0 : ln.position + 1);
+  if (ln.size < laneSize) {
+    ln.size++;
+  }
+  if (priorities) {
+    // New items get the maximal priority, the oldest has no start state
+    auto oldest =
+        lane * laneSize + (ln.position - ln.size + laneSize) % laneSize;
+    std::lock_guard treeLock(treeMtx);
+    priorities->set(idx, maxPriority);
+    priorities->set(oldest, 0.0);
+  }
+}
+
+void ReplayBuffer::addScalars(action_t a, reward_t r, bool d, int idx) {
+  amem[idx] = a;
+  rmem[idx] = static_cast<float>(r);
+  dmem[idx] = static_cast<c2d::done_t>(d);
+}
+
+void ReplayBuffer::evictStale(Lane &ln, int lane) {
+  // Drops the oldest experiences whose frames were overwritten
+  auto firstStored = arenas[lane].firstFrame();
+  while (ln.size > 0) {
+    auto oldest = lane * laneSize + (ln.position - ln.size + laneSize) % laneSize;
+    if (fmem[oldest] - vmem[oldest] + 1 >= firstStored) {
+      break;
+    }
+    if (priorities) {
+      std::lock_guard treeLock(treeMtx);
+      priorities->set(oldest, 0.0);
+    }
+    ln.size--;
   }
 }
 
 void ReplayBuffer::sample(BatchView batchseg) {
-  auto indices = sampleIndices(batchseg.ba.size());
-  auto pbs = batchseg.bs;
-  auto pbes = batchseg.bes;
-  int count = 0;
-  for (int idx : indices) {
-    auto sidx = idx - 1;
-    decompress(esmem[sidx], pbs.subspan(count * stateSize, stateSize));
-    decompress(esmem[idx], pbes.subspan(count * stateSize, stateSize));
-    ++count;
-  }
-  std::transform(indices.begin(), indices.end(), batchseg.ba.begin(),
-                 [&](int idx) { return amem[idx]; });
-  std::transform(indices.begin(), indices.end(), batchseg.br.begin(),
-                 [&](int idx) { return rmem[idx]; });
-  std::transform(indices.begin(), indices.end(), batchseg.bd.begin(),
-                 [&](int idx) { return dmem[idx]; });
-}
-
-auto ReplayBuffer::sampleIndices(int n) -> std::vector<int> {
-  dist.param(
-      std::uniform_int_distribution<int>::param_type(1, currentSize - 1));
-  std::vector<int> vec(n);
-  std::generate(vec.begin(), vec.end(), [&]() { return dist(rng); });
-  return vec;
+  ScopedTimer timer(Stat::sampling);
+  std::lock_guard sampleLock(sampleMtx);
+  auto n = static_cast<int>(batchseg.ba.size());
+  // Larger batches than batchSizeOne grow the buffers once
+  sampledIndices.resize(std::max<size_t>(sampledIndices.size(), n));
+  sampledWeights.resize(std::max<size_t>(sampledWeights.size(), n));
+  std::span indices(sampledIndices.data(), n);
+  std::span weights(sampledWeights.data(), n);
+  if (priorities) {
+    samplePrioritized(indices, weights);
+  } else {
+    sampleIndices(indices);
+    std::fill(weights.begin(), weights.end(), 1.0F);
+  }
+  for (int count = 0; count < n; count++) {
+    auto lane = indices[count] / laneSize;
+    // Items are read under the lane lock since a writer may replace them
+    std::unique_lock lock(lanes[lane].mtx);
+    auto age = priorities ? ageOf(lanes[lane], indices[count])
+                          : indices[count] % laneSize;
+    // The lane lost items since they were drawn. A lane without an item that
+    // has a start state is replaced by the next one that has.
+    while (lanes[lane].size < 2) {
+      lock.unlock();
+      lane = (lane + 1) % numLanes;
+      lock = std::unique_lock(lanes[lane].mtx);
+    }
+    auto &ln = lanes[lane];
+    int size = ln.size;
+    if (age < 1 || age >= size) {
+      age = 1 + age % (size - 1);
+    }
+    auto oldest = ln.position - size + laneSize;
+    auto idx = lane * laneSize + (oldest + age) % laneSize;
+    gather(lane, idx, batchseg, count);
+    if (!batchseg.bi.empty()) {
+      batchseg.bi[count] = idx;
+    }
+    if (!batchseg.bw.empty()) {
+      batchseg.bw[count] = weights[count];
+    }
+  }
 }
 
-auto ReplayBuffer::sampleInteger(int n) -> int {
-  dist.param(std::uniform_int_distribution<int>::param_type(1, n));
-  return dist(rng);
+void ReplayBuffer::gather(int lane, int idx, BatchView batchseg, int count) {
+  auto sidx = lane * laneSize + (idx - 1 + laneSize) % laneSize;
+  auto es = batchseg.bes.subspan(count * stateSize, stateSize);
+  auto s = batchseg.bs.subspan(count * stateSize, stateSize);
+  buildState(lane, fmem[idx], vmem[idx], es);
+  // The start state shares most frames with the end state, which are copied
+  // instead of decompressed
+  auto first = fmem[idx] - vmem[idx] + 1;
+  int svalid = vmem[sidx];
+  std::fill_n(s.begin(), (obsStack - svalid) * frameSize, 0);
+  for (int j = 0; j < svalid; j++) {
+    auto fno = fmem[sidx] - svalid + 1 + j;
+    auto dst = s.subspan((obsStack - svalid + j) * frameSize, frameSize);
+    if (fno >= first && fno <= fmem[idx]) {
+      auto epos = obsStack - vmem[idx] + (fno - first);
+      std::copy_n(es.begin() + epos * frameSize, frameSize, dst.begin());
+    } else {
+      arenas[lane].get(fno, dst);
+    }
+  }
+  batchseg.ba[count] = amem[idx];
+  batchseg.br[count] = rmem[idx];
+  batchseg.bd[count] = dmem[idx];
+}
+
+auto ReplayBuffer::ageOf(const Lane &ln, int idx) const -> int {
+  auto oldest = (ln.position - ln.size + laneSize) % laneSize;
+  return (idx % laneSize - oldest + laneSize) % laneSize;
+}
+
+void ReplayBuffer::buildState(int lane, int64_t newest, int valid,
+                              std::span<pixel_t> state) const {
+  // Frames from before the episode start are zero
+  std::fill_n(state.begin(), (obsStack - valid) * frameSize, 0);
+  for (int j = 0; j < valid; j++) {
+    auto fno = newest - valid + 1 + j;
+    arenas[lane].get(
+        fno, state.subspan((obsStack - valid + j) * frameSize, frameSize));
+  }
 }
 
-void ReplayBuffer::compress(std::span<pixel_t> state, CompressedState &cstate) {
-  CompressedState buffer(compressBound);
-  auto compressionBytes =
-      LZ4_compress_default(reinterpret_cast<const char *>(state.data()),
-                           buffer.data(), stateSize, compressBound);
-  if (compressionBytes < 1) {
-    std::cerr << "Compression failed (lz4 bytes < 1).";
-    throw std::runtime_error("Compression error.");
+void ReplayBuffer::sampleIndices(std::span<int> indices) {
+  // Every lane item except the oldest has a start state, i.e., a predecessor.
+  // Indices are encoded as lane * laneSize + age, with age counted from the
+  // oldest item of the lane.
+  auto &sizes = laneSizes;
+  std::transform(lanes.begin(), lanes.end(), sizes.begin(),
+                 [](const Lane &ln) { return ln.size.load(); });
+  int total = 0;
+  for (int size : sizes) {
+    total += std::max(size - 1, 0);
   }
-  cstate.resize(compressionBytes);
-  cstate.shrink_to_fit();
-  std::copy_n(buffer.begin(), compressionBytes, cstate.begin());
+  std::generate(indices.begin(), indices.end(), [&]() {
+    auto k = static_cast<int>(rng.below(total));
+    int lane = 0;
+    while (k >= sizes[lane] - 1) {
+      k -= std::max(sizes[lane] - 1, 0);
+      ++lane;
+    }
+    return lane * laneSize + k + 1;
+  });
 }
 
-void ReplayBuffer::decompress(const CompressedState &cstate,
-                              std::span<pixel_t> state) {
-  auto decompressionBytes =
-      LZ4_decompress_safe(cstate.data(), reinterpret_cast<char *>(state.data()),
-                          cstate.size(), stateSize);
-  if (decompressionBytes < 1) {
-    std::cerr << "Decompression failed (lz4 bytes < 1).";
-    throw std::runtime_error("Decompression error.");
+void ReplayBuffer::samplePrioritized(std::span<int> indices,
+                                     std::span<float> weights) {
+  // Stratified sampling of one item from each of n segments of equal mass
+  auto n = static_cast<int>(indices.size());
+  sampledProbs.resize(std::max<size_t>(sampledProbs.size(), n));
+  std::span probs(sampledProbs.data(), n);
+  {
+    std::lock_guard treeLock(treeMtx);
+    auto total = priorities->total();
+    auto segment = total / n;
+    for (int i = 0; i < n; i++) {
+      indices[i] = priorities->find((i + rng.unit()) * segment);
+      probs[i] = priorities->get(indices[i]) / total;
+    }
   }
+  // Importance weights (N * P(i))^-beta, normalized by the batch maximum
+  int sampleable = 0;
+  for (const auto &ln : lanes) {
+    sampleable += std::max(ln.size.load() - 1, 0);
+  }
+  auto b = static_cast<double>(beta.load());
+  std::transform(probs.begin(), probs.end(), weights.begin(), [&](double p) {
+    return static_cast<float>(std::pow(sampleable * p, -b));
+  });
+  auto wmax = *std::max_element(weights.begin(), weights.end());
+  std::transform(weights.begin(), weights.end(), weights.begin(),
+                 [wmax](float w) { return w / wmax; });
+}
+
+void ReplayBuffer::updatePriorities(std::span<const int> indices,
+                                    std::span<const float> values) {
+  if (!priorities) {
+    return;
+  }
+  for (size_t i = 0; i < indices.size(); i++) {
+    auto idx = indices[i];
+    auto priority =
+        std::pow(static_cast<double>(values[i]) + priorityOffset, alpha);
+    if (!std::isfinite(priority)) {
+      continue;
+    }
+    auto &ln = lanes[idx / laneSize];
+    std::lock_guard lock(ln.mtx);
+    // Items that became the oldest or were evicted keep a zero priority
+    auto age = ageOf(ln, idx);
+    if (age < 1 || age >= ln.size) {
+      continue;
+    }
+    std::lock_guard treeLock(treeMtx);
+    priorities->set(idx, priority);
+    maxPriority = std::max(maxPriority, priority);
+  }
+}
+
+void ReplayBuffer::setImportanceExponent(float exponent) { beta = exponent; }
+
+auto ReplayBuffer::prioritized() const -> bool { return priorities != nullptr; }
+
+auto ReplayBuffer::residentBytes() -> size_t {
+  size_t bytes = amem.size() * sizeof(action_t) + rmem.size() * sizeof(float) +
+                 dmem.size() * sizeof(float) + fmem.size() * sizeof(int64_t) +
+                 vmem.size() * sizeof(int8_t);
+  for (int lane = 0; lane < numLanes; lane++) {
+    std::lock_guard lock(lanes[lane].mtx);
+    bytes += arenas[lane].residentBytes();
+  }
+  return bytes;
+}
+
+void ReplayBuffer::save(const std::string &path) {
+  // The memory stays unchanged while all lanes are locked
+  std::lock_guard sampleLock(sampleMtx);
+  std::vector<std::unique_lock<std::mutex>> laneLocks;
+  for (auto &ln : lanes) {
+    laneLocks.emplace_back(ln.mtx);
+  }
+  std::lock_guard treeLock(treeMtx);
+  auto layout = layoutOf(amem.size(), numLanes, laneFrames, prioritized());
+  SnapshotFile file(path, true);
+  auto all = path != snapshotPath || file.size() != layout.total;
+  snapshotPath.clear();
+  file.resize(layout.total);
+  SnapshotHeader header{snapshotMagic,
+                        snapshotVersion,
+                        0,
+                        static_cast<int32_t>(amem.size()),
+                        numLanes,
+                        laneFrames,
+                        stateSize,
+                        alpha,
+                        maxPriority,
+                        {}};
+  std::ostringstream rngState;
+  rngState << rng;
+  rngState.str().copy(header.rng.data(), header.rng.size() - 1);
+  auto headerBytes = std::as_bytes(std::span(&header, 1));
+  file.write(0, headerBytes);
+  file.sync();
+
+  std::vector<LaneMeta> laneMeta;
+  for (const auto &ln : lanes) {
+    laneMeta.push_back(LaneMeta{ln.position, ln.size});
+  }
+  file.write(layout.lanes, bytesOf(laneMeta));
+  file.write(layout.amem, bytesOf(amem));
+  file.write(layout.rmem, bytesOf(rmem));
+  file.write(layout.dmem, bytesOf(dmem));
+  file.write(layout.fmem, bytesOf(fmem));
+  file.write(layout.vmem, bytesOf(vmem));
+  if (priorities) {
+    file.write(layout.tree, std::as_bytes(priorities->leafValues()));
+  }
+  for (int lane = 0; lane < numLanes; lane++) {
+    arenas[lane].save(file, layout.arenas + lane * layout.arenaBytes,
+                      layout.chunks + lane * layout.laneChunkBytes, all);
+  }
+  file.sync();
+
+  // Only a fully written snapshot is marked complete
+  header.complete = 1;
+  file.write(0, headerBytes);
+  file.sync();
+  snapshotPath = path;
+}
+
+auto ReplayBuffer::load(const std::string &path) -> bool {
+  SnapshotFile file(path, false);
+  if (!file.isOpen() || file.size() < sizeof(SnapshotHeader)) {
+    return false;
+  }
+  SnapshotHeader header{};
+  file.read(0, std::as_writable_bytes(std::span(&header, 1)));
+  auto layout = layoutOf(amem.size(), numLanes, laneFrames, prioritized());
+  if (header.magic != snapshotMagic || header.version != snapshotVersion ||
+      header.complete != 1 || header.memSize != static_cast<int>(amem.size()) ||
+      header.numLanes != numLanes || header.laneFrames != laneFrames ||
+      header.stateSize != stateSize || header.alpha != alpha ||
+      file.size() != layout.total) {
+    return false;
+  }
+
+  std::lock_guard sampleLock(sampleMtx);
+  std::vector<std::unique_lock<std::mutex>> laneLocks;
+  for (auto &ln : lanes) {
+    laneLocks.emplace_back(ln.mtx);
+  }
+  std::lock_guard treeLock(treeMtx);
+  // Scalars are copied, frame chunks are used in place
+  auto mapping = file.map();
+  const auto *base = mapping.get();
+  std::vector<LaneMeta> laneMeta(numLanes);
+  copyFrom(base + layout.lanes, laneMeta);
+  for (int lane = 0; lane < numLanes; lane++) {
+    lanes[lane].position = laneMeta[lane].position;
+    lanes[lane].size = laneMeta[lane].size;
+  }
+  copyFrom(base + layout.amem, amem);
+  copyFrom(base + layout.rmem, rmem);
+  copyFrom(base + layout.dmem, dmem);
+  copyFrom(base + layout.fmem, fmem);
+  copyFrom(base + layout.vmem, vmem);
+  if (priorities) {
+    std::vector<double> leaves(amem.size());
+    copyFrom(base + layout.tree, leaves);
+    priorities->assign(leaves);
+  }
+  for (int lane = 0; lane < numLanes; lane++) {
+    arenas[lane].load(mapping, layout.arenas + lane * layout.arenaBytes,
+                      layout.chunks + lane * layout.laneChunkBytes);
+  }
+  maxPriority = header.maxPriority;
+  std::istringstream rngState(header.rng.data());
+  rngState >> rng;
+  snapshotPath = path;
+  return true;
+}
+
+auto ReplayBuffer::sampleInteger(int n) -> int {
+  std::lock_guard sampleLock(sampleMtx);
+  return 1 + static_cast<int>(rng.below(n));
 }
 
 } // namespace c2d
@@ -1,38 +1,105 @@
 #ifndef REPLAYBUFFER_HPP
 #define REPLAYBUFFER_HPP
 #include "common.hpp"
-#include <random>
+#include "framearena.hpp"
+#include "sumtree.hpp"
+#include "xoshiro.hpp"
+#include <atomic>
+#include <memory>
+#include <mutex>
+#include <string>
 
 namespace c2d {
-using CompressedState = std::vector<char>;
-constexpr int compressBound = (stateSize + (stateSize / 255) + 16);
 // Holds experiences in the form of contiguous memory blocks, one for each
-// item type. Memory is partly optimized by saving only end states.
+// item type. Memory is optimized by storing every observed frame once and
+// rebuilding the [4 x 84 x 84] states of an experience from frame numbers at
+// sample time. The memory is split into equally sized lanes, one for each
+// environment writing to it, so that consecutive experiences and frames of an
+// environment stay adjacent. Lanes may be written by different threads while
+// another thread samples. With a positive priority exponent experiences are
+// sampled proportionally to their priority by a sum-tree over all items.
+// Memories of the same seed sample the same items given the same experiences.
+// Frames are compressed by the given codec.
 class ReplayBuffer {
 public:
-  explicit ReplayBuffer(int memSize);
-  // Stores an experience (s,ar,es,d) by copying an end state view
-  void add(action_t a, reward_t r, std::span<pixel_t> es, bool d);
-  // Samples uniformly with size decided by the BatchView
+  explicit ReplayBuffer(int memSize, int laneCount = 1,
+                        float priorityExponent = 0.0F, uint64_t seed = 0,
+                        CodecConfig codec = {});
+  // Stores an experience (s,ar,es,d) given its end state view. Only the
+  // newFrames last frames of es are new since the last stored experience of
+  // the lane, and only the validFrames last frames are non-zero.
+  void add(action_t a, reward_t r, std::span<const pixel_t> es, bool d,
+           int newFrames, int validFrames, int lane = 0);
+  // Stores an experience given only the frames of its end state that are new
+  // since the last stored experience of the lane, e.g., sent by an actor.
+  void addFrames(action_t a, reward_t r, std::span<const pixel_t> frames,
+                 bool d, int validFrames, int lane = 0);
+  // Samples uniformly or by priority with size decided by the BatchView. If
+  // given, the memory indices and importance weights of items are written.
   void sample(BatchView batchseg);
+  // Sets the priorities of sampled items given their memory indices, items
+  // replaced since they were sampled are skipped
+  void updatePriorities(std::span<const int> indices,
+                        std::span<const float> values);
+  // Sets the exponent of importance weights, annealed towards 1 in training
+  void setImportanceExponent(float exponent);
+  [[nodiscard]] auto prioritized() const -> bool;
   // Samples a random integer between 0 and n
   [[nodiscard]] auto sampleInteger(int n) -> int;
+  // Bytes held by the memory, including compressed frame chunks
+  [[nodiscard]] auto residentBytes() -> size_t;
+  // Writes a snapshot of the memory to a file. Snapshots to the file of the
+  // last save or load only write frame chunks changed since then. The file
+  // is marked incomplete until all is written.
+  void save(const std::string &path);
+  // Restores a complete snapshot of a memory with the same configuration,
+  // frame chunks are memory-mapped from the file. Returns false if there is
+  // no such snapshot at path.
+  [[nodiscard]] auto load(const std::string &path) -> bool;
 
 private:
-  std::default_random_engine rng;
-  std::uniform_int_distribution<int> dist;
-  int maxSize;
-  int currentMemoryPosition;
-  int currentSize;
+  // Write positions and sizes of a lane, guarded by its own mutex
+  struct Lane {
+    std::mutex mtx;
+    int position = 0;
+    std::atomic<int> size = 0;
+  };
+  std::mutex sampleMtx;
+  Xoshiro256 rng;
+  // Buffers of sample, reused under the sample mutex
+  std::vector<int> sampledIndices;
+  std::vector<float> sampledWeights;
+  std::vector<double> sampledProbs;
+  std::vector<int> laneSizes;
+  int numLanes;
+  int laneSize;
+  int laneFrames;
+  float alpha;
+  std::atomic<float> beta = 0.5F;
+  std::vector<Lane> lanes;
   std::vector<action_t> amem;
   std::vector<float> rmem;
-  std::vector<CompressedState> esmem;
   std::vector<float> dmem;
-  auto sampleIndices(int n) -> std::vector<int>;
-  void addScalars(action_t a, reward_t r, bool d);
-  static void compress(std::span<pixel_t> state, CompressedState &cstate);
-  static void decompress(const CompressedState &cstate,
-                         std::span<pixel_t> state);
+  // Number of the newest frame and count of non-zero frames of end states
+  std::vector<int64_t> fmem;
+  std::vector<int8_t> vmem;
+  // Compressed frames in a circular frame store of each lane
+  std::vector<FrameArena> arenas;
+  // Priorities to the power of alpha, zero for items without a start state.
+  // Always locked after a lane mutex.
+  std::unique_ptr<SumTree> priorities;
+  std::mutex treeMtx;
+  double maxPriority = 1.0;
+  // File of the last saved or loaded snapshot
+  std::string snapshotPath;
+  void sampleIndices(std::span<int> indices);
+  void samplePrioritized(std::span<int> indices, std::span<float> weights);
+  void addScalars(action_t a, reward_t r, bool d, int idx);
+  void evictStale(Lane &ln, int lane);
+  [[nodiscard]] auto ageOf(const Lane &ln, int idx) const -> int;
+  void gather(int lane, int idx, BatchView batchseg, int count);
+  void buildState(int lane, int64_t newest, int valid,
+                  std::span<pixel_t> state) const;
 };
 } // namespace c2d
 #endif // REPLAYBUFFER_HPP
@@ -0,0 +1,85 @@
+#include "snapshotfile.hpp"
+#include <fcntl.h>
+#include <iostream>
+#include <stdexcept>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+namespace c2d {
+
+namespace {
+[[noreturn]] void fail(const std::string &what) {
+  std::cerr << "Snapshot " << what << " failed.";
+  throw std::runtime_error("Snapshot error.");
+}
+} // namespace
+
+SnapshotFile::SnapshotFile(const std::string &path, bool create)
+    : fd(::open(path.c_str(), create ? O_RDWR | O_CREAT : O_RDWR, 0644)) {
+  if (fd < 0 && create) {
+    fail("open");
+  }
+}
+
+SnapshotFile::~SnapshotFile() {
+  if (fd >= 0) {
+    ::close(fd);
+  }
+}
+
+auto SnapshotFile::isOpen() const -> bool { return fd >= 0; }
+
+auto SnapshotFile::size() const -> size_t {
+  struct stat st {};
+  if (::fstat(fd, &st) != 0) {
+    fail("stat");
+  }
+  return static_cast<size_t>(st.st_size);
+}
+
+void SnapshotFile::resize(size_t bytes) {
+  if (::ftruncate(fd, static_cast<off_t>(bytes)) != 0) {
+    fail("resize");
+  }
+}
+
+void SnapshotFile::read(size_t offset, std::span<std::byte> data) const {
+  while (!data.empty()) {
+    auto n = ::pread(fd, data.data(), data.size(), static_cast<off_t>(offset));
+    if (n <= 0) {
+      fail("read");
+    }
+    data = data.subspan(n);
+    offset += n;
+  }
+}
+
+void SnapshotFile::write(size_t offset, std::span<const std::byte> data) {
+  while (!data.empty()) {
+    auto n = ::pwrite(fd, data.data(), data.size(), static_cast<off_t>(offset));
+    if (n <= 0) {
+      fail("write");
+    }
+    data = data.subspan(n);
+    offset += n;
+  }
+}
+
+void SnapshotFile::sync() {
+  if (::fdatasync(fd) != 0) {
+    fail("sync");
+  }
+}
+
+auto SnapshotFile::map() const -> std::shared_ptr<std::byte> {
+  auto bytes = size();
+  auto *addr =
+      ::mmap(nullptr, bytes, PROT_READ | PROT_WRITE, MAP_PRIVATE, fd, 0);
+  if (addr == MAP_FAILED) {
+    fail("map");
+  }
+  return {static_cast<std::byte *>(addr),
+          [bytes](std::byte *p) { ::munmap(p, bytes); }};
+}
+} // namespace c2d
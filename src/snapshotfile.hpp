@@ -0,0 +1,36 @@
+#ifndef SNAPSHOTFILE_HPP
+#define SNAPSHOTFILE_HPP
+#include <cstddef>
+#include <memory>
+#include <span>
+#include <string>
+
+namespace c2d {
+
+// File of a memory snapshot, written by offset and memory-mapped
+// copy-on-write when restored.
+class SnapshotFile {
+public:
+  // Opens the file at path, creating it if create is set. isOpen() is false
+  // if the file does not exist.
+  SnapshotFile(const std::string &path, bool create);
+  SnapshotFile(const SnapshotFile &) = delete;
+  auto operator=(const SnapshotFile &) -> SnapshotFile & = delete;
+  ~SnapshotFile();
+  [[nodiscard]] auto isOpen() const -> bool;
+  [[nodiscard]] auto size() const -> size_t;
+  // Sets the file size, unwritten regions take no disk space.
+  void resize(size_t bytes);
+  void read(size_t offset, std::span<std::byte> data) const;
+  void write(size_t offset, std::span<const std::byte> data);
+  // Blocks until written data is on disk.
+  void sync();
+  // Maps the whole file privately, writes to the mapping never reach the
+  // file. The mapping lives as long as the returned pointer.
+  [[nodiscard]] auto map() const -> std::shared_ptr<std::byte>;
+
+private:
+  int fd = -1;
+};
+} // namespace c2d
+#endif // SNAPSHOTFILE_HPP
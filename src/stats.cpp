@@ -0,0 +1,103 @@
+#include "stats.hpp"
+#include <algorithm>
+#include <bit>
+#include <chrono>
+
+namespace c2d {
+
+namespace {
+std::atomic<int32_t> threadCount = 0;
+
+auto threadNumber() -> int32_t {
+  thread_local const int32_t number = threadCount++;
+  return number;
+}
+} // namespace
+
+auto stats() -> Stats & {
+  static Stats instance;
+  return instance;
+}
+
+void Stats::enable(bool timing, bool tracing) {
+  {
+    std::lock_guard lock(traceMtx);
+    // The trace is allocated here, recording never allocates
+    if (tracing && trace.capacity() < traceCapacity) {
+      trace.reserve(traceCapacity);
+    }
+    tracingOn = tracing;
+  }
+  timingOn = timing || tracing;
+}
+
+void Stats::record(Stat stat, int64_t start, int64_t duration) {
+  auto s = static_cast<int>(stat);
+  constexpr auto relaxed = std::memory_order_relaxed;
+  counts[s].fetch_add(1, relaxed);
+  nanos[s].fetch_add(duration, relaxed);
+  auto bucket = std::min<int>(std::bit_width(static_cast<uint64_t>(duration)),
+                              histogramBuckets - 1);
+  histograms[s * histogramBuckets + bucket].fetch_add(1, relaxed);
+  if (tracingOn.load(relaxed)) {
+    std::lock_guard lock(traceMtx);
+    if (trace.size() < trace.capacity()) {
+      trace.push_back(TraceEvent{s, threadNumber(), start, duration});
+    } else {
+      dropped.fetch_add(1, relaxed);
+    }
+  }
+}
+
+void Stats::read(std::span<int64_t> countsOut, std::span<int64_t> nanosOut,
+                 std::span<int64_t> histogramsOut, bool reset) {
+  auto take = [reset](std::atomic<int64_t> &value) {
+    return reset ? value.exchange(0) : value.load();
+  };
+  for (int s = 0; s < numStats; s++) {
+    countsOut[s] = take(counts[s]);
+    nanosOut[s] = take(nanos[s]);
+  }
+  for (size_t b = 0; b < histograms.size(); b++) {
+    histogramsOut[b] = take(histograms[b]);
+  }
+}
+
+auto Stats::drainTrace(std::span<TraceEvent> events) -> int {
+  std::lock_guard lock(traceMtx);
+  auto n = std::min(events.size(), trace.size() - traceHead);
+  std::copy_n(trace.begin() + traceHead, n, events.begin());
+  traceHead += n;
+  if (traceHead == trace.size()) {
+    // Drained events free their space, the capacity is kept
+    trace.clear();
+    traceHead = 0;
+  }
+  return static_cast<int>(n);
+}
+
+auto Stats::droppedEvents() const -> int64_t { return dropped.load(); }
+
+auto Stats::name(Stat stat) -> const char * {
+  switch (stat) {
+  case Stat::emulation:
+    return "emulation";
+  case Stat::preprocessing:
+    return "preprocessing";
+  case Stat::compression:
+    return "compression";
+  case Stat::sampling:
+    return "sampling";
+  case Stat::acquire:
+    return "acquire";
+  default:
+    return "unknown";
+  }
+}
+
+auto Stats::now() -> int64_t {
+  return std::chrono::duration_cast<std::chrono::nanoseconds>(
+             std::chrono::steady_clock::now().time_since_epoch())
+      .count();
+}
+} // namespace c2d
@@ -0,0 +1,89 @@
+#ifndef STATS_HPP
+#define STATS_HPP
+#include <array>
+#include <atomic>
+#include <cstdint>
+#include <mutex>
+#include <span>
+#include <vector>
+
+namespace c2d {
+// Hot path sections of the library timed by ScopedTimer
+enum class Stat : int32_t {
+  emulation,     // Game frames of an environment step
+  preprocessing, // Max pooling and downsampling of a frame
+  compression,   // Storing an experience in the replay memory
+  sampling,      // Sampling and decompressing a batch
+  acquire,       // Waiting for a sampled batch
+  count
+};
+constexpr int numStats = static_cast<int>(Stat::count);
+// Durations d of bucket b > 0 satisfy 2^(b-1) <= d < 2^b nanoseconds
+constexpr int histogramBuckets = 40;
+constexpr size_t traceCapacity = size_t{1} << 20;
+
+// A section run by a thread, times are steady clock nanoseconds
+struct TraceEvent {
+  int32_t stat;
+  int32_t thread;
+  int64_t start;
+  int64_t duration;
+};
+
+// Process-wide counts, duration sums and log2 duration histograms of the
+// sections, and optionally a trace of their first traceCapacity runs. Timing
+// is off by default, disabled timers read no clock.
+class Stats {
+public:
+  // Enables timing, and tracing in addition if tracing is set.
+  void enable(bool timing, bool tracing);
+  [[nodiscard]] auto timing() const -> bool {
+    return timingOn.load(std::memory_order_relaxed);
+  }
+  void record(Stat stat, int64_t start, int64_t duration);
+  // Copies counts [numStats], duration sums [numStats] and histograms
+  // [numStats x histogramBuckets], which are zeroed if reset is set.
+  void read(std::span<int64_t> counts, std::span<int64_t> nanos,
+            std::span<int64_t> histograms, bool reset);
+  // Moves up to events.size() of the oldest trace events into events and
+  // returns their number.
+  auto drainTrace(std::span<TraceEvent> events) -> int;
+  // Trace events dropped since the trace was full.
+  [[nodiscard]] auto droppedEvents() const -> int64_t;
+  [[nodiscard]] static auto name(Stat stat) -> const char *;
+  [[nodiscard]] static auto now() -> int64_t;
+
+private:
+  std::atomic<bool> timingOn = false;
+  std::atomic<bool> tracingOn = false;
+  std::array<std::atomic<int64_t>, numStats> counts{};
+  std::array<std::atomic<int64_t>, numStats> nanos{};
+  std::array<std::atomic<int64_t>, numStats * histogramBuckets> histograms{};
+  std::mutex traceMtx;
+  std::vector<TraceEvent> trace;
+  size_t traceHead = 0;
+  std::atomic<int64_t> dropped = 0;
+};
+
+// Statistics of the library
+auto stats() -> Stats &;
+
+// Times the enclosing scope as a run of a section if timing is enabled.
+class ScopedTimer {
+public:
+  explicit ScopedTimer(Stat stat)
+      : stat(stat), start(stats().timing() ? Stats::now() : -1) {}
+  ScopedTimer(const ScopedTimer &) = delete;
+  auto operator=(const ScopedTimer &) -> ScopedTimer & = delete;
+  ~ScopedTimer() {
+    if (start >= 0) {
+      stats().record(stat, start, Stats::now() - start);
+    }
+  }
+
+private:
+  Stat stat;
+  int64_t start;
+};
+} // namespace c2d
+#endif // STATS_HPP
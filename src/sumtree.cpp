@@ -0,0 +1,51 @@
+#include "sumtree.hpp"
+#include <algorithm>
+#include <bit>
+#include <cstddef>
+
+namespace c2d {
+
+SumTree::SumTree(int capacity)
+    : capacity(capacity),
+      leaves(static_cast<int>(std::bit_ceil(static_cast<unsigned>(capacity)))),
+      nodes(2 * static_cast<std::size_t>(leaves), 0.0) {}
+
+void SumTree::set(int idx, double value) {
+  auto i = leaves + idx;
+  nodes[i] = value;
+  // Sums are recomputed from the children, so rounding errors don't build up
+  for (i /= 2; i >= 1; i /= 2) {
+    nodes[i] = nodes[2 * i] + nodes[2 * i + 1];
+  }
+}
+
+auto SumTree::get(int idx) const -> double { return nodes[leaves + idx]; }
+
+auto SumTree::total() const -> double { return nodes[1]; }
+
+auto SumTree::leafValues() const -> std::span<const double> {
+  return {nodes.data() + leaves, static_cast<size_t>(capacity)};
+}
+
+void SumTree::assign(std::span<const double> values) {
+  std::copy(values.begin(), values.end(), nodes.begin() + leaves);
+  for (int i = leaves - 1; i >= 1; i--) {
+    nodes[i] = nodes[2 * i] + nodes[2 * i + 1];
+  }
+}
+
+auto SumTree::find(double mass) const -> int {
+  int i = 1;
+  while (i < leaves) {
+    auto left = 2 * i;
+    // Rounding may leave mass past the total, never descend into empty sums
+    if (mass < nodes[left] || nodes[left + 1] <= 0.0) {
+      i = left;
+    } else {
+      mass -= nodes[left];
+      i = left + 1;
+    }
+  }
+  return i - leaves;
+}
+} // namespace c2d
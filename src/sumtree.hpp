@@ -0,0 +1,32 @@
+#ifndef SUMTREE_HPP
+#define SUMTREE_HPP
+#include <span>
+#include <vector>
+
+namespace c2d {
+
+// Binary tree over non-negative leaf values where every node holds the sum of
+// its children, giving O(log N) updates and prefix sum searches.
+class SumTree {
+public:
+  explicit SumTree(int capacity);
+  // Sets the value of a leaf.
+  void set(int idx, double value);
+  // Value of a leaf.
+  [[nodiscard]] auto get(int idx) const -> double;
+  // Sum of all leaves.
+  [[nodiscard]] auto total() const -> double;
+  // Index of the leaf where the cumulative sum first exceeds mass.
+  [[nodiscard]] auto find(double mass) const -> int;
+  // Values of the first capacity leaves.
+  [[nodiscard]] auto leafValues() const -> std::span<const double>;
+  // Sets all leaves at once in O(N).
+  void assign(std::span<const double> values);
+
+private:
+  int capacity;
+  int leaves;
+  std::vector<double> nodes;
+};
+} // namespace c2d
+#endif // SUMTREE_HPP
@@ -0,0 +1,150 @@
+#include "syntheticsource.hpp"
+#include <algorithm>
+
+namespace c2d {
+
+namespace {
+// Layout in screen pixels, similar to breakout
+constexpr int wallTop = 17;
+constexpr int wallBottom = 25;
+constexpr int wallWidth = 8;
+constexpr int brickTop = 57;
+constexpr int brickHeight = 6;
+constexpr int brickWidth = 8;
+constexpr int paddleY = 189;
+constexpr int paddleHeight = 4;
+constexpr int paddleWidth = 16;
+constexpr int paddleSpeed = 3;
+constexpr int ballWidth = 2;
+constexpr int ballHeight = 4;
+constexpr int groundY = 196;
+constexpr int startLives = 5;
+constexpr pixel_t wallColor = 142;
+constexpr pixel_t paddleColor = 200;
+constexpr std::array<pixel_t, 6> brickColors{82, 98, 110, 122, 134, 146};
+constexpr std::array<reward_t, 6> brickRewards{7, 7, 4, 4, 1, 1};
+} // namespace
+
+SyntheticSource::SyntheticSource(uint64_t seed)
+    : rng(seed), gray(static_cast<size_t>(screenHeight) * screenWidth) {
+  resetGame();
+}
+
+void SyntheticSource::resetGame() {
+  livesLeft = startLives;
+  paddleX = (screenWidth - paddleWidth) / 2;
+  lastAction = 0;
+  fillBricks();
+  serve();
+}
+
+void SyntheticSource::fillBricks() {
+  bricks.fill(true);
+  bricksLeft = brickRows * brickColumns;
+}
+
+void SyntheticSource::serve() {
+  ballX = wallWidth +
+          static_cast<int>(rng.below(screenWidth - 2 * wallWidth - ballWidth));
+  ballY = brickTop + brickRows * brickHeight + 8;
+  ballDx = rng.below(2) == 0 ? -2 : 2;
+  ballDy = 3;
+}
+
+auto SyntheticSource::act(int action) -> reward_t {
+  // Sticky actions as in ALE
+  if (rng.unit() >= repeatActionProbability) {
+    lastAction = action;
+  }
+  if (livesLeft == 0) {
+    return 0;
+  }
+  if (lastAction == 2) {
+    paddleX += paddleSpeed;
+  } else if (lastAction == 3) {
+    paddleX -= paddleSpeed;
+  }
+  paddleX = std::clamp(paddleX, wallWidth,
+                       screenWidth - wallWidth - paddleWidth);
+  ballX += ballDx;
+  ballY += ballDy;
+  if (ballX < wallWidth || ballX > screenWidth - wallWidth - ballWidth) {
+    ballX = std::clamp(ballX, wallWidth,
+                       screenWidth - wallWidth - ballWidth);
+    ballDx = -ballDx;
+  }
+  if (ballY < wallBottom) {
+    ballY = wallBottom;
+    ballDy = -ballDy;
+  }
+  reward_t reward = 0;
+  auto row = (ballY - brickTop) / brickHeight;
+  auto column = (ballX - wallWidth) / brickWidth;
+  if (ballY >= brickTop && row < brickRows) {
+    auto &brick = bricks[row * brickColumns + column];
+    if (brick) {
+      brick = false;
+      reward = brickRewards[row];
+      ballDy = -ballDy;
+      if (--bricksLeft == 0) {
+        fillBricks();
+      }
+    }
+  }
+  if (ballDy > 0 && ballY + ballHeight >= paddleY &&
+      ballY < paddleY + paddleHeight && ballX + ballWidth > paddleX &&
+      ballX < paddleX + paddleWidth) {
+    // The ball leaves towards the paddle side it hit
+    ballDy = -ballDy;
+    ballDx = ballX + ballWidth / 2 < paddleX + paddleWidth / 2 ? -2 : 2;
+  } else if (ballY >= groundY) {
+    if (--livesLeft > 0) {
+      serve();
+    }
+  }
+  return reward;
+}
+
+auto SyntheticSource::lives() -> int { return livesLeft; }
+
+auto SyntheticSource::gameOver() -> bool { return livesLeft == 0; }
+
+void SyntheticSource::grayscale(Frame &screen) {
+  auto fillRect = [&screen](int y, int x, int h, int w, pixel_t color) {
+    for (int r = y; r < y + h; r++) {
+      auto row = screen.begin() + r * screenWidth;
+      std::fill(row + x, row + x + w, color);
+    }
+  };
+  std::fill(screen.begin(), screen.end(), 0);
+  fillRect(wallTop, 0, wallBottom - wallTop, screenWidth, wallColor);
+  fillRect(wallBottom, 0, groundY - wallBottom, wallWidth, wallColor);
+  fillRect(wallBottom, screenWidth - wallWidth, groundY - wallBottom,
+           wallWidth, wallColor);
+  for (int r = 0; r < brickRows; r++) {
+    for (int c = 0; c < brickColumns; c++) {
+      if (bricks[r * brickColumns + c]) {
+        fillRect(brickTop + r * brickHeight, wallWidth + c * brickWidth,
+                 brickHeight, brickWidth, brickColors[r]);
+      }
+    }
+  }
+  fillRect(paddleY, paddleX, paddleHeight, paddleWidth, paddleColor);
+  if (livesLeft > 0 && ballY < groundY) {
+    fillRect(ballY, ballX, ballHeight, ballWidth, paddleColor);
+  }
+}
+
+void SyntheticSource::rgb(std::vector<pixel_t> &screen) {
+  grayscale(gray);
+  for (size_t p = 0; p < gray.size(); p++) {
+    std::fill_n(screen.begin() + 3 * p, 3, gray[p]);
+  }
+}
+
+auto SyntheticSource::height() -> int { return screenHeight; }
+
+auto SyntheticSource::width() -> int { return screenWidth; }
+
+auto SyntheticSource::actionLength() -> int { return 4; }
+} // namespace c2d
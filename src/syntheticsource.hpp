@@ -0,0 +1,48 @@
+#ifndef SYNTHETICSOURCE_HPP
+#define SYNTHETICSOURCE_HPP
+#include "framesource.hpp"
+#include "xoshiro.hpp"
+#include <array>
+
+namespace c2d {
+
+// A breakout-like game generated without ROM, for runs and benchmarks of the
+// replay memory and learner where ALE is unavailable. Screens have the size
+// and flat, sparse content of Atari screens, i.e., they compress and
+// downsample alike. Balls are served in seeded directions and actions are
+// sticky as in ALE. Actions are noop, fire, right and left.
+class SyntheticSource final : public FrameSource {
+public:
+  explicit SyntheticSource(uint64_t seed);
+  auto act(int action) -> reward_t override;
+  [[nodiscard]] auto lives() -> int override;
+  [[nodiscard]] auto gameOver() -> bool override;
+  void resetGame() override;
+  void grayscale(Frame &screen) override;
+  void rgb(std::vector<pixel_t> &screen) override;
+  [[nodiscard]] auto height() -> int override;
+  [[nodiscard]] auto width() -> int override;
+  [[nodiscard]] auto actionLength() -> int override;
+
+private:
+  static constexpr int screenHeight = 210;
+  static constexpr int screenWidth = 160;
+  static constexpr int brickRows = 6;
+  static constexpr int brickColumns = 18;
+  Xoshiro256 rng;
+  std::array<bool, brickRows * brickColumns> bricks{};
+  int bricksLeft = 0;
+  int paddleX = 0;
+  int ballX = 0;
+  int ballY = 0;
+  int ballDx = 0;
+  int ballDy = 0;
+  int livesLeft = 0;
+  int lastAction = 0;
+  // Grayscale screen converted by rgb, such that rgb does not allocate
+  Frame gray;
+  void serve();
+  void fillBricks();
+};
+} // namespace c2d
+#endif // SYNTHETICSOURCE_HPP
@@ -0,0 +1,125 @@
+#include "vecatarienv.hpp"
+#include "common.hpp"
+#include <algorithm>
+#include <opencv2/core/utility.hpp>
+
+namespace c2d {
+
+void VecAtariEnv::initialize(const std::string &game, int numEnvs,
+                             int memSize, int numThreads,
+                             float priorityExponent, uint64_t seed,
+                             CodecConfig codec) {
+  memory = memSize > 0 ? std::make_shared<ReplayBuffer>(
+                             memSize, numEnvs, priorityExponent, seed, codec)
+                       : nullptr;
+  envs.clear();
+  for (int lane = 0; lane < numEnvs; lane++) {
+    envs.push_back(std::make_unique<AtariEnv>());
+    envs.back()->initialize(game, memory, lane, seed);
+  }
+  pendingActions.resize(numEnvs);
+  if (numThreads < 1) {
+    auto cores = static_cast<int>(std::thread::hardware_concurrency());
+    numThreads = std::clamp(cores, 1, numEnvs);
+  }
+  if (numThreads > 1) {
+    // Workers resize frames themselves, nested OpenCV threads only compete
+    cv::setNumThreads(0);
+  }
+  pool = std::make_unique<WorkerPool>(numThreads);
+}
+
+auto VecAtariEnv::size() const -> int { return static_cast<int>(envs.size()); }
+
+auto VecAtariEnv::getActionLength() const -> int {
+  return envs.front()->getActionLength();
+}
+
+void VecAtariEnv::step(std::span<const action_t> actions,
+                       std::span<pixel_t> states, std::span<bool> terminals,
+                       std::span<reward_t> rewards,
+                       std::span<int> episodeSteps,
+                       std::span<reward_t> episodeScores) {
+  stepAsync(actions, states, terminals, rewards, episodeSteps, episodeScores);
+  wait();
+}
+
+void VecAtariEnv::stepAsync(std::span<const action_t> actions,
+                            std::span<pixel_t> states,
+                            std::span<bool> terminals,
+                            std::span<reward_t> rewards,
+                            std::span<int> episodeSteps,
+                            std::span<reward_t> episodeScores) {
+  pool->wait();
+  // Actions are copied since the caller may reuse its buffer while we step
+  std::copy(actions.begin(), actions.end(), pendingActions.begin());
+  pending = {states, terminals, rewards, episodeSteps, episodeScores};
+  pool->dispatch(size(), [this](int i) { stepOne(i); });
+}
+
+void VecAtariEnv::wait() { pool->wait(); }
+
+void VecAtariEnv::stepOne(int i) {
+  auto &env = *envs[i];
+  auto state = pending.states.subspan(i * stateSize, stateSize);
+  pending.rewards[i] = env.act(pendingActions[i], state);
+  pending.terminals[i] = env.gameOver() || env.maxStepReached();
+  if (pending.terminals[i]) {
+    pending.episodeSteps[i] = env.episodeSteps();
+    pending.episodeScores[i] = env.episodeScore();
+  }
+  if (env.done()) {
+    env.softReset();
+  }
+}
+
+void VecAtariEnv::getObs(std::span<pixel_t> states) const {
+  pool->wait();
+  for (int i = 0; i < size(); i++) {
+    envs[i]->getObs(states.subspan(i * stateSize, stateSize));
+  }
+}
+
+void VecAtariEnv::hardReset() {
+  pool->wait();
+  for (auto &env : envs) {
+    env->hardReset();
+  }
+}
+
+void VecAtariEnv::saveMemory(const std::string &path) {
+  pool->wait();
+  memory->save(path);
+}
+
+auto VecAtariEnv::loadMemory(const std::string &path) -> bool {
+  pool->wait();
+  if (!memory->load(path)) {
+    return false;
+  }
+  hardReset();
+  return true;
+}
+
+auto VecAtariEnv::getMemory() const -> ReplayBuffer & { return *memory; }
+
+auto VecAtariEnv::hasMemory() const -> bool { return memory != nullptr; }
+
+void VecAtariEnv::transitions(std::span<action_t> actions,
+                              std::span<reward_t> rewards,
+                              std::span<bool> dones, std::span<bool> stored,
+                              std::span<int> newFrames,
+                              std::span<int> validFrames) {
+  pool->wait();
+  for (int i = 0; i < size(); i++) {
+    const auto &tr = envs[i]->lastTransition();
+    actions[i] = tr.action;
+    rewards[i] = tr.reward;
+    dones[i] = tr.done;
+    stored[i] = tr.stored;
+    newFrames[i] = std::clamp(tr.newFrames, 1, obsStack);
+    validFrames[i] = tr.validFrames;
+  }
+}
+
+} // namespace c2d
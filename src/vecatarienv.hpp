@@ -0,0 +1,79 @@
+#ifndef VECATARIENV_HPP
+#define VECATARIENV_HPP
+#include "atarienv.hpp"
+#include "common.hpp"
+#include "replaybuffer.hpp"
+#include "workerpool.hpp"
+#include <memory>
+
+namespace c2d {
+
+// Holds N Atari environments that write into one shared ReplayBuffer and are
+// stepped together by a vector of actions. Environments are stepped in
+// parallel by a pool of worker threads, each worker doing emulation,
+// preprocessing and compression of its own environments.
+class VecAtariEnv {
+public:
+  // Initializes numEnvs environments with a memory of memSize items in total,
+  // stepped by numThreads workers (0 = one per environment and core). A
+  // positive priority exponent makes the memory prioritized. Without memory
+  // (memSize 0) experiences are read by transitions(). Environments and
+  // memory are seeded by seed, the memory compresses frames by codec.
+  void initialize(const std::string &game, int numEnvs, int memSize,
+                  int numThreads = 0, float priorityExponent = 0.0F,
+                  uint64_t seed = 0, CodecConfig codec = {});
+  // Number of environments.
+  [[nodiscard]] auto size() const -> int;
+  // Returns the size of the minimal action set.
+  [[nodiscard]] auto getActionLength() const -> int;
+  // Steps every environment by its action. Writes the new observations
+  // [N x 4 x 84 x 84], terminal flags, rewards and, for terminal items, the
+  // statistics of the finished episode.
+  void step(std::span<const action_t> actions, std::span<pixel_t> states,
+            std::span<bool> terminals, std::span<reward_t> rewards,
+            std::span<int> episodeSteps, std::span<reward_t> episodeScores);
+  // Starts step() on the workers and returns immediately. The output buffers
+  // must stay alive and untouched until wait() returns.
+  void stepAsync(std::span<const action_t> actions, std::span<pixel_t> states,
+                 std::span<bool> terminals, std::span<reward_t> rewards,
+                 std::span<int> episodeSteps,
+                 std::span<reward_t> episodeScores);
+  // Blocks until an asynchronous step is done.
+  void wait();
+  // Writes all current observation windows [N x 4 x 84 x 84].
+  void getObs(std::span<pixel_t> states) const;
+  // Hard resets every environment.
+  void hardReset();
+  // Writes a snapshot of the memory, see ReplayBuffer::save.
+  void saveMemory(const std::string &path);
+  // Restores a memory snapshot and hard resets the environments, whose
+  // episodes are not part of it. Returns false if there is none at path.
+  [[nodiscard]] auto loadMemory(const std::string &path) -> bool;
+  // Direct access to the shared ReplayBuffer
+  [[nodiscard]] auto getMemory() const -> ReplayBuffer &;
+  [[nodiscard]] auto hasMemory() const -> bool;
+  // Writes the last experience of every environment. New frame counts are
+  // clamped to the observation window.
+  void transitions(std::span<action_t> actions, std::span<reward_t> rewards,
+                   std::span<bool> dones, std::span<bool> stored,
+                   std::span<int> newFrames, std::span<int> validFrames);
+
+private:
+  std::shared_ptr<ReplayBuffer> memory;
+  std::vector<std::unique_ptr<AtariEnv>> envs;
+  std::vector<action_t> pendingActions;
+  // Output buffers of the pending step, a task capturing only this is
+  // dispatched without allocation
+  struct StepBuffers {
+    std::span<pixel_t> states;
+    std::span<bool> terminals;
+    std::span<reward_t> rewards;
+    std::span<int> episodeSteps;
+    std::span<reward_t> episodeScores;
+  };
+  StepBuffers pending;
+  std::unique_ptr<WorkerPool> pool;
+  void stepOne(int i);
+};
+} // namespace c2d
+#endif // VECATARIENV_HPP
@@ -0,0 +1,77 @@
+#include "workerpool.hpp"
+#include <utility>
+
+namespace c2d {
+
+WorkerPool::WorkerPool(int numThreads) {
+  for (int i = 0; i < numThreads; i++) {
+    workers.emplace_back([this](const std::stop_token &st) { work(st); });
+  }
+}
+
+WorkerPool::~WorkerPool() {
+  {
+    std::lock_guard lock(mtx);
+    for (auto &worker : workers) {
+      worker.request_stop();
+    }
+  }
+  workCv.notify_all();
+}
+
+auto WorkerPool::size() const -> int {
+  return static_cast<int>(workers.size());
+}
+
+void WorkerPool::dispatch(int n, std::function<void(int)> task) {
+  {
+    std::unique_lock lock(mtx);
+    doneCv.wait(lock, [this] { return remaining == 0; });
+    currentTask = std::move(task);
+    nextIndex = 0;
+    taskCount = n;
+    remaining = n;
+  }
+  workCv.notify_all();
+}
+
+void WorkerPool::wait() {
+  std::unique_lock lock(mtx);
+  doneCv.wait(lock, [this] { return remaining == 0; });
+  if (error) {
+    std::rethrow_exception(std::exchange(error, nullptr));
+  }
+}
+
+void WorkerPool::run(int n, std::function<void(int)> task) {
+  dispatch(n, std::move(task));
+  wait();
+}
+
+void WorkerPool::work(const std::stop_token &stoken) {
+  std::unique_lock lock(mtx);
+  while (true) {
+    workCv.wait(lock, [&] {
+      return stoken.stop_requested() || nextIndex < taskCount;
+    });
+    if (stoken.stop_requested()) {
+      return;
+    }
+    auto idx = nextIndex++;
+    lock.unlock();
+    try {
+      currentTask(idx);
+    } catch (...) {
+      lock.lock();
+      if (!error) {
+        error = std::current_exception();
+      }
+      lock.unlock();
+    }
+    lock.lock();
+    if (--remaining == 0) {
+      doneCv.notify_all();
+    }
+  }
+}
+} // namespace c2d
@@ -0,0 +1,41 @@
+#ifndef WORKERPOOL_HPP
+#define WORKERPOOL_HPP
+#include <condition_variable>
+#include <exception>
+#include <functional>
+#include <mutex>
+#include <thread>
+#include <vector>
+
+namespace c2d {
+
+// Fixed set of worker threads that run index tasks [0, n) in parallel.
+class WorkerPool {
+public:
+  explicit WorkerPool(int numThreads);
+  WorkerPool(const WorkerPool &) = delete;
+  auto operator=(const WorkerPool &) -> WorkerPool & = delete;
+  ~WorkerPool();
+  // Number of worker threads.
+  [[nodiscard]] auto size() const -> int;
+  // Starts task(i) for every i in [0, n) and returns immediately.
+  void dispatch(int n, std::function<void(int)> task);
+  // Blocks until all dispatched tasks are done, rethrows the first exception.
+  void wait();
+  // Dispatches and waits.
+  void run(int n, std::function<void(int)> task);
+
+private:
+  std::mutex mtx;
+  std::condition_variable workCv;
+  std::condition_variable doneCv;
+  std::function<void(int)> currentTask;
+  int nextIndex = 0;
+  int taskCount = 0;
+  int remaining = 0;
+  std::exception_ptr error;
+  std::vector<std::jthread> workers;
+  void work(const std::stop_token &stoken);
+};
+} // namespace c2d
+#endif // WORKERPOOL_HPP
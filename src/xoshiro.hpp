@@ -0,0 +1,91 @@
+#ifndef XOSHIRO_HPP
+#define XOSHIRO_HPP
+#include <array>
+#include <cstdint>
+#include <istream>
+#include <limits>
+#include <ostream>
+
+namespace c2d {
+
+// Scrambles a 64-bit value, e.g., to derive seeds of lanes from one seed
+constexpr auto splitmix64(uint64_t x) -> uint64_t {
+  x += 0x9e3779b97f4a7c15ULL;
+  x = (x ^ (x >> 30U)) * 0xbf58476d1ce4e5b9ULL;
+  x = (x ^ (x >> 27U)) * 0x94d049bb133111ebULL;
+  return x ^ (x >> 31U);
+}
+
+// The xoshiro256** generator of Blackman and Vigna. Bounded integers and
+// doubles are computed here instead of by std distributions, such that
+// streams of a seed are the same on every standard library.
+class Xoshiro256 {
+public:
+  using result_type = uint64_t;
+
+  explicit Xoshiro256(uint64_t seed = 0) { this->seed(seed); }
+
+  void seed(uint64_t seed) {
+    for (auto &word : state) {
+      seed = splitmix64(seed);
+      word = seed;
+    }
+  }
+
+  auto operator()() -> uint64_t {
+    auto result = rotl(state[1] * 5, 7) * 9;
+    auto t = state[1] << 17U;
+    state[2] ^= state[0];
+    state[3] ^= state[1];
+    state[1] ^= state[2];
+    state[0] ^= state[3];
+    state[2] ^= t;
+    state[3] = rotl(state[3], 45);
+    return result;
+  }
+
+  // Uniform integer in [0, bound) by Lemire's multiply and reject method
+  auto below(uint32_t bound) -> uint32_t {
+    auto m = static_cast<uint64_t>(next32()) * bound;
+    auto low = static_cast<uint32_t>(m);
+    if (low < bound) {
+      const uint32_t threshold = -bound % bound;
+      while (low < threshold) {
+        m = static_cast<uint64_t>(next32()) * bound;
+        low = static_cast<uint32_t>(m);
+      }
+    }
+    return static_cast<uint32_t>(m >> 32U);
+  }
+
+  // Uniform double in [0, 1)
+  auto unit() -> double {
+    return static_cast<double>((*this)() >> 11U) * 0x1.0p-53;
+  }
+
+  static constexpr auto min() -> uint64_t { return 0; }
+  static constexpr auto max() -> uint64_t {
+    return std::numeric_limits<uint64_t>::max();
+  }
+
+  friend auto operator<<(std::ostream &os, const Xoshiro256 &rng)
+      -> std::ostream & {
+    return os << rng.state[0] << ' ' << rng.state[1] << ' ' << rng.state[2]
+              << ' ' << rng.state[3];
+  }
+  friend auto operator>>(std::istream &is, Xoshiro256 &rng)
+      -> std::istream & {
+    return is >> rng.state[0] >> rng.state[1] >> rng.state[2] >>
+           rng.state[3];
+  }
+
+private:
+  std::array<uint64_t, 4> state{};
+
+  static constexpr auto rotl(uint64_t x, int k) -> uint64_t {
+    return (x << k) | (x >> (64 - k));
+  }
+  auto next32() -> uint32_t { return static_cast<uint32_t>((*this)() >> 32U); }
+};
+} // namespace c2d
+#endif // XOSHIRO_HPP
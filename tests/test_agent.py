@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from c2d.agent import make_agent
+from c2d.benchmark import random_batch
+from c2d.configured.hyperparameters import paramdict_single
+
+ACTION_LEN = 6
+
+
+def built_agent(params=None):
+    """ Agent with networks and optimizer slots created, such that weights can be copied between agents """
+    params = params or paramdict_single()
+    agent = make_agent(ACTION_LEN, params)
+    states = random_batch(params["batch size"], ACTION_LEN)[0]
+    agent.qvalues(states)
+    agent.target_estimates(states)
+    agent.build_optimizer()
+    return agent
+
+
+def copy_weights(source, agent):
+    agent.net.set_weights(source.net.get_weights())
+    agent.tnet.set_weights(source.tnet.get_weights())
+
+
+@pytest.mark.parametrize("graph, fused, batches_per_call", [
+    ("train", "train_fused", None),
+    ("train_many", "train_many_fused", 3),
+])
+def test_fused_train_step_matches_graph(graph, fused, batches_per_call):
+    params = paramdict_single()
+    batches = [random_batch(params["batch size"], ACTION_LEN, seed=k) for k in range(batches_per_call or 1)]
+    batch = batches[0] if batches_per_call is None else [np.stack(x) for x in zip(*batches)]
+    reference = built_agent(params)
+    agent = built_agent(params)
+    copy_weights(reference, agent)
+    before = [w.numpy() for w in reference.net.trainable_variables]
+
+    expected = getattr(reference, graph)(*[tf.constant(x) for x in batch])
+    result = getattr(agent, fused)(*[tf.constant(x) for x in batch])
+
+    np.testing.assert_allclose(result[0].numpy(), expected[0].numpy(), rtol=1e-4)
+    np.testing.assert_allclose(result[-1].numpy(), expected[-1].numpy(), rtol=1e-4, atol=1e-6)
+    # Updates are compared rather than weights, which differ by less than the learning rate anyway
+    for w0, w1, w2 in zip(before, reference.net.trainable_variables, agent.net.trainable_variables):
+        np.testing.assert_allclose(w2.numpy() - w0, w1.numpy() - w0, rtol=1e-3, atol=1e-8)
+
+
+@pytest.mark.parametrize("precision, tolerance", [("bfloat16", 5e-2), ("float16", 1e-2)])
+def test_reduced_precision_qvalues_match_float32(precision, tolerance):
+    params = paramdict_single()
+    states = random_batch(params["batch size"], ACTION_LEN)[0]
+    reference = built_agent(params)
+    agent = built_agent(dict(params, precision=precision))
+    agent.net.set_weights(reference.net.get_weights())
+    expected = reference.qvalues(states).numpy()
+    qvalues = agent.qvalues(states).numpy()
+    assert qvalues.dtype == np.float32
+    assert np.max(np.abs(qvalues - expected)) <= tolerance * np.max(np.abs(expected))
+
+
+def test_acting_graphs_are_traced_once():
+    agent = make_agent(ACTION_LEN, paramdict_single())
+    rng = np.random.default_rng(0)
+    for batch_size in (1, 7, 32, 128, 7, 1):
+        for seed in range(3):
+            states = random_batch(batch_size, ACTION_LEN, seed=seed)[0]
+            epsilons = rng.random(batch_size, dtype=np.float32)
+            agent.eps_greedy_action(states, epsilons)
+            agent.eval_action(states)
+            agent.qvalues(states)
+    assert agent.tracing_counts() == {"eps_greedy_action": 1, "eval_action": 1, "qvalues": 1}
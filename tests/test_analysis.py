@@ -0,0 +1,22 @@
+import numpy as np
+
+from c2d.analysis import aggregates, iqm, stratified_bootstrap
+
+
+def test_iqm_matches_trimmed_mean():
+    scores = np.arange(8.0)[::-1]
+    assert iqm(scores) == np.mean(np.arange(2.0, 6.0))
+
+
+def test_aggregates_are_nan_where_a_run_is_missing():
+    # Run of game 1, seed 2 ends after 3 of 5 iterations
+    rng = np.random.default_rng(0)
+    scores = rng.random((3, 4, 5))
+    scores[1, 2, 3:] = np.nan
+    assert np.isnan(iqm(np.array([1.0, 2.0, 3.0, np.nan])))
+    for name, values in aggregates(scores).items():
+        assert np.all(np.isfinite(values[:3])), name
+        assert np.all(np.isnan(values[3:])), name
+    _, intervals = stratified_bootstrap(scores, reps=50)
+    for lower, upper in intervals.values():
+        assert np.all(np.isfinite(lower[:3])) and np.all(np.isfinite(upper[:3]))
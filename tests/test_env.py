@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from c2d.configured.atarienv import AtariEnv, VecAtariEnv, libc2d
+
+counting = pytest.mark.skipif(libc2d.allocationCount() < 0,
+                              reason="needs a library built with -DC2D_COUNT_ALLOCATIONS=ON")
+
+
+@counting
+def test_steps_do_not_allocate_once_memory_is_full():
+    num_envs, warmup, steps = 4, 5000, 1000
+    env = VecAtariEnv("synthetic", num_envs, mem_size=2000)
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, env.actionLength(), size=(warmup + steps, num_envs), dtype=np.uint8)
+    for t in range(warmup):
+        env.stepBatch(actions[t])
+    before = libc2d.allocationCount()
+    for t in range(warmup, warmup + steps):
+        env.stepBatch(actions[t])
+    assert libc2d.allocationCount() - before == 0
+
+
+@counting
+def test_rgb_screens_do_not_allocate():
+    env = AtariEnv("synthetic", 0)
+    env.getRGB()
+    before = libc2d.allocationCount()
+    for _ in range(100):
+        env.getRGB()
+    assert libc2d.allocationCount() - before == 0
+
+
+def test_environments_without_memory_hold_no_replay_bytes():
+    env = VecAtariEnv("synthetic", 2, mem_size=0)
+    env.stepBatch(np.zeros(2, dtype=np.uint8))
+    assert env.residentBytes() == 0
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from c2d.configured.atarienv import ReplayMemory, VecAtariEnv
+
+
+def filled_memory(seed, priority_exponent, steps=5000, action_len=6):
+    """ ReplayMemory of the seed with steps experiences in lane 0, frames are random 4x4 blocks like screens """
+    memory = ReplayMemory(steps, 1, priority_exponent=priority_exponent, seed=seed)
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, size=(steps, 21, 21), dtype=np.uint8).repeat(4, axis=1).repeat(4, axis=2)
+    memory.addFrames(np.zeros(steps), rng.integers(0, action_len, size=steps),
+                     rng.integers(-1, 2, size=steps), np.zeros(steps, dtype=np.bool_), np.ones(steps),
+                     np.minimum(np.arange(1, steps + 1), 4), frames)
+    return memory
+
+
+def sampled(source, batches=10):
+    return [[np.copy(x) for x in source.sampleBatch()] for _ in range(batches)]
+
+
+def assert_same(first, second):
+    for a, b in zip(first, second):
+        for x, y in zip(a, b):
+            np.testing.assert_array_equal(x, y)
+
+
+@pytest.mark.parametrize("priority_exponent", [0.0, 0.6])
+def test_memories_of_a_seed_sample_identical_batches(priority_exponent):
+    first, second, other = (sampled(filled_memory(seed, priority_exponent)) for seed in (0, 0, 1))
+    assert_same(first, second)
+    assert any(not np.array_equal(a[0], c[0]) for a, c in zip(first, other))
+
+
+def test_environments_of_a_seed_step_and_sample_identically():
+    runs = []
+    for seed in (3, 3):
+        env = VecAtariEnv("synthetic", 4, mem_size=2000, seed=seed)
+        rng = np.random.default_rng(0)
+        states = [np.copy(env.stepBatch(rng.integers(0, env.actionLength(), size=4, dtype=np.uint8))[0])
+                  for _ in range(500)]
+        runs.append((states, sampled(env)))
+    (states, batches), (other_states, other_batches) = runs
+    np.testing.assert_array_equal(np.stack(states), np.stack(other_states))
+    assert_same(batches, other_batches)